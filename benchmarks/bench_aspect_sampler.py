@@ -0,0 +1,73 @@
+"""
+Padding overhead and construction time of AspectRatioBatchSampler.
+
+Usage
+-----
+python benchmarks/bench_aspect_sampler.py [--images 200000] [--batch-size 16]
+
+The images get random sizes between 320x240 and 4000x3000 in landscape and portrait
+orientation. The padding overhead (padded pixels / image pixels) of the bucketed
+batches is compared with random batches, with the time to build the buckets and the
+batches of one epoch.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import synthetic
+from index_dataset import IndexDataset
+
+from flextd.flexcoco.samplers import AspectRatioBatchSampler
+
+SIZES = [(240, 320), (480, 640), (720, 1280), (1080, 1920), (3000, 4000)]
+
+
+def make_annotation_dict(num_images: int, seed: int = 0) -> dict:
+    return synthetic.make_annotation_dict(
+        num_images,
+        num_categories=0,
+        instances_per_image=0,
+        image_sizes=SIZES,
+        size_jitter=0.2,
+        portrait_fraction=0.3,
+        seed=seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        annotation_file = os.path.join(tmp_dir, "annotations.json")
+        with open(annotation_file, "w") as f:
+            json.dump(make_annotation_dict(args.images), f)
+        dataset = IndexDataset(image_dir="", annotation_file=annotation_file)
+
+    print(
+        f"{'buckets':>9} {'init [s]':>9} {'epoch [s]':>10} "
+        f"{'bucketed':>9} {'random':>8}"
+    )
+    for aspect, size in ((1, 1), (4, 2), (8, 4), (16, 8)):
+        start = time.perf_counter()
+        sampler = AspectRatioBatchSampler(
+            dataset, args.batch_size, num_aspect_buckets=aspect, num_size_buckets=size
+        )
+        init = time.perf_counter() - start
+        start = time.perf_counter()
+        sampler.batches()
+        epoch = time.perf_counter() - start
+        report = sampler.padding_report()
+        print(
+            f"{aspect:>4}x{size:<4} {init:>9.3f} {epoch:>10.3f} "
+            f"{report['bucketed']:>9.1%} {report['random']:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Microbenchmark of rasterizing category masks for random crops.
+
+Usage
+-----
+python benchmarks/bench_crop.py [--size 2048] [--crop 512] [--instances 50 200]
+
+Compares rasterizing the whole image and cropping the window with rasterize_window,
+which skips the annotations outside of the window and rasterizes only the window.
+"""
+
+import argparse
+
+import numpy as np
+
+from common import best_time
+from synthetic import make_annotations
+
+from flextd.flexcoco.masks import rasterize_category_masks, rasterize_window
+
+
+def full_then_crop(anns, height, width, cat_id2idx, window) -> np.ndarray:
+    top, left, crop_height, crop_width = window
+    masks = rasterize_category_masks(anns, height, width, cat_id2idx)
+    return masks[:, top : top + crop_height, left : left + crop_width]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=2048, help="image height/width")
+    parser.add_argument("--crop", type=int, default=512, help="crop height/width")
+    parser.add_argument(
+        "--instances",
+        type=int,
+        nargs="+",
+        default=[50, 200],
+        help="numbers of instances per image",
+    )
+    parser.add_argument("--categories", type=int, default=80)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cat_id2idx = {i + 1: i for i in range(args.categories)}
+    print(f"{'instances':>10} {'full+crop [ms]':>15} {'window [ms]':>12}")
+    for num_instances in args.instances:
+        anns = make_annotations(
+            rng, args.size, args.size, num_instances, args.categories
+        )
+        top, left = rng.integers(args.size - args.crop + 1, size=2).tolist()
+        window = (top, left, args.crop, args.crop)
+        inputs = (anns, args.size, args.size, cat_id2idx, window)
+        np.testing.assert_array_equal(
+            full_then_crop(*inputs), rasterize_window(*inputs)
+        )
+        full = best_time(full_then_crop, *inputs)
+        cropped = best_time(rasterize_window, *inputs)
+        print(f"{num_instances:>10} {full * 1e3:>15.1f} {cropped * 1e3:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
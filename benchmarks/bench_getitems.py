@@ -0,0 +1,70 @@
+"""
+Benchmark of the batched fetch path of FlexCocoDatasetBaseSS.
+
+Usage
+-----
+python benchmarks/bench_getitems.py [--images 256] [--size 512] [--instances 20]
+
+Writes a synthetic dataset of JPEG images and polygon annotations to a temporary
+directory and reports samples/sec of per-index __getitem__ and of __getitems__ at
+batch sizes 1 to 64.
+"""
+
+import argparse
+import tempfile
+import time
+
+from synthetic import make_dataset
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+
+BATCH_SIZES = (1, 4, 16, 64)
+
+
+def samples_per_second(fetch, num_images: int, batch_size: int) -> float:
+    start = time.perf_counter()
+    for begin in range(0, num_images - batch_size + 1, batch_size):
+        fetch(list(range(begin, begin + batch_size)))
+    elapsed = time.perf_counter() - start
+    return (num_images // batch_size) * batch_size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--size", type=int, default=512, help="image height/width")
+    parser.add_argument("--instances", type=int, default=20, help="per image")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4, help="decode threads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        annotation_file = make_dataset(
+            directory,
+            args.images,
+            image_sizes=((args.size, args.size),),
+            instances_per_image=args.instances,
+            num_categories=args.categories,
+        )
+        dataset = FlexCocoDatasetBaseSS(
+            directory,
+            annotation_file,
+            target_format="uint8",
+            num_decode_threads=args.threads,
+        )
+        # warm up the page cache
+        dataset.__getitems__(list(range(len(dataset))))
+
+        print(f"{'batch':>6} {'__getitem__ [/s]':>17} {'__getitems__ [/s]':>18}")
+        for batch_size in BATCH_SIZES:
+            single = samples_per_second(
+                lambda indices: [dataset[index] for index in indices],
+                len(dataset),
+                batch_size,
+            )
+            batched = samples_per_second(dataset.__getitems__, len(dataset), batch_size)
+            print(f"{batch_size:>6} {single:>17.1f} {batched:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
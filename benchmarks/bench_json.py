@@ -0,0 +1,68 @@
+"""
+Load and dump time of annotation files with each installed json backend.
+
+Usage
+-----
+python benchmarks/bench_json.py [--images 20000] [--instances 10] [--vertices 32]
+
+A synthetic annotation file with polygon segmentations is written, then it is read
+and written with every installed backend of flextd.flexcoco.jsonio, and read as
+typed records without the segmentation with load_annotation_index.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import tempfile
+import time
+
+from synthetic import make_annotation_dict
+
+from flextd.flexcoco import jsonio
+
+
+def timed(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=20_000)
+    parser.add_argument("--instances", type=int, default=10, help="per image")
+    parser.add_argument("--vertices", type=int, default=32, help="per polygon")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        annotation_file = os.path.join(tmp_dir, "annotations.json")
+        with open(annotation_file, "w") as f:
+            json.dump(
+                make_annotation_dict(
+                    args.images,
+                    instances_per_image=args.instances,
+                    num_vertices=args.vertices,
+                ),
+                f,
+            )
+        size = os.path.getsize(annotation_file) / 2**20
+        print(f"{size:.0f} MB, {args.images * args.instances} annotations")
+        print(f"{'backend':>8} {'load [s]':>9} {'dump [s]':>9}")
+        default = jsonio.get_json_backend().name
+        for name in jsonio.BACKEND_NAMES:
+            if name != "json" and importlib.util.find_spec(name) is None:
+                continue
+            jsonio.set_json_backend(name)
+            load_time, annotation_dict = timed(jsonio.load_json, annotation_file)
+            output_file = os.path.join(tmp_dir, "output.json")
+            dump_time, _ = timed(jsonio.dump_json, annotation_dict, output_file)
+            del annotation_dict
+            print(f"{name:>8} {load_time:>9.3f} {dump_time:>9.3f}")
+        jsonio.set_json_backend(default)
+        index_time, _ = timed(jsonio.load_annotation_index, annotation_file)
+        print(f"load_annotation_index: {index_time:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
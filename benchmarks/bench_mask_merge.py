@@ -0,0 +1,62 @@
+"""
+Microbenchmark of category mask rasterization on crowded images.
+
+Usage
+-----
+python benchmarks/bench_mask_merge.py [--size 1024] [--instances 10 50 200] [--categories 80]
+
+Compares decoding every annotation and merging with np.logical_or against merging the
+RLEs of each category and decoding once per category (rasterize_category_masks).
+"""
+
+import argparse
+
+import numpy as np
+from pycocotools import mask as mask_utils
+from common import best_time
+from synthetic import make_annotations
+
+from flextd.flexcoco.masks import ann_to_rle, rasterize_category_masks
+
+
+def decode_and_or(anns, height, width, cat_id2idx) -> np.ndarray:
+    """decode every annotation and merge with np.logical_or"""
+    masks = np.zeros(shape=(len(cat_id2idx), height, width), dtype=bool)
+    for ann in anns:
+        index_of_cat = cat_id2idx[ann["category_id"]]
+        category_mask = mask_utils.decode(ann_to_rle(ann, height, width))
+        masks[index_of_cat] = np.logical_or(masks[index_of_cat], category_mask)
+    return masks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="image height/width")
+    parser.add_argument(
+        "--instances",
+        type=int,
+        nargs="+",
+        default=[10, 50, 200],
+        help="numbers of instances per image",
+    )
+    parser.add_argument("--categories", type=int, default=80)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cat_id2idx = {i + 1: i for i in range(args.categories)}
+    print(f"{'instances':>10} {'decode+or [ms]':>15} {'rle merge [ms]':>15}")
+    for num_instances in args.instances:
+        anns = make_annotations(
+            rng, args.size, args.size, num_instances, args.categories
+        )
+        inputs = (anns, args.size, args.size, cat_id2idx)
+        np.testing.assert_array_equal(
+            decode_and_or(*inputs), rasterize_category_masks(*inputs)
+        )
+        legacy = best_time(decode_and_or, *inputs)
+        merged = best_time(rasterize_category_masks, *inputs)
+        print(f"{num_instances:>10} {legacy * 1e3:>15.1f} {merged * 1e3:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark of sending the masks of FlexCocoDatasetBaseSS from DataLoader workers.
+
+Usage
+-----
+python benchmarks/bench_mask_transport.py [--images 64] [--size 512] [--workers 2]
+
+For each target format, the pickled bytes of the masks of a batch (what a worker sends
+to the main process) are reported with the loading time of an epoch, where the workers
+collate with `dense=False` and the main process expands the masks with `expand_masks`.
+"""
+
+import argparse
+import pickle
+import tempfile
+import time
+
+import torch
+
+from synthetic import make_dataset
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--size", type=int, default=512, help="image height/width")
+    parser.add_argument("--instances", type=int, default=20, help="per image")
+    parser.add_argument("--categories", type=int, default=80)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--device", default="cpu", help="device to expand the masks on")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as image_dir:
+        annotation_file = make_dataset(
+            image_dir,
+            args.images,
+            image_sizes=((args.size, args.size),),
+            instances_per_image=args.instances,
+            num_categories=args.categories,
+        )
+        print(f"{'format':>9} {'bytes/batch':>12} {'epoch [s]':>10}")
+        for target_format in ("dense", "bool", "packed", "rle"):
+            dataset = FlexCocoDatasetBaseSS(
+                image_dir, annotation_file, target_format=target_format
+            )
+            collate_fn = dataset.get_collate_fn(dense=False)
+            _, target = collate_fn(dataset.__getitems__(list(range(args.batch_size))))
+            num_bytes = len(pickle.dumps(target["masks"]))
+            loader = torch.utils.data.DataLoader(
+                dataset,
+                batch_size=args.batch_size,
+                num_workers=args.workers,
+                collate_fn=collate_fn,
+            )
+            start = time.perf_counter()
+            for _, target in loader:
+                dataset.expand_masks(target, device=args.device)
+            elapsed = time.perf_counter() - start
+            print(f"{target_format:>9} {num_bytes:>12} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
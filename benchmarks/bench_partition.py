@@ -0,0 +1,76 @@
+"""
+Per-rank startup time and memory of FlexCocoDatasetBase with rank-partitioned loading.
+
+Usage
+-----
+python benchmarks/bench_partition.py [--size 1000000] [--world-sizes 1 2 4 8]
+
+Each rank is started in a fresh process. The time to construct rank 0 of each world
+size is reported with the peak RSS of the process and the RSS after construction, from
+a json annotation file and from an annotation store.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from common import read_status
+from index_dataset import IndexDataset
+from synthetic import make_sized_annotation_dict
+
+from flextd.flexcoco.store import convert_to_annotation_store
+
+
+def construct(annotation_file: str, world_size: int, queue):
+    start = time.perf_counter()
+    dataset = IndexDataset(
+        image_dir="", annotation_file=annotation_file, rank=0, world_size=world_size
+    )
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, read_status("VmHWM"), read_status("VmRSS"), len(dataset)))
+
+
+def measure(annotation_file: str, world_size: int) -> tuple:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=construct, args=(annotation_file, world_size, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="annotations")
+    parser.add_argument("--world-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        annotation_file = os.path.join(tmp_dir, "annotations.json")
+        with open(annotation_file, "w") as f:
+            json.dump(make_sized_annotation_dict(args.size), f)
+        store_dir = convert_to_annotation_store(
+            annotation_file, os.path.join(tmp_dir, "store")
+        )
+
+        print(
+            f"{'source':>6} {'world':>6} {'images':>8} {'time [s]':>9} "
+            f"{'peak [MB]':>10} {'rss [MB]':>9}"
+        )
+        for source, path in (("json", annotation_file), ("store", store_dir)):
+            for world_size in args.world_sizes:
+                elapsed, peak, rss, num_images = measure(path, world_size)
+                print(
+                    f"{source:>6} {world_size:>6} {num_images:>8} {elapsed:>9.3f} "
+                    f"{peak:>10.0f} {rss:>9.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
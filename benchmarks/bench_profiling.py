@@ -0,0 +1,66 @@
+"""
+Overhead and output of the stage profiler of FlexCocoDatasetBaseSS.
+
+Usage
+-----
+python benchmarks/bench_profiling.py [--images 256] [--size 512] [--workers 2]
+
+Iterates a DataLoader over a synthetic dataset with and without a StageProfiler,
+reports the samples/sec of both and prints the per-stage summary merged across the
+DataLoader workers.
+"""
+
+import argparse
+import tempfile
+import time
+
+import torch
+from synthetic import make_dataset
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+from flextd.flexcoco.profiling import StageProfiler
+
+
+def samples_per_second(dataset, batch_size: int, num_workers: int) -> float:
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, num_workers=num_workers, collate_fn=list
+    )
+    start = time.perf_counter()
+    num_samples = sum(len(batch) for batch in loader)
+    return num_samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--size", type=int, default=512, help="image height/width")
+    parser.add_argument("--instances", type=int, default=20, help="per image")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        annotation_file = make_dataset(
+            directory,
+            args.images,
+            image_sizes=((args.size, args.size),),
+            instances_per_image=args.instances,
+            num_categories=args.categories,
+        )
+        dataset = FlexCocoDatasetBaseSS(directory, annotation_file)
+        # warm up the page cache
+        samples_per_second(dataset, args.batch_size, 0)
+        disabled = samples_per_second(dataset, args.batch_size, args.workers)
+        profiler = StageProfiler()
+        dataset.profiler = profiler
+        enabled = samples_per_second(dataset, args.batch_size, args.workers)
+
+    print(f"without profiler: {disabled:8.1f} samples/s")
+    print(f"with profiler:    {enabled:8.1f} samples/s")
+    print()
+    print(profiler.summary())
+
+
+if __name__ == "__main__":
+    main()
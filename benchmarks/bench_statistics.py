@@ -0,0 +1,83 @@
+"""
+Benchmark of the category statistics of FlexCocoDatasetBase.
+
+Usage
+-----
+python benchmarks/bench_statistics.py [--annotations 1000000] [--categories 1203]
+
+Times the per-category index queries used by get_statistics before (getImgIds and
+loadCats for each category) against the single pass of get_dataset_statistics, with a
+COCO object and with an annotation store, and get_annotation_file_statistics that reads
+the annotation file without a dataset.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from index_dataset import IndexDataset
+from synthetic import make_annotation_dict
+
+from flextd.flexcoco.statistics import get_annotation_file_statistics
+from flextd.flexcoco.store import convert_to_annotation_store
+
+
+def per_category_statistics(coco) -> dict:
+    cat_stat = {}
+    for cat_id in coco.getCatIds():
+        images = coco.getImgIds(catIds=cat_id)
+        categories = coco.loadCats(ids=[cat_id])
+        cat_stat[categories[0]["name"]] = len(images)
+    return cat_stat
+
+
+def timed(function, *args, **kwargs) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--annotations", type=int, default=1_000_000)
+    parser.add_argument("--categories", type=int, default=1203, help="LVIS has 1203")
+    args = parser.parse_args()
+
+    annotation_dict = make_annotation_dict(
+        max(1, args.annotations // 10),
+        num_categories=args.categories,
+        num_vertices=0,
+        crowd_fraction=0.01,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        annotation_file = os.path.join(tmp_dir, "annotations.json")
+        with open(annotation_file, "w") as f:
+            json.dump(annotation_dict, f)
+        store_dir = convert_to_annotation_store(
+            annotation_file, os.path.join(tmp_dir, "store")
+        )
+        print(
+            f"{'source':>6} {'per category [s]':>17} {'get_statistics [s]':>19} "
+            f"{'single pass [s]':>16}"
+        )
+        for source, path in (("json", annotation_file), ("store", store_dir)):
+            dataset = IndexDataset(image_dir="", annotation_file=path)
+            before, expected = timed(per_category_statistics, dataset.coco)
+            counts, image_counts = timed(dataset.get_statistics)
+            after, statistics = timed(dataset.get_dataset_statistics)
+            assert image_counts == statistics.image_counts_by_name() == expected
+            print(f"{source:>6} {before:>17.3f} {counts:>19.3f} {after:>16.3f}")
+
+        from_file, _ = timed(get_annotation_file_statistics, annotation_file)
+        streaming, _ = timed(
+            get_annotation_file_statistics, annotation_file, streaming=True
+        )
+    print(f"get_annotation_file_statistics: {from_file:.3f} s including parsing")
+    print(f"  streaming:                     {streaming:.3f} s including parsing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Startup time of FlexCocoDatasetBase from an annotation file and from an annotation store.
+
+Usage
+-----
+python benchmarks/bench_store_startup.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from index_dataset import IndexDataset
+from synthetic import make_sized_annotation_dict
+
+from flextd.flexcoco.store import convert_to_annotation_store
+
+
+def startup_time(annotation_file: str) -> float:
+    start = time.perf_counter()
+    IndexDataset(image_dir="", annotation_file=annotation_file)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="numbers of annotations to benchmark",
+    )
+    args = parser.parse_args()
+
+    print(f"{'annotations':>12} {'json [s]':>9} {'convert [s]':>12} {'store [s]':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            annotation_file = os.path.join(tmp_dir, f"{size}.json")
+            with open(annotation_file, "w") as f:
+                json.dump(make_sized_annotation_dict(size), f)
+            store_dir = os.path.join(tmp_dir, f"{size}_store")
+
+            json_time = startup_time(annotation_file)
+            start = time.perf_counter()
+            convert_to_annotation_store(annotation_file, store_dir)
+            convert_time = time.perf_counter() - start
+            store_time = startup_time(store_dir)
+            print(
+                f"{size:>12} {json_time:>9.3f} {convert_time:>12.3f} {store_time:>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
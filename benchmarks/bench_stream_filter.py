@@ -0,0 +1,85 @@
+"""
+Peak memory of the in-memory and streaming annotation filters.
+
+Usage
+-----
+python benchmarks/bench_stream_filter.py [--sizes 10000 100000 1000000]
+
+A synthetic annotation file is written for each size, and create_filtered_annotation_file
+is run in a fresh process with and without streaming so that the peak RSS of each mode
+can be compared.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from synthetic import make_filters, make_sized_annotation_dict
+
+CHILD = """
+import json, sys, time
+from flextd.flexcoco.utils import create_filtered_annotation_file
+src, dst, streaming = sys.argv[1], sys.argv[2], sys.argv[3] == "1"
+with open(sys.argv[4]) as f:
+    filters = json.load(f)
+start = time.perf_counter()
+create_filtered_annotation_file(src, dst, streaming=streaming, **filters)
+elapsed = time.perf_counter() - start
+# VmHWM is reset by exec, unlike ru_maxrss which keeps the peak of the forking parent
+with open("/proc/self/status") as f:
+    peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+print(json.dumps({"seconds": elapsed, "max_rss_kb": peak}))
+"""
+
+
+def run(src: str, dst: str, streaming: bool, filter_file: str) -> dict:
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD, src, dst, "1" if streaming else "0", filter_file]
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="numbers of annotations to benchmark",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'annotations':>12} {'file [MB]':>10} "
+        f"{'load RSS [MB]':>14} {'stream RSS [MB]':>16} "
+        f"{'load [s]':>9} {'stream [s]':>11}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            annotation_dict = make_sized_annotation_dict(size)
+            filters = make_filters(annotation_dict)
+            src = os.path.join(tmp_dir, f"{size}.json")
+            with open(src, "w") as f:
+                json.dump(annotation_dict, f)
+            del annotation_dict
+            filter_file = os.path.join(tmp_dir, f"{size}_filters.json")
+            with open(filter_file, "w") as f:
+                json.dump(filters, f)
+
+            dst = os.path.join(tmp_dir, f"{size}_filtered.json")
+            loaded = run(src, dst, False, filter_file)
+            streamed = run(src, dst, True, filter_file)
+            print(
+                f"{size:>12} {os.path.getsize(src) / 2**20:>10.1f} "
+                f"{loaded['max_rss_kb'] / 1024:>14.1f} "
+                f"{streamed['max_rss_kb'] / 1024:>16.1f} "
+                f"{loaded['seconds']:>9.2f} {streamed['seconds']:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
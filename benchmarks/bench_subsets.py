@@ -0,0 +1,85 @@
+"""
+Benchmark of creating several annotation files from one annotation file.
+
+Usage
+-----
+python benchmarks/bench_subsets.py [--size 1000000] [--subsets 4] [--workers 4]
+
+Creates one category-filtered file per subset by calling create_filtered_annotation_file
+for each subset, which parses the source file every time, and with one call of
+create_subset_annotation_files, which parses it once and writes the files concurrently.
+The time of a stratified 5-fold split (10 files) is also reported.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from synthetic import DEFAULT_NUM_CATEGORIES, make_sized_annotation_dict
+
+from flextd.flexcoco.splits import (
+    SubsetSpec,
+    create_subset_annotation_files,
+    k_fold_specs,
+)
+from flextd.flexcoco.utils import create_filtered_annotation_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="annotations")
+    parser.add_argument("--subsets", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        annotation_file = os.path.join(tmp_dir, "annotations.json")
+        with open(annotation_file, "w") as f:
+            json.dump(make_sized_annotation_dict(args.size), f)
+        # each subset keeps a different half of the categories
+        category_lists = [
+            [
+                f"category{(i + j) % DEFAULT_NUM_CATEGORIES + 1}"
+                for j in range(DEFAULT_NUM_CATEGORIES // 2)
+            ]
+            for i in range(args.subsets)
+        ]
+
+        start = time.perf_counter()
+        for i, categories in enumerate(category_lists):
+            create_filtered_annotation_file(
+                annotation_file,
+                os.path.join(tmp_dir, f"separate_{i}.json"),
+                include_categories=categories,
+            )
+        separate = time.perf_counter() - start
+
+        subsets = [
+            SubsetSpec(
+                os.path.join(tmp_dir, f"subset_{i}.json"), include_categories=categories
+            )
+            for i, categories in enumerate(category_lists)
+        ]
+        start = time.perf_counter()
+        create_subset_annotation_files(annotation_file, subsets, args.workers)
+        one_parse = time.perf_counter() - start
+
+        folds = k_fold_specs(
+            5,
+            os.path.join(tmp_dir, "train_{fold}.json"),
+            os.path.join(tmp_dir, "val_{fold}.json"),
+            stratify=True,
+        )
+        start = time.perf_counter()
+        create_subset_annotation_files(annotation_file, folds, args.workers)
+        k_fold = time.perf_counter() - start
+
+    print(f"{args.subsets} filtered files, one parse each: {separate:8.3f} s")
+    print(f"{args.subsets} filtered files, one parse:      {one_parse:8.3f} s")
+    print(f"stratified 5-fold split (10 files):   {k_fold:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
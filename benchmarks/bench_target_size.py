@@ -0,0 +1,83 @@
+"""
+Benchmark of producing FlexCocoDatasetBaseSS samples at a target size.
+
+Usage
+-----
+python benchmarks/bench_target_size.py [--images 32] [--size 2048] [--target 512]
+
+Compares decoding full-resolution images and masks followed by Resize transforms with
+the target_size option, which scales the polygons before rasterization and decodes
+JPEG images at a reduced size.
+"""
+
+import argparse
+import tempfile
+import time
+
+import torch
+from torchvision import transforms
+
+from synthetic import make_dataset
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+
+
+def measure(dataset) -> tuple[float, int]:
+    """get the time per sample and the bytes of the masks of a sample."""
+    start = time.perf_counter()
+    for index in range(len(dataset)):
+        _, target = dataset[index]
+    elapsed = time.perf_counter() - start
+    masks = dataset._load_masks([0], [dataset.get_annotations(0)])[0]
+    return elapsed / len(dataset), masks.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--size", type=int, default=2048, help="source height/width")
+    parser.add_argument("--target", type=int, default=512, help="target height/width")
+    parser.add_argument("--instances", type=int, default=20, help="per image")
+    parser.add_argument("--categories", type=int, default=20)
+    args = parser.parse_args()
+
+    target_size = (args.target, args.target)
+    with tempfile.TemporaryDirectory() as directory:
+        annotation_file = make_dataset(
+            directory,
+            args.images,
+            image_sizes=((args.size, args.size),),
+            instances_per_image=args.instances,
+            num_categories=args.categories,
+        )
+        resize = transforms.Resize(target_size, antialias=True)
+        nearest = transforms.Resize(
+            target_size, interpolation=transforms.InterpolationMode.NEAREST
+        )
+        datasets = {
+            "Resize transforms": FlexCocoDatasetBaseSS(
+                directory,
+                annotation_file,
+                data_transforms=resize,
+                label_transforms=lambda masks: nearest(masks),
+                target_format="uint8",
+            ),
+            "target_size": FlexCocoDatasetBaseSS(
+                directory,
+                annotation_file,
+                target_size=target_size,
+                target_format="uint8",
+            ),
+        }
+        # warm up the page cache
+        datasets["target_size"][0]
+
+        print(f"{'':>18} {'ms/sample':>10} {'mask MB':>8}")
+        for name, dataset in datasets.items():
+            seconds, mask_bytes = measure(dataset)
+            print(f"{name:>18} {seconds * 1e3:>10.1f} {mask_bytes / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+    main()
@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Nothing of flextd is imported here, so importing this module does not change the
+memory or the import time that a benchmark measures.
+"""
+
+import time
+
+
+def read_status(key: str) -> float:
+    """read a memory value of /proc/self/status in MB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(key):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def best_time(function, *args, repeat: int = 5) -> float:
+    """best wall time of repeated calls."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
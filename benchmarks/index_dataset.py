@@ -0,0 +1,13 @@
+"""
+FlexCocoDatasetBase without samples, to time and measure building the annotation index.
+
+It imports torch through FlexCocoDatasetBase, so benchmarks that measure memory
+import it only in the processes that construct a dataset.
+"""
+
+from flextd.flexcoco.coco_base import FlexCocoDatasetBase
+
+
+class IndexDataset(FlexCocoDatasetBase):
+    def __len__(self):
+        return len(self.ids)
@@ -0,0 +1,344 @@
+"""
+Benchmark suite of the main stages of flextd on a synthetic COCO dataset.
+
+Usage
+-----
+python benchmarks/suite.py [--images 20000] [--output results.json]
+python benchmarks/suite.py --compare baseline.json [--threshold 0.2]
+
+A deterministic dataset is generated by `synthetic.make_dataset`, then every stage
+runs in a fresh process so that the peak RSS of one stage does not hide the next one.
+For each stage the wall time, the number of items (annotations or samples), the items
+per second and the peak RSS of the process are reported. Only the timed part of a
+stage counts toward its wall time, but the peak RSS includes its setup. Only the
+stages that build a dataset import torch, so the other stages measure flextd alone.
+
+With --output the results are written as json together with the configuration, the
+version, the git commit and the platform. With --compare the results are compared
+with a previous json file, and the exit status is 1 when a stage is slower or uses
+more memory than the baseline by more than the threshold.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+import synthetic
+from common import read_status
+
+from flextd.flexcoco.statistics import get_annotation_file_statistics
+from flextd.flexcoco.store import convert_to_annotation_store
+from flextd.flexcoco.utils import filter_dataset
+
+
+def _category_names(annotation_file: str) -> list[str]:
+    with open(annotation_file) as f:
+        return [category["name"] for category in json.load(f)["categories"]]
+
+
+def stage_generate(paths: dict, config: dict):
+    def run():
+        synthetic.make_dataset(
+            paths["image_dir"],
+            config["images"],
+            num_image_files=config["image_files"],
+            num_categories=config["categories"],
+            instances_per_image=config["instances"],
+            num_vertices=config["vertices"],
+            image_sizes=((config["image_size"], config["image_size"]),),
+        )
+        return config["images"] * config["instances"]
+
+    return run
+
+
+def stage_filter_dataset(paths: dict, config: dict):
+    names = _category_names(paths["annotation_file"])
+
+    def run():
+        annotation_dict = filter_dataset(
+            paths["annotation_file"],
+            include_categories=names[: len(names) // 2],
+            exclude_categories=names[::5],
+        )
+        return len(annotation_dict["annotations"])
+
+    return run
+
+
+def stage_dataset_init(paths: dict, config: dict):
+    from index_dataset import IndexDataset
+
+    def run():
+        dataset = IndexDataset(paths["image_dir"], paths["annotation_file"])
+        return len(dataset)
+
+    return run
+
+
+def stage_store_convert(paths: dict, config: dict):
+    store_dir = tempfile.mkdtemp(dir=paths["work_dir"])
+
+    def run():
+        convert_to_annotation_store(paths["annotation_file"], store_dir)
+        return config["images"] * config["instances"]
+
+    return run
+
+
+def stage_dataset_init_store(paths: dict, config: dict):
+    if not os.path.isdir(paths["store_dir"]):
+        convert_to_annotation_store(paths["annotation_file"], paths["store_dir"])
+    from index_dataset import IndexDataset
+
+    def run():
+        dataset = IndexDataset(paths["image_dir"], paths["store_dir"])
+        return len(dataset)
+
+    return run
+
+
+def stage_get_statistics(paths: dict, config: dict):
+    from index_dataset import IndexDataset
+
+    dataset = IndexDataset(paths["image_dir"], paths["annotation_file"])
+
+    def run():
+        dataset.get_statistics()
+        return len(dataset)
+
+    return run
+
+
+def stage_file_statistics(paths: dict, config: dict):
+    def run():
+        get_annotation_file_statistics(paths["annotation_file"])
+        return config["images"] * config["instances"]
+
+    return run
+
+
+def _image_dataset(paths: dict, config: dict):
+    """dataset of the images that have an image file."""
+    from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+
+    with open(paths["annotation_file"]) as f:
+        images = json.load(f)["images"][: config["image_files"]]
+    return FlexCocoDatasetBaseSS(
+        paths["image_dir"],
+        paths["annotation_file"],
+        include_files=[image["file_name"] for image in images],
+        target_format="uint8",
+    )
+
+
+def stage_getitem(paths: dict, config: dict):
+    dataset = _image_dataset(paths, config)
+
+    def run():
+        for index in range(len(dataset)):
+            dataset[index]
+        return len(dataset)
+
+    return run
+
+
+def stage_getitems(paths: dict, config: dict):
+    dataset = _image_dataset(paths, config)
+    batch_size = config["batch_size"]
+
+    def run():
+        for begin in range(0, len(dataset), batch_size):
+            dataset.__getitems__(
+                list(range(begin, min(begin + batch_size, len(dataset))))
+            )
+        return len(dataset)
+
+    return run
+
+
+STAGES = {
+    "generate": stage_generate,
+    "filter_dataset": stage_filter_dataset,
+    "dataset_init": stage_dataset_init,
+    "store_convert": stage_store_convert,
+    "dataset_init_store": stage_dataset_init_store,
+    "get_statistics": stage_get_statistics,
+    "file_statistics": stage_file_statistics,
+    "getitem": stage_getitem,
+    "getitems": stage_getitems,
+}
+
+
+def run_stage(name: str, paths: dict, config: dict, queue):
+    """run one stage in the current process and put its measurements on the queue."""
+    run = STAGES[name](paths, config)
+    start = time.perf_counter()
+    items = run()
+    seconds = time.perf_counter() - start
+    queue.put(
+        {
+            "seconds": seconds,
+            "items": items,
+            "items_per_second": items / seconds if seconds > 0 else None,
+            "peak_rss_mb": read_status("VmHWM"),
+        }
+    )
+
+
+def measure(name: str, paths: dict, config: dict, repeat: int) -> dict:
+    """run a stage in fresh processes and keep the fastest run."""
+    context = multiprocessing.get_context("spawn")
+    best = None
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=run_stage, args=(name, paths, config, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"stage {name} failed with exit code {process.exitcode}")
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_metadata(config: dict) -> dict:
+    try:
+        version = metadata.version("flextd")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "flextd_version": version,
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    print the ratios of the results to a baseline and get the regressions.
+
+    Parameters
+    ----------
+    results: dict
+        results of each stage
+    baseline: dict
+        results of each stage of the baseline
+    threshold: float
+        allowed relative increase of the wall time and the peak RSS
+
+    Returns
+    -------
+    regressions: list[str]
+        description of each regression
+    """
+    regressions = []
+    print(f"{'stage':>20} {'time ratio':>11} {'rss ratio':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        time_ratio = result["seconds"] / max(baseline[name]["seconds"], 1e-9)
+        rss_ratio = result["peak_rss_mb"] / max(baseline[name]["peak_rss_mb"], 1e-9)
+        print(f"{name:>20} {time_ratio:>11.2f} {rss_ratio:>10.2f}")
+        if time_ratio > 1 + threshold:
+            regressions.append(f"{name}: {time_ratio:.2f}x wall time")
+        if rss_ratio > 1 + threshold:
+            regressions.append(f"{name}: {rss_ratio:.2f}x peak RSS")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=20_000)
+    parser.add_argument("--categories", type=int, default=80)
+    parser.add_argument("--instances", type=int, default=10, help="per image")
+    parser.add_argument("--vertices", type=int, default=16, help="per polygon")
+    parser.add_argument("--image-size", type=int, default=512, help="height/width")
+    parser.add_argument(
+        "--image-files", type=int, default=256, help="images with a file, for getitem"
+    )
+    parser.add_argument("--batch-size", type=int, default=16, help="for getitems")
+    parser.add_argument(
+        "--stages", nargs="+", choices=list(STAGES)[1:], default=list(STAGES)[1:]
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="fastest of n runs")
+    parser.add_argument("--output", help="json file of the results")
+    parser.add_argument("--compare", help="json file of baseline results")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed relative regression"
+    )
+    args = parser.parse_args()
+    config = {
+        "images": args.images,
+        "categories": args.categories,
+        "instances": args.instances,
+        "vertices": args.vertices,
+        "image_size": args.image_size,
+        "image_files": min(args.image_files, args.images),
+        "batch_size": args.batch_size,
+    }
+
+    results = {}
+    print(
+        f"{'stage':>20} {'time [s]':>9} {'items':>9} {'items/s':>10} {'peak RSS':>10}"
+    )
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = {
+            "work_dir": work_dir,
+            "image_dir": work_dir,
+            "annotation_file": os.path.join(work_dir, "annotations.json"),
+            "store_dir": os.path.join(work_dir, "store"),
+        }
+        # the dataset is generated once, the other stages are repeated
+        for name in ["generate", *args.stages]:
+            result = measure(
+                name, paths, config, 1 if name == "generate" else args.repeat
+            )
+            results[name] = result
+            print(
+                f"{name:>20} {result['seconds']:>9.3f} {result['items']:>9} "
+                f"{result['items_per_second'] or 0:>10.0f} "
+                f"{result['peak_rss_mb']:>7.0f} MB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"metadata": get_metadata(config), "results": results}, f, indent=2
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
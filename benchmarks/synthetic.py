@@ -0,0 +1,292 @@
+"""
+Deterministic synthetic COCO datasets for the benchmarks.
+
+The same arguments always generate the same annotations and image files. Instances are
+star-shaped polygons (sorted random angles around a center) clipped to the image, with
+their bbox and area computed from the vertices, so the annotations can be rasterized,
+cropped and filtered like real ones. The annotations of all images are generated with
+array operations, so millions of annotations take seconds.
+"""
+
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_IMAGE_SIZES = ((480, 640),)
+DEFAULT_NUM_CATEGORIES = 80
+
+
+def _make_instances(
+    rng: np.random.Generator,
+    heights: np.ndarray,
+    widths: np.ndarray,
+    num_categories: int,
+    num_vertices: int,
+    crowd_fraction: float,
+) -> list[dict]:
+    """generate one instance per (height, width), without ids."""
+    num_instances = len(heights)
+    heights = np.asarray(heights, dtype=np.float64)
+    widths = np.asarray(widths, dtype=np.float64)
+    center_x = rng.random(num_instances) * widths
+    center_y = rng.random(num_instances) * heights
+    radius = np.minimum(heights, widths) * (0.02 + 0.15 * rng.random(num_instances))
+    category_ids = rng.integers(1, num_categories + 1, num_instances)
+    iscrowd = (rng.random(num_instances) < crowd_fraction).astype(np.int64)
+    if num_vertices > 0:
+        angles = np.sort(rng.random((num_instances, num_vertices)), axis=1) * 2 * np.pi
+        xs = np.clip(center_x[:, None] + radius[:, None] * np.cos(angles), 0, None)
+        ys = np.clip(center_y[:, None] + radius[:, None] * np.sin(angles), 0, None)
+        xs = np.minimum(xs, widths[:, None]).round(2)
+        ys = np.minimum(ys, heights[:, None]).round(2)
+        low_x, high_x = xs.min(axis=1), xs.max(axis=1)
+        low_y, high_y = ys.min(axis=1), ys.max(axis=1)
+        # shoelace formula
+        area = 0.5 * np.abs(
+            (xs * np.roll(ys, -1, axis=1) - np.roll(xs, -1, axis=1) * ys).sum(axis=1)
+        )
+        polygons = np.stack([xs, ys], axis=2).reshape(num_instances, 2 * num_vertices)
+        polygons = polygons.tolist()
+    else:
+        low_x = np.maximum(center_x - radius, 0)
+        high_x = np.minimum(center_x + radius, widths)
+        low_y = np.maximum(center_y - radius, 0)
+        high_y = np.minimum(center_y + radius, heights)
+        area = np.pi * radius**2
+        polygons = None
+    bboxes = np.stack([low_x, low_y, high_x - low_x, high_y - low_y], axis=1)
+    instances = [
+        {
+            "category_id": category_id,
+            "area": instance_area,
+            "bbox": bbox,
+            "iscrowd": crowd,
+        }
+        for category_id, instance_area, bbox, crowd in zip(
+            category_ids.tolist(),
+            area.round(2).tolist(),
+            bboxes.round(2).tolist(),
+            iscrowd.tolist(),
+        )
+    ]
+    if polygons is not None:
+        for instance, polygon in zip(instances, polygons):
+            instance["segmentation"] = [polygon]
+    return instances
+
+
+def make_annotations(
+    rng: np.random.Generator,
+    height: int,
+    width: int,
+    num_instances: int,
+    num_categories: int,
+    num_vertices: int = 32,
+) -> list[dict]:
+    """
+    generate the annotations of one image.
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+        random generator
+    height: int
+        height of the image
+    width: int
+        width of the image
+    num_instances: int
+        number of annotations
+    num_categories: int
+        categories have the ids 1 to num_categories
+    num_vertices: int
+        number of vertices of each polygon
+
+    Returns
+    -------
+    anns: list[dict]
+        COCO annotations with the ids 0 to num_instances - 1
+    """
+    instances = _make_instances(
+        rng,
+        np.full(num_instances, height),
+        np.full(num_instances, width),
+        num_categories,
+        num_vertices,
+        crowd_fraction=0.0,
+    )
+    for ann_id, instance in enumerate(instances):
+        instance["id"] = ann_id
+    return instances
+
+
+def make_annotation_dict(
+    num_images: int,
+    num_categories: int = DEFAULT_NUM_CATEGORIES,
+    instances_per_image: int = 10,
+    num_vertices: int = 16,
+    image_sizes: tuple[tuple[int, int], ...] = DEFAULT_IMAGE_SIZES,
+    size_jitter: float = 0.0,
+    portrait_fraction: float = 0.0,
+    crowd_fraction: float = 0.0,
+    seed: int = 0,
+) -> dict:
+    """
+    generate a COCO annotation dictionary.
+
+    Parameters
+    ----------
+    num_images: int
+        number of images
+    num_categories: int
+        number of categories, named "category<id>" with the ids 1 to num_categories
+    instances_per_image: int
+        number of annotations of each image
+    num_vertices: int
+        number of vertices of each polygon. 0 generates annotations without
+        segmentation.
+    image_sizes: tuple[tuple[int, int], ...]
+        (height, width) sizes the image sizes are drawn from
+    size_jitter: float
+        images are scaled by a random factor in [1 - size_jitter, 1 + size_jitter]
+    portrait_fraction: float
+        fraction of the images whose height and width are swapped
+    crowd_fraction: float
+        fraction of the annotations with iscrowd set
+    seed: int
+        seed of the generator
+
+    Returns
+    -------
+    annotation_dict: dict
+        COCO annotation dictionary
+    """
+    rng = np.random.default_rng(seed)
+    sizes = np.asarray(image_sizes, dtype=np.float64)
+    sizes = sizes[rng.integers(len(sizes), size=num_images)]
+    if size_jitter:
+        sizes *= rng.uniform(1 - size_jitter, 1 + size_jitter, size=(num_images, 1))
+    sizes = np.maximum(sizes.astype(np.int64), 1)
+    portrait = rng.random(num_images) < portrait_fraction
+    sizes[portrait] = sizes[portrait, ::-1]
+    images = [
+        {"id": i + 1, "file_name": f"{i + 1:012d}.jpg", "height": h, "width": w}
+        for i, (h, w) in enumerate(sizes.tolist())
+    ]
+
+    ann_image_index = np.repeat(np.arange(num_images), instances_per_image)
+    annotations = _make_instances(
+        rng,
+        sizes[ann_image_index, 0],
+        sizes[ann_image_index, 1],
+        num_categories,
+        num_vertices,
+        crowd_fraction,
+    )
+    for ann_id, (annotation, image_index) in enumerate(
+        zip(annotations, ann_image_index.tolist())
+    ):
+        annotation["id"] = ann_id + 1
+        annotation["image_id"] = image_index + 1
+    categories = [
+        {"id": i, "name": f"category{i}", "supercategory": ""}
+        for i in range(1, num_categories + 1)
+    ]
+    return {"images": images, "annotations": annotations, "categories": categories}
+
+
+def make_sized_annotation_dict(
+    num_annotations: int, instances_per_image: int = 10, seed: int = 0
+) -> dict:
+    """
+    generate a COCO annotation dictionary without segmentation with about
+    num_annotations annotations, for benchmarks that only filter or index them.
+    """
+    return make_annotation_dict(
+        max(1, num_annotations // instances_per_image),
+        instances_per_image=instances_per_image,
+        num_vertices=0,
+        seed=seed,
+    )
+
+
+def make_filters(annotation_dict: dict) -> dict:
+    """all four include/exclude filters, each keeping or removing a part of the entries."""
+    file_names = [image["file_name"] for image in annotation_dict["images"]]
+    category_names = [category["name"] for category in annotation_dict["categories"]]
+    return dict(
+        include_files=file_names[: len(file_names) // 2],
+        exclude_files=file_names[::7],
+        include_categories=category_names[: len(category_names) // 2],
+        exclude_categories=category_names[::5],
+    )
+
+
+def write_images(
+    annotation_dict: dict,
+    directory: str,
+    num_files: int = None,
+    seed: int = 0,
+    quality: int = 75,
+):
+    """
+    write random noise JPEG files for the images of an annotation dictionary.
+    The pixels of each image depend only on the seed and the image id.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+    directory: str
+        path to the image directory
+    num_files: int
+        number of images, from the first one, to write. None writes all of them.
+    seed: int
+        seed of the pixels
+    quality: int
+        JPEG quality
+    """
+    images = annotation_dict["images"]
+    for image in images if num_files is None else images[:num_files]:
+        rng = np.random.default_rng((seed, image["id"]))
+        pixels = rng.integers(0, 256, (image["height"], image["width"], 3), np.uint8)
+        Image.fromarray(pixels).save(
+            os.path.join(directory, image["file_name"]), quality=quality
+        )
+
+
+def make_dataset(
+    directory: str,
+    num_images: int,
+    num_image_files: int = None,
+    annotation_name: str = "annotations.json",
+    **kwargs,
+) -> str:
+    """
+    write a synthetic annotation file and its image files.
+
+    Parameters
+    ----------
+    directory: str
+        path to the directory of the images and the annotation file
+    num_images: int
+        number of images
+    num_image_files: int
+        number of images, from the first one, with an image file. None writes all.
+    annotation_name: str
+        file name of the annotation file
+    kwargs:
+        arguments of `make_annotation_dict`
+
+    Returns
+    -------
+    annotation_file: str
+        path to the annotation file
+    """
+    annotation_dict = make_annotation_dict(num_images, **kwargs)
+    write_images(annotation_dict, directory, num_image_files, kwargs.get("seed", 0))
+    annotation_file = os.path.join(directory, annotation_name)
+    with open(annotation_file, "w") as f:
+        json.dump(annotation_dict, f)
+    return annotation_file
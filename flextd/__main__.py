@@ -0,0 +1,5 @@
+import sys
+
+from flextd.cli import main
+
+sys.exit(main())
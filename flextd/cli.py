@@ -0,0 +1,319 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+
+from flextd.flexcoco.jsonio import dump_json, load_json
+from flextd.flexcoco.stream import stream_filter_annotation_file
+from flextd.flexcoco.utils import filter_annotation_dict, has_filter
+
+_FILTER_NAMES = (
+    "include_files",
+    "exclude_files",
+    "include_categories",
+    "exclude_categories",
+)
+
+
+class FilterTask(NamedTuple):
+    """one annotation file filtered by one filter specification"""
+
+    annotation_file: str
+    output_file: str
+    # include_files, exclude_files, include_categories and exclude_categories
+    filters: dict
+    streaming: bool = False
+
+
+class FilterResult(NamedTuple):
+    """timing and counts of a filtered annotation file"""
+
+    annotation_file: str
+    output_file: str
+    seconds: float
+    # counts before and after filtering, None when the file could not be filtered
+    input_images: int | None = None
+    input_annotations: int | None = None
+    images: int | None = None
+    annotations: int | None = None
+    error: str | None = None
+
+
+def run_filter_task(task: FilterTask) -> FilterResult:
+    """
+    filter an annotation file and write the result atomically: the output is written
+    to a temporary file next to it and renamed, so it is either complete or absent.
+
+    Parameters
+    ----------
+    task: FilterTask
+        input file, output file and filters
+
+    Returns
+    -------
+    result: FilterResult
+        wall time and counts, or the error message if the file could not be filtered
+    """
+    start = time.perf_counter()
+    tmp_file = f"{task.output_file}.{os.getpid()}.tmp"
+    counts = {}
+    try:
+        if task.streaming:
+            _, filter_counts = stream_filter_annotation_file(
+                task.annotation_file, tmp_file, return_counts=True, **task.filters
+            )
+            counts = filter_counts._asdict()
+        else:
+            annotation_dict = load_json(task.annotation_file)
+            counts["input_images"] = len(annotation_dict["images"])
+            counts["input_annotations"] = len(annotation_dict["annotations"])
+            annotation_dict = filter_annotation_dict(annotation_dict, **task.filters)
+            counts["images"] = len(annotation_dict["images"])
+            counts["annotations"] = len(annotation_dict["annotations"])
+            dump_json(annotation_dict, tmp_file)
+        os.replace(tmp_file, task.output_file)
+    except Exception as e:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return FilterResult(
+            task.annotation_file,
+            task.output_file,
+            time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+    return FilterResult(
+        task.annotation_file, task.output_file, time.perf_counter() - start, **counts
+    )
+
+
+def run_filter_tasks(tasks: list[FilterTask], num_workers: int = None):
+    """
+    filter annotation files on a process pool.
+
+    Parameters
+    ----------
+    tasks: list[FilterTask]
+        files and filters
+    num_workers: int
+        maximum number of files filtered at once. None is the number of CPUs,
+        0 filters them in the current process.
+
+    Returns
+    -------
+    results: Iterator[FilterResult]
+        result of each task in the order of completion
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_workers == 0 or len(tasks) <= 1:
+        for task in tasks:
+            yield run_filter_task(task)
+        return
+    with ProcessPoolExecutor(min(num_workers, len(tasks))) as executor:
+        futures = [executor.submit(run_filter_task, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def load_filter_spec(path: str) -> dict:
+    """read the filters of a json filter specification file."""
+    try:
+        spec = load_json(path)
+    except ValueError as e:
+        # the decode errors of all json backends are ValueErrors
+        raise ValueError(f"invalid json in filter spec {path}: {e}") from e
+    if not isinstance(spec, dict):
+        raise ValueError(f"filter spec {path} is not a json object")
+    unknown = set(spec) - set(_FILTER_NAMES)
+    if unknown:
+        raise ValueError(f"unknown keys {sorted(unknown)} in filter spec {path}")
+    for name, value in spec.items():
+        if value is not None and not (
+            isinstance(value, list) and all(isinstance(v, str) for v in value)
+        ):
+            raise ValueError(
+                f"{name} must be null or a list of names in filter spec {path}"
+            )
+    return spec
+
+
+def make_filter_tasks(
+    annotation_files: list[str],
+    specs: dict[str, dict],
+    output_dir: str = None,
+    streaming: bool = False,
+) -> list[FilterTask]:
+    """
+    get the task of each pair of annotation file and filter specification.
+    The output of "<dir>/<name>.json" filtered by the spec "<spec>" is
+    "<output_dir>/<name>_<spec>.json", in the directory of the input by default.
+
+    Parameters
+    ----------
+    annotation_files: list[str]
+        paths to the annotation files
+    specs: dict[str, dict]
+        filters of each spec name
+    output_dir: str
+        directory of the outputs
+    streaming: bool
+        filter the files without loading them
+
+    Returns
+    -------
+    tasks: list[FilterTask]
+        task of each file and spec
+    """
+    tasks = []
+    for annotation_file in annotation_files:
+        directory, file_name = os.path.split(annotation_file)
+        stem, extension = os.path.splitext(file_name)
+        for spec_name, filters in specs.items():
+            output_file = os.path.join(
+                directory if output_dir is None else output_dir,
+                f"{stem}_{spec_name}{extension or '.json'}",
+            )
+            tasks.append(FilterTask(annotation_file, output_file, filters, streaming))
+    outputs = [os.path.abspath(task.output_file) for task in tasks]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("several inputs would be written to the same output file")
+    inputs = {os.path.abspath(path) for path in annotation_files}
+    if inputs & set(outputs):
+        raise ValueError("an output file would overwrite an input file")
+    return tasks
+
+
+def _format_count(before: int | None, after: int | None) -> str:
+    if before is None:
+        return "-"
+    return f"{after}/{before}"
+
+
+def _filter_command(args: argparse.Namespace) -> int:
+    specs = {}
+    for path in args.spec or []:
+        spec_name = os.path.splitext(os.path.basename(path))[0]
+        if spec_name in specs:
+            raise ValueError(f"several filter specs are named {spec_name!r}")
+        specs[spec_name] = load_filter_spec(path)
+    filters = {name: getattr(args, name) for name in _FILTER_NAMES}
+    if has_filter(**filters):
+        if args.name in specs:
+            raise ValueError(
+                f"--name {args.name!r} is also the name of a filter spec, "
+                "choose another --name"
+            )
+        specs[args.name] = {
+            name: value for name, value in filters.items() if value is not None
+        }
+    if not specs:
+        raise ValueError("no filter given, use --spec or the include/exclude options")
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    tasks = make_filter_tasks(
+        args.annotation_files, specs, args.output_dir, args.streaming
+    )
+
+    start = time.perf_counter()
+    results = []
+    print(f"{'time [s]':>9} {'images':>15} {'annotations':>19}  output")
+    for result in run_filter_tasks(tasks, args.workers):
+        results.append(result)
+        if result.error is not None:
+            print(
+                f"{'failed':>9} {'':>15} {'':>19}  {result.output_file}: {result.error}"
+            )
+            continue
+        print(
+            f"{result.seconds:>9.2f} "
+            f"{_format_count(result.input_images, result.images):>15} "
+            f"{_format_count(result.input_annotations, result.annotations):>19}  "
+            f"{result.output_file}"
+        )
+    failed = sum(result.error is not None for result in results)
+    print(
+        f"{len(results) - failed} files written, {failed} failed "
+        f"in {time.perf_counter() - start:.2f} s"
+    )
+    if args.report is not None:
+        dump_json([result._asdict() for result in results], args.report)
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="flextd", description="tools for COCO annotation files"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    filter_parser = subparsers.add_parser(
+        "filter",
+        help="filter annotation files by file names and category names",
+        description=(
+            "filter many annotation files with the same filters in parallel. "
+            "Each file is filtered by each --spec file and by the include/exclude "
+            "options, and written atomically to <name>_<spec>.json."
+        ),
+    )
+    filter_parser.add_argument("annotation_files", nargs="+", help="annotation files")
+    filter_parser.add_argument(
+        "--spec",
+        action="append",
+        help="json file with include_files, exclude_files, include_categories and "
+        "exclude_categories lists. The output suffix is its file name. Repeatable.",
+    )
+    for name in _FILTER_NAMES:
+        filter_parser.add_argument(
+            f"--{name.replace('_', '-')}", dest=name, nargs="+", metavar="NAME"
+        )
+    filter_parser.add_argument(
+        "--name",
+        default="filtered",
+        help="output suffix of the include/exclude options (default: filtered)",
+    )
+    filter_parser.add_argument(
+        "--output-dir", help="directory of the outputs (default: next to the inputs)"
+    )
+    filter_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="files filtered at once (default: number of CPUs, 0: no processes)",
+    )
+    filter_parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="filter without loading whole files, for files larger than memory",
+    )
+    filter_parser.add_argument("--report", help="json file of the per-file results")
+    filter_parser.set_defaults(run=_filter_command)
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    entry point of the flextd command.
+
+    Parameters
+    ----------
+    argv: list[str]
+        command line arguments. None uses sys.argv.
+
+    Returns
+    -------
+    status: int
+        exit status
+    """
+    args = build_parser().parse_args(argv)
+    # invalid arguments or spec files, including json decode errors (ValueErrors),
+    # and spec files or output directories that cannot be read or created
+    try:
+        return args.run(args)
+    except (ValueError, OSError) as e:
+        print(f"flextd: error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
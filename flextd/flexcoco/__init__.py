@@ -0,0 +1,47 @@
+import importlib
+
+# public names and their modules. The modules are imported on first access, so that
+# the annotation utilities do not import torch, torchvision and pycocotools.
+_EXPORTS = {
+    "FlexCocoDatasetBase": "coco_base",
+    "ImageRecord": "coco_base",
+    "coco_from_dict": "coco_base",
+    "FlexCocoDatasetBaseSS": "coco_semantic_segmentation",
+    "FilteredAnnotationCache": "cache",
+    "filter_annotation_dict": "utils",
+    "filter_dataset": "utils",
+    "create_filtered_annotation_file": "utils",
+    "write_annotation_file": "utils",
+    "stream_filter_annotation_file": "stream",
+    "DatasetStatistics": "statistics",
+    "get_annotation_file_statistics": "statistics",
+    "SplitSpec": "splits",
+    "SubsetSpec": "splits",
+    "random_split_specs": "splits",
+    "k_fold_specs": "splits",
+    "create_subset_annotation_files": "splits",
+    "CocoAnnotationStore": "store",
+    "convert_to_annotation_store": "store",
+    "load_annotation_index": "jsonio",
+    "set_json_backend": "jsonio",
+    "PartitionSampler": "partition",
+    "AspectRatioBatchSampler": "samplers",
+    "ShardedCocoDataset": "shards",
+    "write_shards": "shards",
+    "StageProfiler": "profiling",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module_name}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import time
+
+from flextd.flexcoco.utils import create_filtered_annotation_file, has_filter
+
+_DIGEST_BLOCK_SIZE = 1 << 20
+# only files with this suffix are read and removed, so that other files in the cache
+# directory (e.g. annotation files) are never evicted
+CACHE_SUFFIX = ".flextd-cache.json"
+
+
+def _normalize(values: list[str] | None) -> list | None:
+    """order and duplicates of the filter values do not change the filtered file."""
+    if values is None:
+        return None
+    return sorted(set(values))
+
+
+class FilteredAnnotationCache:
+    """
+    Persistent cache of filtered annotation files.
+
+    A filtered file is stored as `<key>.flextd-cache.json` in the cache directory,
+    where the key is a hash of the source annotation file and the normalized
+    include/exclude arguments.
+    The source file is identified by its path, size and modification time, or by a
+    digest of its content when content_digest is True.
+    The modification time of a cached file is updated when it is used, so that the
+    least recently used files are evicted first. Other files in the cache directory
+    are left untouched.
+
+    Attributes
+    ----------
+    cache_dir: str
+        path to the cache directory
+    max_size: int | None
+        maximum total size of the cached files in bytes
+    max_age: float | None
+        maximum time in seconds since a cached file was last used
+    content_digest: bool
+        identify the source file by a digest of its content
+    hits: int
+        number of lookups that found a cached file
+    misses: int
+        number of lookups that created a new filtered file
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size: int = None,
+        max_age: float = None,
+        content_digest: bool = False,
+    ):
+        self.cache_dir = str(cache_dir)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.content_digest = content_digest
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _source_id(self, annotation_file: str) -> dict:
+        if self.content_digest:
+            digest = hashlib.sha256()
+            with open(annotation_file, "rb") as f:
+                for block in iter(lambda: f.read(_DIGEST_BLOCK_SIZE), b""):
+                    digest.update(block)
+            return {"sha256": digest.hexdigest()}
+        stat = os.stat(annotation_file)
+        return {
+            "path": os.path.realpath(annotation_file),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def key(
+        self,
+        annotation_file: str,
+        include_files: list[str] = None,
+        exclude_files: list[str] = None,
+        include_categories: list[str] = None,
+        exclude_categories: list[str] = None,
+    ) -> str:
+        """
+        get the cache key of a filtered annotation file.
+
+        Returns
+        -------
+        key: str
+            hex digest of the source file and the normalized filter arguments
+        """
+        material = {
+            "source": self._source_id(annotation_file),
+            "include_files": _normalize(include_files),
+            "exclude_files": _normalize(exclude_files),
+            "include_categories": _normalize(include_categories),
+            "exclude_categories": _normalize(exclude_categories),
+        }
+        encoded = json.dumps(material, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def path(self, key: str) -> str:
+        """get the path of the cached file for the key."""
+        return os.path.join(self.cache_dir, f"{key}{CACHE_SUFFIX}")
+
+    def get_or_create(
+        self,
+        annotation_file: str,
+        include_files: list[str] = None,
+        exclude_files: list[str] = None,
+        include_categories: list[str] = None,
+        exclude_categories: list[str] = None,
+        streaming: bool = False,
+    ) -> str:
+        """
+        get the path of the filtered annotation file, creating it on a cache miss.
+        When no filter is given, the source annotation file is returned as is.
+
+        Parameters
+        ----------
+        annotation_file: str
+            path to the annotation file
+        include_files: list[str]
+            list of file names to include
+        exclude_files: list[str]
+            list of file names to exclude
+        include_categories: list[str]
+            list of category names to include
+        exclude_categories: list[str]
+            list of category names to exclude
+        streaming: bool
+            create the filtered file with the streaming filter
+
+        Returns
+        -------
+        output_file: str
+            path to the cached filtered annotation file
+        """
+        filters = dict(
+            include_files=include_files,
+            exclude_files=exclude_files,
+            include_categories=include_categories,
+            exclude_categories=exclude_categories,
+        )
+        if not has_filter(**filters):
+            return annotation_file
+
+        cached_file = self.path(self.key(annotation_file, **filters))
+        if os.path.exists(cached_file):
+            self.hits += 1
+            os.utime(cached_file)
+            return cached_file
+
+        self.misses += 1
+        tmp_file = f"{cached_file}.{os.getpid()}.tmp"
+        try:
+            create_filtered_annotation_file(
+                annotation_file, tmp_file, streaming=streaming, **filters
+            )
+            os.replace(tmp_file, cached_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        self.evict(keep=cached_file)
+        return cached_file
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep: str = None) -> list[str]:
+        """
+        remove cached files that are older than max_age, then remove the least recently
+        used files until the total size is at most max_size.
+
+        Parameters
+        ----------
+        keep: str
+            path to a cached file that is never removed
+
+        Returns
+        -------
+        removed: list[str]
+            paths to the removed files
+        """
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed = []
+        for mtime, size, path in entries:
+            if path == keep:
+                continue
+            expired = self.max_age is not None and now - mtime > self.max_age
+            oversized = self.max_size is not None and total_size > self.max_size
+            if not (expired or oversized):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed.append(path)
+        return removed
+
+    def clear(self):
+        """remove all cached files."""
+        for _, _, path in self._entries():
+            os.remove(path)
+
+    def stats(self) -> dict:
+        """
+        get the counters and the current contents of the cache.
+
+        Returns
+        -------
+        stats: dict
+            dictionary containing hits, misses, files and size in bytes
+        """
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(entries),
+            "size": sum(size for _, size, _ in entries),
+        }
@@ -1,7 +1,60 @@
-from pycocotools.coco import COCO
+import shutil
+from types import MappingProxyType
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
 from torch.utils.data import Dataset
 
-from flextd.flexcoco.utils import create_filtered_annotation_file
+from flextd.flexcoco.cache import FilteredAnnotationCache
+from flextd.flexcoco.jsonio import load_json
+from flextd.flexcoco.partition import (
+    partition_annotation_dict,
+    partition_indices,
+    partition_size,
+)
+from flextd.flexcoco.profiling import NULL_STAGE, StageProfiler
+from flextd.flexcoco.statistics import (
+    AREA_BINS,
+    DatasetStatistics,
+    get_annotation_dict_statistics,
+    get_store_statistics,
+)
+from flextd.flexcoco.store import CocoAnnotationStore, is_annotation_store
+from flextd.flexcoco.utils import filter_dataset, has_filter, write_annotation_file
+
+if TYPE_CHECKING:
+    from pycocotools.coco import COCO
+
+
+def coco_from_dict(annotation_dict: dict) -> "COCO":
+    """
+    create a COCO object from an annotation dictionary without reading a file.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+
+    Returns
+    -------
+    coco: COCO
+        COCO object with its index created
+    """
+    from pycocotools.coco import COCO
+
+    coco = COCO()
+    coco.dataset = annotation_dict
+    coco.createIndex()
+    return coco
+
+
+class ImageRecord(NamedTuple):
+    """per-index record of an image"""
+
+    file_name: str
+    height: int
+    width: int
+    ann_slice: slice
 
 
 class FlexCocoDatasetBase(Dataset):
@@ -12,14 +65,32 @@ class FlexCocoDatasetBase(Dataset):
     ----------
     image_dir: str
         path to the image directory
-    coco: COCO
-        COCO object
+    coco: COCO | CocoAnnotationStore
+        COCO object, or annotation store when annotation_file is a store directory
     data_transforms:
         transform to be applied to the image
     label_transforms:
         transform to be applied to the label such as mask, bounding box, etc.
     ids: list[int]
         list of image ids
+    heights: np.ndarray
+        read-only array of the image heights per index
+    widths: np.ndarray
+        read-only array of the image widths per index
+    category_ids: tuple[int]
+        category id of each category index (mask channel)
+    cat_id2idx: Mapping[int, int]
+        read-only mapping of category id to category index
+    cat_name2idx: Mapping[str, int]
+        read-only mapping of category name to category index
+    rank: int | None
+        rank of the partition, None if the dataset is not partitioned
+    world_size: int | None
+        number of partitions, None if the dataset is not partitioned
+    partition_size: int
+        number of samples per epoch, the same on every rank
+    profiler: StageProfiler | None
+        per-stage timings and byte counts of the samples, None when not profiling
     """
 
     def __init__(
@@ -32,6 +103,13 @@ class FlexCocoDatasetBase(Dataset):
         exclude_files: list[str] = None,
         include_categories: list[str] = None,
         exclude_categories: list[str] = None,
+        annotation_cache: FilteredAnnotationCache | str = None,
+        new_annotation_file: str = None,
+        shared_index: bool = False,
+        rank: int = None,
+        world_size: int = None,
+        partition_seed: int = 0,
+        profiler: StageProfiler = None,
     ):
         """
         constructor of CustomCocoDataset.
@@ -39,13 +117,30 @@ class FlexCocoDatasetBase(Dataset):
         When exclude_files is given, the images with the file names in the list are excluded.
         When given include_categories, only the images with the category names in the list used.
         If include_files and exclude_files both contain the same file name, that file will be excluded from the dataset.
+        The filtered annotations are indexed in memory. They are written to a file only when
+        new_annotation_file is given.
+        When annotation_cache is given, the filtered annotation file is reused from the cache
+        as long as the annotation file and the filters are unchanged.
+        When annotation_file is a directory created by `convert_to_annotation_store`, the
+        memory mapped store is used instead of a COCO object.
+        When shared_index is True, the annotations are also held in a memory mapped store
+        instead of a COCO object, so DataLoader workers share the index without copying it.
+        When rank and world_size are given, only the partition of the filtered images
+        that belongs to the rank is indexed. Every rank computes the same assignment from
+        partition_seed, so the partitions do not overlap. Use `PartitionSampler` instead
+        of DistributedSampler to shuffle the partition every epoch. With an annotation
+        store only the partition is read; a json file is still parsed once.
+        new_annotation_file has all the filtered images and is written by rank 0 only.
+        When profiler is given, the stages of each sample are timed and their bytes are
+        counted. The counters of the DataLoader workers are shared with the main
+        process, see `StageProfiler`.
 
         Parameters`
         ----------
         image_dir: str
             path to the image directory
         annotation_file: str
-            path to the annotation json file
+            path to the annotation json file or the annotation store directory
         data_transforms:
             transform to be applied to the image
         label_transforms:
@@ -58,20 +153,207 @@ class FlexCocoDatasetBase(Dataset):
             list of category names to include
         exclude_categories: list[str]
             list of category names to exclude
+        annotation_cache: FilteredAnnotationCache | str
+            cache of filtered annotation files or path to its directory
+        new_annotation_file: str
+            path to write the filtered annotation file (or store directory) to
+        shared_index: bool
+            hold the annotation index in flat memory mapped arrays
+        rank: int
+            rank of the process for partitioned loading
+        world_size: int
+            number of processes for partitioned loading
+        partition_seed: int
+            seed of the assignment of the images to the ranks
+        profiler: StageProfiler
+            profiler of the stages of the samples. None disables profiling.
         """
 
-        annotation_file = create_filtered_annotation_file(
-            annotation_file=annotation_file,
+        filters = dict(
             include_files=include_files,
             exclude_files=exclude_files,
             include_categories=include_categories,
             exclude_categories=exclude_categories,
         )
-        self.coco = COCO(str(annotation_file))
+        partitioned = world_size is not None
+        if partitioned and rank is None:
+            raise ValueError("rank is required with world_size")
+        self.rank = rank
+        self.world_size = world_size
+        # every rank filters the same images, so one of them writes the filtered file
+        if partitioned and rank != 0:
+            new_annotation_file = None
+        if is_annotation_store(annotation_file):
+            self.coco = CocoAnnotationStore.load(annotation_file)
+            if has_filter(**filters):
+                self.coco = self.coco.filter(**filters)
+            num_images = self.coco.num_images
+            if new_annotation_file is not None:
+                self.coco.save(new_annotation_file)
+            if partitioned:
+                self.coco = self.coco.select(
+                    partition_indices(num_images, rank, world_size, partition_seed)
+                )
+            if shared_index and self.coco.store_dir is None:
+                self.coco = self.coco.share()
+        else:
+            annotation_dict = None
+            if annotation_cache is not None:
+                if not isinstance(annotation_cache, FilteredAnnotationCache):
+                    annotation_cache = FilteredAnnotationCache(annotation_cache)
+                annotation_file = annotation_cache.get_or_create(
+                    annotation_file, **filters
+                )
+                # without filters the source file is used as is and nothing is written,
+                # as without the cache
+                if new_annotation_file is not None and has_filter(**filters):
+                    shutil.copyfile(annotation_file, new_annotation_file)
+            else:
+                annotation_dict = filter_dataset(annotation_file, **filters)
+                if annotation_dict is not None and new_annotation_file is not None:
+                    write_annotation_file(annotation_dict, new_annotation_file)
+
+            if partitioned:
+                if annotation_dict is None:
+                    annotation_dict = load_json(annotation_file)
+                num_images = len(annotation_dict["images"])
+                annotation_dict = partition_annotation_dict(
+                    annotation_dict, rank, world_size, partition_seed
+                )
+            if shared_index:
+                if annotation_dict is None:
+                    annotation_dict = load_json(annotation_file)
+                self.coco = CocoAnnotationStore.from_dict(annotation_dict).share()
+            else:
+                if annotation_dict is None:
+                    annotation_dict = load_json(annotation_file)
+                self.coco = coco_from_dict(annotation_dict)
         self.image_dir = image_dir
         self.data_transforms = data_transforms
         self.label_transforms = label_transforms
-        self.ids = list(self.coco.imgs.keys())
+        self.profiler = profiler
+        self.ids = list(self.coco.getImgIds())
+        # number of samples per epoch, the same on every rank
+        self.partition_size = (
+            partition_size(num_images, world_size) if partitioned else len(self.ids)
+        )
+        self._build_lookup_tables()
+
+    def _build_lookup_tables(self):
+        """
+        precompute the per-index image records and the category lookup, so that an item
+        is fetched without querying the COCO index.
+        """
+        categories = self.coco.loadCats(self.coco.getCatIds())
+        self.category_ids = tuple(category["id"] for category in categories)
+        self._cat_id2idx = {cat_id: i for i, cat_id in enumerate(self.category_ids)}
+        self._cat_name2idx = {
+            category["name"]: i for i, category in enumerate(categories)
+        }
+
+        if isinstance(self.coco, CocoAnnotationStore):
+            # the store already holds the images in the order of self.ids
+            self.heights = self.coco.columns["image_height"]
+            self.widths = self.coco.columns["image_width"]
+            self._ann_offsets = self.coco.columns["ann_offsets"]
+            self._file_names = None
+            self._anns = None
+        else:
+            images = self.coco.loadImgs(self.ids)
+            self.heights = np.array([image["height"] for image in images], np.int32)
+            self.widths = np.array([image["width"] for image in images], np.int32)
+            self._file_names = [image["file_name"] for image in images]
+            # annotations of all images, grouped by index
+            self._anns = []
+            self._ann_offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            for index, img_id in enumerate(self.ids):
+                self._anns.extend(self.coco.imgToAnns[img_id])
+                self._ann_offsets[index + 1] = len(self._anns)
+            self.heights.flags.writeable = False
+            self.widths.flags.writeable = False
+
+    def _stage(self, stage: str):
+        """time a stage of a sample with the profiler, if there is one."""
+        if self.profiler is None:
+            return NULL_STAGE
+        return self.profiler.stage(stage)
+
+    @property
+    def cat_id2idx(self) -> MappingProxyType:
+        return MappingProxyType(self._cat_id2idx)
+
+    @property
+    def cat_name2idx(self) -> MappingProxyType:
+        return MappingProxyType(self._cat_name2idx)
+
+    def get_image_record(self, index: int) -> ImageRecord:
+        """
+        get the precomputed record of an image.
+
+        Parameters
+        ----------
+        index: int
+            index of the image
+
+        Returns
+        -------
+        record: ImageRecord
+            file name, height, width and slice of the annotations of the image
+        """
+        if self._file_names is None:
+            file_name = self.coco.file_name(index)
+        else:
+            file_name = self._file_names[index]
+        return ImageRecord(
+            file_name=file_name,
+            height=int(self.heights[index]),
+            width=int(self.widths[index]),
+            ann_slice=slice(
+                int(self._ann_offsets[index]), int(self._ann_offsets[index + 1])
+            ),
+        )
+
+    def get_annotations(self, index: int) -> list[dict]:
+        """
+        get the annotations of an image.
+
+        Parameters
+        ----------
+        index: int
+            index of the image
+
+        Returns
+        -------
+        anns: list[dict]
+            COCO annotations of the image
+        """
+        if self._anns is None:
+            return self.coco.image_annotations(index)
+        return self._anns[self._ann_offsets[index] : self._ann_offsets[index + 1]]
+
+    def get_annotations_batch(self, indices: list[int]) -> list[list[dict]]:
+        """
+        get the annotations of several images with one lookup of the annotation offsets.
+
+        Parameters
+        ----------
+        indices: list[int]
+            indices of the images
+
+        Returns
+        -------
+        anns_list: list[list[dict]]
+            COCO annotations of each image
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self._ann_offsets[indices].tolist()
+        stops = self._ann_offsets[indices + 1].tolist()
+        if self._anns is None:
+            return [
+                [self.coco.annotation(row) for row in range(start, stop)]
+                for start, stop in zip(starts, stops)
+            ]
+        return [self._anns[start:stop] for start, stop in zip(starts, stops)]
 
     def __getitem__(self, index: int):
         raise NotImplementedError("This method should be implemented in the subclass.")
@@ -104,10 +386,33 @@ class FlexCocoDatasetBase(Dataset):
         cat_stat: dict
             dictionary containing category name and the number of images
         """
-        cat_ids = self.coco.getCatIds()
-        cat_stat = {}
-        for cat_id in cat_ids:
-            images = self.coco.getImgIds(catIds=cat_id)
-            categories = self.coco.loadCats(ids=[cat_id])
-            cat_stat[categories[0]["name"]] = len(images)
-        return cat_stat
+        if self._anns is None:
+            return self.get_dataset_statistics().image_counts_by_name()
+        # the COCO index already holds the images of each category
+        return {
+            category["name"]: len(set(self.coco.catToImgs[category["id"]]))
+            for category in self.coco.loadCats(self.coco.getCatIds())
+        }
+
+    def get_dataset_statistics(
+        self, area_bins: tuple[float, ...] = AREA_BINS
+    ) -> DatasetStatistics:
+        """
+        get the statistics of the categories, computed in one pass over the annotations.
+
+        Parameters
+        ----------
+        area_bins: tuple[float, ...]
+            ascending upper edges of the area ranges of the histograms.
+            the default is the small, medium and large areas of the COCO evaluation.
+
+        Returns
+        -------
+        statistics: DatasetStatistics
+            numbers of images and instances, crowd fractions and area histograms of
+            each category
+        """
+        if self._anns is None:
+            return get_store_statistics(self.coco, area_bins)
+        # the annotations in the order of the file are read faster than grouped by image
+        return get_annotation_dict_statistics(self.coco.dataset, area_bins)
@@ -1,11 +1,23 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import numpy as np
-from pycocotools.coco import COCO
 import torch
-from torchvision.io import read_image
 
 from flextd.flexcoco.coco_base import FlexCocoDatasetBase
+from flextd.flexcoco.images import read_image_resized
+from flextd.flexcoco.mask_cache import SemanticMaskCache
+from flextd.flexcoco.masks import (
+    TARGET_FORMATS,
+    collate_semantic_segmentation,
+    expand_batch_masks,
+    format_masks,
+    rasterize_category_masks_batch,
+)
+from flextd.flexcoco.prefetch import ImagePrefetcher, worker_order
+from flextd.flexcoco.profiling import nbytes_of
 
 
 class FlexCocoDatasetBaseSS(FlexCocoDatasetBase):
@@ -24,10 +36,305 @@ class FlexCocoDatasetBaseSS(FlexCocoDatasetBase):
         transform to be applied to the label such as mask, bounding box, etc.
     ids: list[int]
         list of image ids
+    mask_cache: SemanticMaskCache | None
+        cache of the category masks
+    target_format: str
+        format of the masks in the target
+    num_decode_threads: int
+        number of threads decoding the images of a batch in __getitems__
+    prefetch_depth: int
+        number of images read ahead in the prefetch order. 0 disables prefetching.
+    prefetch_max_bytes: int | None
+        maximum number of bytes held by images read ahead
+    target_size: tuple[int, int] | None
+        (height, width) of the images and masks
+    crop_size: tuple[int, int] | None
+        (height, width) of the random crop of the images and masks
     """
 
-    def __init__(self, image_dir: str, annotation_file: str, *args, **kwargs):
+    def __init__(
+        self,
+        image_dir: str,
+        annotation_file: str,
+        *args,
+        mask_cache_dir: str = None,
+        target_format: str = "dense",
+        num_decode_threads: int = 4,
+        prefetch_depth: int = 0,
+        prefetch_max_bytes: int = None,
+        target_size: tuple[int, int] = None,
+        crop_size: tuple[int, int] = None,
+        **kwargs,
+    ):
+        """
+        constructor of FlexCocoDatasetBaseSS.
+        When mask_cache_dir is given, the category masks are read from the mask cache and
+        only the images that are not cached yet are rasterized.
+        Use `build_mask_cache` to fill the cache in advance.
+        target_format selects how the masks are returned:
+        "dense" is a float32 tensor of shape (n_classes, height, width),
+        "bool" and "uint8" are multi-hot masks of the same shape,
+        "label_map" is a tensor of shape (height, width) with 0 as background and
+        class index + 1 as label (the larger class index wins where classes overlap), and
+        "packed" is a uint8 tensor of shape (n_classes, height, ceil(width / 8)) and
+        "rle" is a dictionary of the size and the compressed RLE of each class.
+        label_transforms receive the masks in the target format and cannot be used with
+        "packed" and "rle". Use `get_collate_fn` to expand the masks of a batch to the
+        dense form, or collate with `dense=False` in the DataLoader workers and expand
+        the masks in the main process with `expand_masks`, so that only the compact
+        masks are sent from the workers.
+        When target_size is given, the images and masks are produced at that size:
+        the polygons are scaled before they are rasterized, RLE masks are resized with
+        nearest neighbour sampling and JPEG images are decoded at a reduced size where
+        possible, so the cost scales with the target size instead of the source size.
+        When crop_size is given, a random window of that size (or of the image size if
+        the image is smaller) is chosen from the image size in the annotation before
+        anything is decoded. Only the annotations whose bbox intersects the window are
+        rasterized, only over the window, and the masks are the same as cropping full
+        masks. The window is returned as "crop" (top, left, height, width) in the target.
+        When prefetch_depth is positive and the order of the sampler is given with
+        `set_prefetch_order`, the next images are read and decoded in the background.
+
+        Parameters
+        ----------
+        image_dir: str
+            path to the image directory
+        annotation_file: str
+            path to the annotation json file
+        mask_cache_dir: str
+            path to the directory of the mask cache
+        target_format: str
+            one of "dense", "bool", "uint8", "label_map", "packed" and "rle"
+        num_decode_threads: int
+            number of threads decoding the images of a batch in __getitems__
+            and reading the images ahead. 0 decodes them sequentially.
+        prefetch_depth: int
+            number of images read ahead. 0 disables prefetching.
+        prefetch_max_bytes: int
+            maximum number of bytes held by images read ahead. None is unlimited.
+        target_size: tuple[int, int]
+            (height, width) of the images and masks. None keeps the size of each image.
+        crop_size: tuple[int, int]
+            (height, width) of the random crop. Cannot be combined with target_size.
+        """
         super().__init__(image_dir, annotation_file, *args, **kwargs)
+        if target_format not in TARGET_FORMATS:
+            raise ValueError(
+                f"unknown target_format {target_format!r}, "
+                f"expected one of {TARGET_FORMATS}"
+            )
+        if target_format in ("packed", "rle") and self.label_transforms is not None:
+            raise ValueError(
+                f"label_transforms cannot be used with {target_format} masks"
+            )
+        self.target_format = target_format
+        if target_size is not None and crop_size is not None:
+            raise ValueError("target_size cannot be combined with crop_size")
+        self.target_size = None if target_size is None else tuple(map(int, target_size))
+        self.crop_size = None if crop_size is None else tuple(map(int, crop_size))
+        self.num_decode_threads = num_decode_threads
+        self._executor = None
+        self._executor_pid = None
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_max_bytes = prefetch_max_bytes
+        self._prefetch_order = None
+        self._prefetch_batch_size = 1
+        self._prefetcher = None
+        self._prefetcher_pid = None
+        self.mask_cache = None
+        if mask_cache_dir is not None:
+            self.mask_cache = SemanticMaskCache(
+                mask_cache_dir, self.category_ids, mask_size=self.target_size
+            )
+
+    def build_mask_cache(self, num_workers: int = None):
+        """
+        rasterize the category masks of all images into the mask cache.
+
+        Parameters
+        ----------
+        num_workers: int
+            number of worker processes. 0 builds the cache in the current process.
+        """
+        if self.mask_cache is None:
+            raise ValueError("mask_cache_dir is not given")
+        items = []
+        for index, img_id in enumerate(self.ids):
+            _, height, width, _ = self.get_image_record(index)
+            items.append((img_id, height, width, self.get_annotations(index)))
+        self.mask_cache.build(items, num_workers=num_workers)
+
+    def __getstate__(self) -> dict:
+        # thread pools are not picklable and are recreated in each worker
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_prefetcher"] = None
+        return state
+
+    def set_prefetch_order(self, indices: list[int], batch_size: int = 1):
+        """
+        set the order in which the images will be requested, e.g. `list(sampler)`.
+        Call it before creating the DataLoader iterator; each worker reads ahead the
+        batches it fetches, which DataLoader hands out in turn.
+
+        Parameters
+        ----------
+        indices: list[int]
+            indices of the images in the order of the sampler
+        batch_size: int
+            batch size of the DataLoader
+        """
+        if self.prefetch_depth <= 0:
+            raise ValueError("prefetch_depth is not positive")
+        self._prefetch_order = [int(index) for index in indices]
+        self._prefetch_batch_size = batch_size
+        if self._prefetcher is not None and self._prefetcher_pid == os.getpid():
+            self._prefetcher.set_order(
+                worker_order(self._prefetch_order, self._prefetch_batch_size)
+            )
+
+    def get_prefetcher(self) -> ImagePrefetcher | None:
+        """
+        get the image prefetcher of the current process.
+
+        Returns
+        -------
+        prefetcher: ImagePrefetcher | None
+            prefetcher, or None if no prefetch order is set
+        """
+        if self._prefetch_order is None:
+            return None
+        if self._prefetcher is None or self._prefetcher_pid != os.getpid():
+            self._prefetcher = ImagePrefetcher(
+                self._read_image_of_index,
+                depth=self.prefetch_depth,
+                max_bytes=self.prefetch_max_bytes,
+                num_threads=self.num_decode_threads,
+            )
+            self._prefetcher_pid = os.getpid()
+            self._prefetcher.set_order(
+                worker_order(self._prefetch_order, self._prefetch_batch_size)
+            )
+        return self._prefetcher
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.num_decode_threads)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _read_image(self, file_name: str) -> torch.Tensor:
+        path = os.path.join(self.image_dir, file_name)
+        if self.target_size is not None:
+            return read_image_resized(path, self.target_size)
+        # torchvision takes seconds to import and is only needed to decode images
+        from torchvision.io import read_image
+
+        return read_image(path)
+
+    def _read_image_of_index(self, index: int) -> torch.Tensor:
+        with self._stage("read_image") as stage:
+            img = self._read_image(self.get_image_record(index).file_name)
+            stage.nbytes = nbytes_of(img)
+        return img
+
+    def _wait_image(self, img) -> torch.Tensor:
+        """get an image that is read on another thread."""
+        if torch.is_tensor(img):
+            return img
+        with self._stage("image_wait"):
+            return img.result()
+
+    def _choose_window(self, index: int) -> tuple[int, int, int, int] | None:
+        """choose the random crop window of an image from its size."""
+        if self.crop_size is None:
+            return None
+        window = []
+        for size, crop in zip(
+            (self.heights[index], self.widths[index]), self.crop_size
+        ):
+            crop = min(crop, int(size))
+            window.append(int(torch.randint(int(size) - crop + 1, ())))
+            window.append(crop)
+        top, height, left, width = window
+        return top, left, height, width
+
+    def _load_masks(
+        self,
+        indices: list[int],
+        anns_list: list[list[dict]],
+        windows: list[tuple[int, int, int, int]] = None,
+    ) -> list:
+        """get the boolean category masks of the images from the cache or rasterize them."""
+        masks_list = [None] * len(indices)
+        if self.mask_cache is not None:
+            with self._stage("mask_cache") as stage:
+                for i, (index, anns) in enumerate(zip(indices, anns_list)):
+                    ann_ids = [ann["id"] for ann in anns]
+                    masks = self.mask_cache.load(self.ids[index], ann_ids)
+                    if masks is not None and windows is not None:
+                        top, left, height, width = windows[i]
+                        masks = masks[:, top : top + height, left : left + width]
+                    masks_list[i] = masks
+                stage.nbytes = sum(
+                    nbytes_of(masks) for masks in masks_list if masks is not None
+                )
+        missing = [i for i, masks in enumerate(masks_list) if masks is None]
+        if missing:
+            with self._stage("rasterize") as stage:
+                rasterized = rasterize_category_masks_batch(
+                    [anns_list[i] for i in missing],
+                    [int(self.heights[indices[i]]) for i in missing],
+                    [int(self.widths[indices[i]]) for i in missing],
+                    self._cat_id2idx,
+                    output_sizes=(
+                        None
+                        if self.target_size is None
+                        else [self.target_size] * len(missing)
+                    ),
+                    windows=None if windows is None else [windows[i] for i in missing],
+                )
+                stage.nbytes = sum(map(nbytes_of, rasterized))
+            for i, masks in zip(missing, rasterized):
+                masks_list[i] = masks
+                # cropped masks are not cached, use build_mask_cache
+                if self.mask_cache is not None and windows is None:
+                    ann_ids = [ann["id"] for ann in anns_list[i]]
+                    self.mask_cache.save(self.ids[indices[i]], ann_ids, masks)
+        return masks_list
+
+    def _make_sample(
+        self,
+        index: int,
+        img: torch.Tensor,
+        masks: np.ndarray,
+        window: tuple[int, int, int, int] = None,
+    ) -> tuple[torch.Tensor, dict]:
+        """crop the image, apply the target format and the transforms and build the target."""
+        if window is not None:
+            top, left, height, width = window
+            img = img[:, top : top + height, left : left + width].contiguous()
+        with self._stage("format") as stage:
+            masks = format_masks(np.ascontiguousarray(masks), self.target_format)
+            stage.nbytes = nbytes_of(masks)
+
+        if self.data_transforms is not None:
+            with self._stage("data_transforms"):
+                img = self.data_transforms(img)
+        if self.label_transforms is not None:
+            with self._stage("label_transforms"):
+                masks = self.label_transforms(masks)
+
+        target = {
+            "masks": masks,
+            "file_name": self.get_image_record(index).file_name,
+            "origin_height": int(self.heights[index]),
+            "origin_width": int(self.widths[index]),
+        }
+        if window is not None:
+            target["crop"] = window
+
+        return img, target
 
     def __getitem__(self, index: int) -> tuple[torch.Tensor, dict]:
         """
@@ -44,52 +351,128 @@ class FlexCocoDatasetBaseSS(FlexCocoDatasetBase):
             dictionary containing masks, origin_height, origin_width
             mask is a tensor of shape (n_batches, n_classes, height, width)
         """
-        # 画像IDを取得
-        img_id = self.ids[index]
-        height = self.coco.loadImgs(img_id)[0]["height"]
-        width = self.coco.loadImgs(img_id)[0]["width"]
-        file_name = self.coco.loadImgs(img_id)[0]["file_name"]
-        # 画像IDに対応するアノテーションID一覧を取得（1枚の画像に複数のアノテーションがある）
-        ann_ids = self.coco.getAnnIds(imgIds=img_id)
-        # アノテーションID一覧から画像に紐ずくアノテーション一覧を取得
-        coco_anns = self.coco.loadAnns(ann_ids)
-
-        category_ids = self.coco.getCatIds()
-
-        self.cat_id2idx = {}
-        self.cat_name2idx = {}
-        for idx, category in enumerate(self.coco.loadCats(category_ids)):
-            self.cat_id2idx[category["id"]] = idx
-            self.cat_name2idx[category["name"]] = idx
-
-        # masks: (num_of_category_mask, height, width)
-        masks = np.zeros(shape=(len(category_ids), height, width), dtype=bool)
-        # アノテーションをカテゴリごとに結合してカテゴリマスクを作成
-        for ann in coco_anns:
-            category_id: int = int(ann["category_id"])
-            index_of_cat = self.cat_id2idx[category_id]
-            category_mask = masks[index_of_cat]  # get category mask
-            category_mask = np.logical_or(
-                category_mask, self.coco.annToMask(ann)
-            )  # update category mask
-            masks[index_of_cat] = category_mask  # put category mask back
-        masks = torch.Tensor(masks.astype(np.float32))
-
-        img: torch.Tensor = read_image(os.path.join(self.image_dir, file_name))
+        with self._stage("samples"):
+            prefetcher = self.get_prefetcher()
+            if prefetcher is not None:
+                img = prefetcher.fetch(index)
+            # 画像に紐ずくアノテーション一覧を取得（1枚の画像に複数のアノテーションがある）
+            with self._stage("annotations"):
+                coco_anns = self.get_annotations(index)
+            window = self._choose_window(index)
+            # masks: (num_of_category_mask, height, width)
+            windows = None if window is None else [window]
+            masks = self._load_masks([index], [coco_anns], windows)[0]
+            if prefetcher is not None:
+                img: torch.Tensor = self._wait_image(img)
+            else:
+                img: torch.Tensor = self._read_image_of_index(index)
+            return self._make_sample(index, img, masks, window)
 
-        if self.data_transforms is not None:
-            img = self.data_transforms(img)
-        if self.label_transforms is not None:
-            masks = self.label_transforms(masks)
+    def __getitems__(self, indices: list[int]) -> list[tuple[torch.Tensor, dict]]:
+        """
+        fetch a batch of samples. DataLoader calls this instead of __getitem__.
+        The images are decoded concurrently on a thread pool while the masks of the whole
+        batch are rasterized, and each sample is the same as the one of __getitem__.
 
-        target = {
-            "masks": masks,
-            "file_name": file_name,
-            "origin_height": height,
-            "origin_width": width,
-        }
+        Parameters
+        ----------
+        indices: list[int]
+            indices of the images
 
-        return img, target
+        Returns
+        -------
+        samples: list[tuple[torch.Tensor, dict]]
+            image and target of each index
+        """
+        start = time.perf_counter()
+        indices = [int(index) for index in indices]
+        prefetcher = self.get_prefetcher()
+        if prefetcher is not None:
+            images = [prefetcher.fetch(index) for index in indices]
+        elif len(indices) > 1 and self.num_decode_threads > 0:
+            executor = self._get_executor()
+            images = [
+                executor.submit(self._read_image_of_index, index) for index in indices
+            ]
+        else:
+            images = [self._read_image_of_index(index) for index in indices]
+        windows = None
+        if self.crop_size is not None:
+            windows = [self._choose_window(index) for index in indices]
+        with self._stage("annotations"):
+            anns_list = self.get_annotations_batch(indices)
+        masks_list = self._load_masks(indices, anns_list, windows)
+        samples = [
+            self._make_sample(
+                index,
+                self._wait_image(img),
+                masks,
+                None if windows is None else windows[i],
+            )
+            for i, (index, img, masks) in enumerate(zip(indices, images, masks_list))
+        ]
+        if self.profiler is not None:
+            self.profiler.record(
+                "samples", time.perf_counter() - start, calls=len(indices)
+            )
+        return samples
 
     def __len__(self) -> int:
         return len(self.ids)
+
+    def _mask_width(self) -> int | None:
+        """get the width of the masks of every sample, None if it depends on the image."""
+        if self.target_size is not None:
+            return self.target_size[1]
+        return None
+
+    def get_collate_fn(self, dense: bool = True, device: torch.device | str = None):
+        """
+        get a collate function for DataLoader that expands the masks of the whole batch
+        from the target format to dense float32 masks.
+
+        Parameters
+        ----------
+        dense: bool
+            expand the masks to dense float32 masks
+        device: torch.device | str
+            device to expand the masks on. None keeps the masks on the CPU.
+
+        Returns
+        -------
+        collate_fn: Callable
+            collate function
+        """
+        return partial(
+            collate_semantic_segmentation,
+            target_format=self.target_format,
+            num_categories=len(self.category_ids),
+            dense=dense,
+            width=self._mask_width(),
+            device=device,
+        )
+
+    def expand_masks(self, target: dict, device: torch.device | str = None) -> dict:
+        """
+        expand the masks of a batch collated with `get_collate_fn(dense=False)` to dense
+        float32 masks. The masks are moved to the device before they are expanded.
+
+        Parameters
+        ----------
+        target: dict
+            batched target
+        device: torch.device | str
+            device to expand the masks on. None keeps the masks on the CPU.
+
+        Returns
+        -------
+        target: dict
+            the target with the expanded masks
+        """
+        return expand_batch_masks(
+            target,
+            self.target_format,
+            len(self.category_ids),
+            width=self._mask_width(),
+            device=device,
+        )
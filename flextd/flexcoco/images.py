@@ -0,0 +1,40 @@
+import numpy as np
+import torch
+from PIL import Image
+
+# modes that read_image returns unchanged: gray, gray + alpha, RGB and RGBA
+_KEPT_MODES = ("L", "LA", "RGB", "RGBA")
+
+
+def read_image_resized(path: str, size: tuple[int, int]) -> torch.Tensor:
+    """
+    read an image resized to a target size.
+    JPEG images are decoded at the smallest of 1/1, 1/2, 1/4 and 1/8 of their size that
+    still covers the target size (reduced-size DCT decoding), so the decoding time and
+    memory scale with the target size rather than with the source size.
+    The image is then resized with bilinear filtering.
+
+    Parameters
+    ----------
+    path: str
+        path to the image
+    size: tuple[int, int]
+        (height, width) of the image to return
+
+    Returns
+    -------
+    img: torch.Tensor
+        uint8 tensor of shape (channels, height, width)
+    """
+    height, width = size
+    with Image.open(path) as image:
+        if image.format == "JPEG":
+            image.draft(image.mode, (width, height))
+        if image.mode not in _KEPT_MODES:
+            image = image.convert("RGB")
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.Resampling.BILINEAR)
+        pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    return torch.from_numpy(pixels.transpose(2, 0, 1).copy())
@@ -0,0 +1,285 @@
+import importlib
+import json
+import os
+from typing import Callable, NamedTuple
+
+# faster json libraries in the order they are preferred, stdlib json is the fallback
+BACKEND_NAMES = ("orjson", "msgspec", "ujson", "json")
+# environment variable that selects the backend, e.g. FLEXTD_JSON_BACKEND=json
+BACKEND_ENV = "FLEXTD_JSON_BACKEND"
+
+
+class JsonBackend(NamedTuple):
+    """functions of a json library"""
+
+    name: str
+    # parse str or bytes
+    loads: Callable[[str | bytes], object]
+    # serialize to utf-8 bytes
+    dumps: Callable[[object], bytes]
+
+
+def _stdlib_backend() -> JsonBackend:
+    return JsonBackend("json", json.loads, lambda obj: json.dumps(obj).encode())
+
+
+def _make_backend(name: str) -> JsonBackend:
+    """create the backend of a json library. ImportError if it is not installed."""
+    if name == "json":
+        return _stdlib_backend()
+    module = importlib.import_module(name)
+    if name == "orjson":
+        # numpy values and integer keys are serialized like the stdlib would
+        option = module.OPT_SERIALIZE_NUMPY | module.OPT_NON_STR_KEYS
+        return JsonBackend(
+            name, module.loads, lambda obj: module.dumps(obj, option=option)
+        )
+    if name == "msgspec":
+        return JsonBackend(name, module.json.decode, module.json.encode)
+    if name == "ujson":
+        return JsonBackend(
+            name,
+            module.loads,
+            lambda obj: module.dumps(obj, ensure_ascii=False).encode(),
+        )
+    raise ValueError(f"unknown json backend {name!r}, expected one of {BACKEND_NAMES}")
+
+
+def _default_backend() -> JsonBackend:
+    name = os.environ.get(BACKEND_ENV)
+    if name:
+        return _make_backend(name)
+    for name in BACKEND_NAMES:
+        try:
+            return _make_backend(name)
+        except ImportError:
+            continue
+    return _stdlib_backend()
+
+
+_backend = _default_backend()
+
+
+def get_json_backend() -> JsonBackend:
+    """get the json backend used to read and write annotation files."""
+    return _backend
+
+
+def set_json_backend(name: str = None) -> JsonBackend:
+    """
+    select the json backend used to read and write annotation files.
+
+    Parameters
+    ----------
+    name: str
+        one of "orjson", "msgspec", "ujson" and "json". None selects the fastest
+        installed library.
+
+    Returns
+    -------
+    backend: JsonBackend
+        selected backend
+    """
+    global _backend
+    if name is None:
+        _backend = _default_backend()
+    else:
+        _backend = _make_backend(name)
+    return _backend
+
+
+def loads(data: str | bytes):
+    """parse a json document with the selected backend."""
+    return _backend.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """serialize an object to utf-8 json with the selected backend."""
+    return _backend.dumps(obj)
+
+
+def load_json(path: str):
+    """
+    read a json file with the selected backend.
+
+    Parameters
+    ----------
+    path: str
+        path to the json file
+
+    Returns
+    -------
+    obj:
+        parsed document
+    """
+    if _backend.name == "json":
+        with open(path) as f:
+            return json.load(f)
+    with open(path, "rb") as f:
+        return _backend.loads(f.read())
+
+
+def dump_json(obj, path: str):
+    """
+    write an object to a json file with the selected backend.
+
+    Parameters
+    ----------
+    obj:
+        object to serialize
+    path: str
+        path to the json file
+    """
+    if _backend.name == "json":
+        # the stdlib writes in chunks instead of building the whole document
+        with open(path, "w") as f:
+            json.dump(obj, f)
+        return
+    with open(path, "wb") as f:
+        f.write(_backend.dumps(obj))
+
+
+class ImageEntry(NamedTuple):
+    """image of an annotation file without unused fields"""
+
+    id: int
+    file_name: str
+    height: int
+    width: int
+
+
+class AnnotationEntry(NamedTuple):
+    """annotation of an annotation file without the segmentation"""
+
+    id: int
+    image_id: int
+    category_id: int
+    area: float = 0.0
+    iscrowd: int = 0
+    bbox: list[float] = None
+
+
+class CategoryEntry(NamedTuple):
+    """category of an annotation file"""
+
+    id: int
+    name: str
+    supercategory: str = ""
+
+
+class AnnotationIndex(NamedTuple):
+    """images, annotations and categories of an annotation file as typed records"""
+
+    images: list[ImageEntry]
+    annotations: list[AnnotationEntry]
+    categories: list[CategoryEntry]
+
+
+_index_decoder = None
+
+
+def _get_index_decoder():
+    """create the msgspec decoder of the records, which skips all other fields."""
+    global _index_decoder
+    if _index_decoder is None:
+        import msgspec
+
+        class Image(msgspec.Struct):
+            id: int
+            file_name: str
+            height: int
+            width: int
+
+        class Annotation(msgspec.Struct):
+            id: int
+            image_id: int
+            category_id: int
+            area: float = 0.0
+            iscrowd: int = 0
+            bbox: list[float] | None = None
+
+        class Category(msgspec.Struct):
+            id: int
+            name: str
+            supercategory: str = ""
+
+        class Index(msgspec.Struct):
+            images: list[Image] = []
+            annotations: list[Annotation] = []
+            categories: list[Category] = []
+
+        _index_decoder = msgspec.json.Decoder(Index)
+    return _index_decoder
+
+
+def load_annotation_index(path: str) -> AnnotationIndex:
+    """
+    read the images, annotations and categories of an annotation file as typed records
+    without the segmentation and other unused fields, e.g. to filter or count by ids
+    and names.
+    When msgspec is installed the unused fields are skipped while parsing, otherwise the
+    file is parsed with the selected backend and the records are taken from it.
+
+    Parameters
+    ----------
+    path: str
+        path to the annotation file
+
+    Returns
+    -------
+    index: AnnotationIndex
+        images, annotations and categories
+    """
+    try:
+        decoder = _get_index_decoder()
+    except ImportError:
+        decoder = None
+    if decoder is not None:
+        with open(path, "rb") as f:
+            index = decoder.decode(f.read())
+        return AnnotationIndex(
+            [
+                ImageEntry(image.id, image.file_name, image.height, image.width)
+                for image in index.images
+            ],
+            [
+                AnnotationEntry(
+                    ann.id,
+                    ann.image_id,
+                    ann.category_id,
+                    ann.area,
+                    ann.iscrowd,
+                    ann.bbox,
+                )
+                for ann in index.annotations
+            ],
+            [
+                CategoryEntry(category.id, category.name, category.supercategory)
+                for category in index.categories
+            ],
+        )
+
+    annotation_dict = load_json(path)
+    return AnnotationIndex(
+        [
+            ImageEntry(image["id"], image["file_name"], image["height"], image["width"])
+            for image in annotation_dict.get("images", [])
+        ],
+        [
+            AnnotationEntry(
+                ann["id"],
+                ann["image_id"],
+                ann["category_id"],
+                ann.get("area", 0.0),
+                ann.get("iscrowd", 0),
+                ann.get("bbox"),
+            )
+            for ann in annotation_dict.get("annotations", [])
+        ],
+        [
+            CategoryEntry(
+                category["id"], category["name"], category.get("supercategory", "")
+            )
+            for category in annotation_dict.get("categories", [])
+        ],
+    )
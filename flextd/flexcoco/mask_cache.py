@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pycocotools import mask as mask_utils
+
+from flextd.flexcoco.masks import rasterize_category_masks
+
+
+def encode_category_masks(masks: np.ndarray) -> dict[str, str]:
+    """
+    encode category masks as one compressed RLE per non-empty category.
+
+    Parameters
+    ----------
+    masks: np.ndarray
+        boolean array of shape (num_categories, height, width)
+
+    Returns
+    -------
+    encoded: dict[str, str]
+        dictionary of mask index and RLE counts, which can be serialized as json
+    """
+    channels = np.flatnonzero(masks.reshape(len(masks), -1).any(axis=1))
+    encoded = {}
+    if len(channels):
+        fortran_masks = np.asfortranarray(
+            masks[channels].transpose(1, 2, 0).astype(np.uint8)
+        )
+        for channel, rle in zip(channels, mask_utils.encode(fortran_masks)):
+            encoded[str(channel)] = rle["counts"].decode()
+    return encoded
+
+
+def decode_category_masks(
+    encoded: dict[str, str], num_categories: int, height: int, width: int
+) -> np.ndarray:
+    """
+    decode category masks encoded by `encode_category_masks`.
+
+    Parameters
+    ----------
+    encoded: dict[str, str]
+        dictionary of mask index and RLE counts
+    num_categories: int
+        number of categories
+    height: int
+        height of the masks
+    width: int
+        width of the masks
+
+    Returns
+    -------
+    masks: np.ndarray
+        boolean array of shape (num_categories, height, width)
+    """
+    masks = np.zeros((num_categories, height, width), dtype=bool)
+    if encoded:
+        channels = [int(channel) for channel in encoded]
+        rles = [
+            {"size": [height, width], "counts": counts.encode()}
+            for counts in encoded.values()
+        ]
+        # decode returns (height, width, n)
+        masks[channels] = mask_utils.decode(rles).transpose(2, 0, 1)
+    return masks
+
+
+class SemanticMaskCache:
+    """
+    On-disk cache of the category masks of semantic segmentation.
+
+    The masks of an image are stored as one compressed RLE per non-empty category in
+    `<cache_dir>/<category key>/<image id>.json`, where the category key is a hash of
+    the category ids in channel order and of the mask size when it is fixed. An entry
+    also records the annotation ids it was built from and is ignored when they no
+    longer match.
+
+    Attributes
+    ----------
+    cache_dir: str
+        path to the cache directory of the category set
+    category_ids: list[int]
+        category id of each mask channel
+    mask_size: tuple[int, int] | None
+        (height, width) of all masks, or None for the size of each image
+    """
+
+    def __init__(
+        self, cache_dir: str, category_ids: list[int], mask_size: tuple[int, int] = None
+    ):
+        self.category_ids = [int(category_id) for category_id in category_ids]
+        self.mask_size = None if mask_size is None else tuple(map(int, mask_size))
+        key = self.category_ids
+        if self.mask_size is not None:
+            key = {"category_ids": self.category_ids, "mask_size": self.mask_size}
+        category_key = hashlib.sha256(json.dumps(key).encode())
+        self.cache_dir = os.path.join(str(cache_dir), category_key.hexdigest()[:16])
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, image_id: int) -> str:
+        """get the path of the cache entry of an image."""
+        return os.path.join(self.cache_dir, f"{image_id}.json")
+
+    def load(self, image_id: int, ann_ids: list[int]) -> np.ndarray | None:
+        """
+        load the category masks of an image.
+
+        Parameters
+        ----------
+        image_id: int
+            id of the image
+        ann_ids: list[int]
+            ids of the annotations of the image
+
+        Returns
+        -------
+        masks: np.ndarray | None
+            boolean array of shape (num_categories, height, width), or None if the
+            image is not cached or its annotations changed
+        """
+        try:
+            with open(self.path(image_id)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry["ann_ids"] != [int(ann_id) for ann_id in ann_ids]:
+            return None
+
+        return decode_category_masks(
+            entry["masks"], len(self.category_ids), entry["height"], entry["width"]
+        )
+
+    def save(self, image_id: int, ann_ids: list[int], masks: np.ndarray):
+        """
+        save the category masks of an image.
+
+        Parameters
+        ----------
+        image_id: int
+            id of the image
+        ann_ids: list[int]
+            ids of the annotations of the image
+        masks: np.ndarray
+            boolean array of shape (num_categories, height, width)
+        """
+        _, height, width = masks.shape
+        entry = {
+            "height": height,
+            "width": width,
+            "ann_ids": [int(ann_id) for ann_id in ann_ids],
+            "masks": encode_category_masks(masks),
+        }
+        path = self.path(image_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def build(self, items: list[tuple], num_workers: int = None, chunk_size: int = 64):
+        """
+        rasterize and save the masks of many images, in parallel across processes.
+
+        Parameters
+        ----------
+        items: list[tuple]
+            tuples of (image id, height, width, annotations) to cache
+        num_workers: int
+            number of worker processes. 0 builds the cache in the current process.
+        chunk_size: int
+            number of images sent to a worker at once
+        """
+        cat_id2idx = {category_id: i for i, category_id in enumerate(self.category_ids)}
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+        if num_workers == 0:
+            for chunk in chunks:
+                _build_entries(self, cat_id2idx, chunk)
+            return
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [
+                executor.submit(_build_entries, self, cat_id2idx, chunk)
+                for chunk in chunks
+            ]
+            for future in futures:
+                future.result()
+
+
+def _build_entries(cache: SemanticMaskCache, cat_id2idx: dict, items: list[tuple]):
+    for image_id, height, width, anns in items:
+        masks = rasterize_category_masks(
+            anns, height, width, cat_id2idx, output_size=cache.mask_size
+        )
+        cache.save(image_id, [ann["id"] for ann in anns], masks)
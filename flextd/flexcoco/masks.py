@@ -0,0 +1,612 @@
+import numpy as np
+import torch
+from pycocotools import mask as mask_utils
+from torch.utils.data import default_collate
+
+# dense: float32 (num_categories, height, width)
+# bool, uint8: multi-hot (num_categories, height, width)
+# label_map: (height, width) with 0 as background and channel + 1 as label.
+#   where categories overlap, the category with the larger channel wins.
+# packed: uint8 (num_categories, height, ceil(width / 8)) with 8 pixels per byte
+# rle: {"size": [height, width], "counts": compressed RLE bytes of each category}.
+#   the runs are in row-major order, so the counts are not those of COCO RLE.
+TARGET_FORMATS = ("dense", "bool", "uint8", "label_map", "packed", "rle")
+
+
+def ann_to_rle(ann: dict, height: int, width: int) -> dict:
+    """
+    convert the segmentation of an annotation to RLE, like COCO.annToRLE.
+
+    Parameters
+    ----------
+    ann: dict
+        COCO annotation
+    height: int
+        height of the image
+    width: int
+        width of the image
+
+    Returns
+    -------
+    rle: dict
+        compressed RLE of the annotation
+    """
+    segm = ann["segmentation"]
+    if isinstance(segm, list):
+        # polygon -- a single object might consist of multiple parts
+        rles = mask_utils.frPyObjects(segm, height, width)
+        return mask_utils.merge(rles)
+    if isinstance(segm["counts"], list):
+        # uncompressed RLE
+        return mask_utils.frPyObjects(segm, height, width)
+    return segm
+
+
+def rasterize_category_masks(
+    anns: list[dict],
+    height: int,
+    width: int,
+    cat_id2idx: dict[int, int],
+    output_size: tuple[int, int] = None,
+) -> np.ndarray:
+    """
+    rasterize annotations into one mask per category.
+
+    The masks are merged in the RLE domain: the polygons of all annotations are
+    converted in one call, the RLEs of each category are merged into their union and
+    each category is decoded once, so only one full-size array is allocated per
+    category instead of two per annotation.
+
+    Parameters
+    ----------
+    anns: list[dict]
+        COCO annotations of an image
+    height: int
+        height of the image
+    width: int
+        width of the image
+    cat_id2idx: dict[int, int]
+        dictionary of category id and mask index
+    output_size: tuple[int, int]
+        (height, width) of the masks. None is the size of the image.
+
+    Returns
+    -------
+    masks: np.ndarray
+        boolean array of shape (num_categories, height, width)
+    """
+    output_sizes = None if output_size is None else [output_size]
+    return rasterize_category_masks_batch(
+        [anns], [height], [width], cat_id2idx, output_sizes=output_sizes
+    )[0]
+
+
+def resize_rle(rle: dict, height: int, width: int) -> dict:
+    """
+    resize an RLE mask with nearest neighbour sampling, like
+    torch.nn.functional.interpolate(mode="nearest").
+
+    Parameters
+    ----------
+    rle: dict
+        compressed RLE
+    height: int
+        height of the resized mask
+    width: int
+        width of the resized mask
+
+    Returns
+    -------
+    rle: dict
+        compressed RLE of the resized mask
+    """
+    source_height, source_width = rle["size"]
+    if (source_height, source_width) == (height, width):
+        return rle
+    rows = np.arange(height) * source_height // height
+    cols = np.arange(width) * source_width // width
+    mask = mask_utils.decode(rle)[np.ix_(rows, cols)]
+    return mask_utils.encode(np.asfortranarray(mask))
+
+
+def scale_polygon(polygon: list[float], scale_x: float, scale_y: float) -> np.ndarray:
+    """scale the coordinates of a flat polygon [x1, y1, x2, y2, ...]."""
+    polygon = np.array(polygon, dtype=np.float64)
+    polygon[0::2] *= scale_x
+    polygon[1::2] *= scale_y
+    return polygon
+
+
+def polygon_boundary(polygon: list[float]) -> np.ndarray:
+    """
+    trace the boundary of a polygon on the 5x upsampled pixel grid in the same way as
+    pycocotools (rleFrPoly), including its rounding.
+
+    Parameters
+    ----------
+    polygon: list[float]
+        flat polygon [x1, y1, x2, y2, ...]
+
+    Returns
+    -------
+    points: np.ndarray
+        int64 array of shape (n, 2) with the upsampled (x, y) of the boundary points,
+        without consecutive duplicates
+    """
+    xy = np.asarray(polygon, dtype=np.float64)
+    xy = xy[: len(xy) // 2 * 2].reshape(-1, 2)
+    # (int) casts of C truncate toward zero
+    vertices = np.trunc(5 * xy + 0.5).astype(np.int64)
+    xs, ys = vertices[:, 0], vertices[:, 1]
+    xe, ye = np.roll(xs, -1), np.roll(ys, -1)
+    dx, dy = np.abs(xe - xs), np.abs(ye - ys)
+    # zero-length edges add no boundary crossing
+    edges = (dx > 0) | (dy > 0)
+    if not edges.any():
+        return vertices[:1]
+    xs, ys, xe, ye, dx, dy = (v[edges] for v in (xs, ys, xe, ye, dx, dy))
+    horizontal = dx >= dy
+    flip = (horizontal & (xs > xe)) | (~horizontal & (ys > ye))
+    xs, xe = np.where(flip, xe, xs), np.where(flip, xs, xe)
+    ys, ye = np.where(flip, ye, ys), np.where(flip, ys, ye)
+    slope = np.where(
+        horizontal,
+        (ye - ys) / np.maximum(dx, 1),
+        (xe - xs) / np.maximum(dy, 1),
+    )
+    steps = np.maximum(dx, dy)
+    edge = np.repeat(np.arange(len(steps)), steps + 1)
+    d = np.arange(len(edge)) - np.repeat(np.cumsum(steps + 1) - steps - 1, steps + 1)
+    t = np.where(flip[edge], steps[edge] - d, d)
+    start = np.where(horizontal, ys, xs)[edge].astype(np.float64)
+    horizontal = horizontal[edge]
+    interpolated = np.trunc(start + slope[edge] * t + 0.5).astype(np.int64)
+    u = np.where(horizontal, t + xs[edge], interpolated)
+    v = np.where(horizontal, interpolated, t + ys[edge])
+    points = np.stack([u, v], axis=1)
+    distinct = np.concatenate([[True], (points[1:] != points[:-1]).any(axis=1)])
+    points = points[distinct]
+    if len(points) > 1 and (points[-1] == points[0]).all():
+        points = points[:-1]
+    return points
+
+
+def _window_polygon(
+    polygon: list[float], top: int, left: int
+) -> tuple[np.ndarray | None, tuple[int, int]]:
+    """
+    translate a polygon so that it is rasterized the same as in the full image.
+    The boundary points are passed instead of the vertices, so every edge is one step
+    long and is traced without rounding. The origin of the frame is moved to the
+    window unless the polygon extends left of or above it, so no coordinate becomes
+    negative.
+
+    Returns
+    -------
+    polygon: np.ndarray | None
+        flat polygon in the frame, or None if it covers no pixel
+    origin: tuple[int, int]
+        (y, x) of the origin of the frame in the image
+    """
+    points = polygon_boundary(polygon)
+    if len(points) == 1:
+        return None, (0, 0)
+    if len(points) == 2:
+        # frPyObjects reads two points as a box
+        points = np.concatenate([points, points[:1]])
+    origin = []
+    for axis, start in ((1, top), (0, left)):
+        low = int(points[:, axis].min())
+        origin.append(min(start, low // 5) if low >= 0 else 0)
+    points = points - [5 * origin[1], 5 * origin[0]]
+    # pycocotools computes (int)(5 * x + 0.5), which rounds negative values up
+    values = np.where(points < 0, points - 0.7, points) / 5
+    return values.ravel(), tuple(origin)
+
+
+def _bbox_intersects(bbox: list[float] | None, window: tuple[int, int, int, int]):
+    if not bbox:
+        return True
+    top, left, height, width = window
+    x, y, w, h = bbox
+    return x <= left + width and x + w >= left and y <= top + height and y + h >= top
+
+
+def rasterize_window(
+    anns: list[dict],
+    height: int,
+    width: int,
+    cat_id2idx: dict[int, int],
+    window: tuple[int, int, int, int],
+) -> np.ndarray:
+    """
+    rasterize annotations into one mask per category inside a window of the image.
+    The result is the same as rasterizing the whole image and cropping the window, but
+    annotations whose bbox does not intersect the window are skipped and polygons are
+    rasterized only from the window (or their own top-left corner) to the window end.
+
+    Parameters
+    ----------
+    anns: list[dict]
+        COCO annotations of an image
+    height: int
+        height of the image
+    width: int
+        width of the image
+    cat_id2idx: dict[int, int]
+        dictionary of category id and mask index
+    window: tuple[int, int, int, int]
+        (top, left, height, width) of the window
+
+    Returns
+    -------
+    masks: np.ndarray
+        boolean array of shape (num_categories, window height, window width)
+    """
+    top, left, window_height, window_width = window
+    bottom, right = top + window_height, left + window_width
+    masks = np.zeros((len(cat_id2idx), window_height, window_width), dtype=bool)
+    # origin of the frame -> polygons and their mask indices
+    frames = {}
+    for ann in anns:
+        if not _bbox_intersects(ann.get("bbox"), window):
+            continue
+        index_of_cat = cat_id2idx[int(ann["category_id"])]
+        segm = ann["segmentation"]
+        if isinstance(segm, list) and all(len(polygon) > 4 for polygon in segm):
+            for polygon in segm:
+                polygon, origin = _window_polygon(polygon, top, left)
+                if polygon is not None:
+                    polygons, owners = frames.setdefault(origin, ([], []))
+                    polygons.append(polygon)
+                    owners.append(index_of_cat)
+        else:
+            mask = mask_utils.decode(ann_to_rle(ann, height, width))
+            masks[index_of_cat] |= mask[top:bottom, left:right].astype(bool)
+    for (y, x), (polygons, owners) in frames.items():
+        rles = mask_utils.frPyObjects(polygons, bottom - y, right - x)
+        category_rles = {}
+        for index_of_cat, rle in zip(owners, rles):
+            category_rles.setdefault(index_of_cat, []).append(rle)
+        channels = list(category_rles)
+        merged = [
+            rles[0] if len(rles) == 1 else mask_utils.merge(rles, intersect=0)
+            for rles in category_rles.values()
+        ]
+        # decode returns (height, width, n)
+        decoded = mask_utils.decode(merged)[top - y :, left - x :]
+        masks[channels] |= decoded.transpose(2, 0, 1).astype(bool)
+    return masks
+
+
+def rasterize_category_masks_batch(
+    anns_list: list[list[dict]],
+    heights: list[int],
+    widths: list[int],
+    cat_id2idx: dict[int, int],
+    output_sizes: list[tuple[int, int]] = None,
+    windows: list[tuple[int, int, int, int]] = None,
+) -> list[np.ndarray]:
+    """
+    rasterize the annotations of several images into one mask per category and image.
+    The polygons of all images of the same output size are converted in one call.
+    When an output size differs from the image size, the polygons are scaled before
+    they are rasterized at the output size and RLE masks are resized with nearest
+    neighbour sampling, so no full-size mask is allocated.
+
+    Parameters
+    ----------
+    anns_list: list[list[dict]]
+        COCO annotations of each image
+    heights: list[int]
+        height of each image
+    widths: list[int]
+        width of each image
+    cat_id2idx: dict[int, int]
+        dictionary of category id and mask index
+    output_sizes: list[tuple[int, int]]
+        (height, width) of the masks of each image. None is the size of the images.
+    windows: list[tuple[int, int, int, int]]
+        (top, left, height, width) of the window of each image to rasterize, see
+        `rasterize_window`. Cannot be combined with output_sizes.
+
+    Returns
+    -------
+    masks_list: list[np.ndarray]
+        boolean arrays of shape (num_categories, height, width) of each image
+    """
+    if windows is not None:
+        if output_sizes is not None:
+            raise ValueError("windows cannot be combined with output_sizes")
+        return [
+            rasterize_window(anns, height, width, cat_id2idx, window)
+            for anns, height, width, window in zip(anns_list, heights, widths, windows)
+        ]
+    if output_sizes is None:
+        output_sizes = list(zip(heights, widths))
+    # per image: mask index -> RLEs of the category
+    category_rles = [{} for _ in anns_list]
+    # (height, width) -> polygons and their (image, mask index)
+    polygon_groups = {}
+    for i, anns in enumerate(anns_list):
+        height, width = heights[i], widths[i]
+        output_height, output_width = output_sizes[i]
+        scaled = (output_height, output_width) != (height, width)
+        for ann in anns:
+            index_of_cat = cat_id2idx[int(ann["category_id"])]
+            segm = ann["segmentation"]
+            # frPyObjects treats a list whose first element has 4 values as boxes,
+            # so such polygons are converted per annotation as COCO.annToRLE does
+            if isinstance(segm, list) and all(len(polygon) > 4 for polygon in segm):
+                if scaled:
+                    segm = [
+                        scale_polygon(
+                            polygon, output_width / width, output_height / height
+                        )
+                        for polygon in segm
+                    ]
+                polygons, owners = polygon_groups.setdefault(
+                    (output_height, output_width), ([], [])
+                )
+                polygons.extend(segm)
+                owners.extend([(i, index_of_cat)] * len(segm))
+            else:
+                rle = ann_to_rle(ann, height, width)
+                if scaled:
+                    rle = resize_rle(rle, output_height, output_width)
+                category_rles[i].setdefault(index_of_cat, []).append(rle)
+    for (height, width), (polygons, owners) in polygon_groups.items():
+        rles = mask_utils.frPyObjects(polygons, height, width)
+        for (i, index_of_cat), rle in zip(owners, rles):
+            category_rles[i].setdefault(index_of_cat, []).append(rle)
+
+    masks_list = []
+    for rles_of_image, (height, width) in zip(category_rles, output_sizes):
+        masks = np.zeros(shape=(len(cat_id2idx), height, width), dtype=bool)
+        if rles_of_image:
+            channels = list(rles_of_image)
+            merged = [
+                rles[0] if len(rles) == 1 else mask_utils.merge(rles, intersect=0)
+                for rles in rles_of_image.values()
+            ]
+            # decode returns (height, width, n)
+            masks[channels] = mask_utils.decode(merged).transpose(2, 0, 1)
+        masks_list.append(masks)
+    return masks_list
+
+
+def label_map_dtype(num_categories: int) -> torch.dtype:
+    """get the smallest integer dtype of a label map."""
+    if num_categories < 256:
+        return torch.uint8
+    if num_categories < 32768:
+        return torch.int16
+    return torch.int32
+
+
+def format_masks(
+    masks: np.ndarray, target_format: str = "dense"
+) -> torch.Tensor | dict:
+    """
+    convert boolean category masks to a target format.
+
+    Parameters
+    ----------
+    masks: np.ndarray
+        boolean array of shape (num_categories, height, width)
+    target_format: str
+        one of TARGET_FORMATS
+
+    Returns
+    -------
+    masks: torch.Tensor | dict
+        masks in the target format. a dictionary for the rle format.
+    """
+    if target_format == "dense":
+        return torch.from_numpy(masks.astype(np.float32))
+    if target_format == "bool":
+        return torch.from_numpy(masks)
+    if target_format == "uint8":
+        return torch.from_numpy(masks.view(np.uint8))
+    if target_format == "label_map":
+        dtype = label_map_dtype(len(masks))
+        label_map = torch.zeros(masks.shape[1:], dtype=dtype)
+        for channel, mask in enumerate(masks):
+            label_map[torch.from_numpy(mask)] = channel + 1
+        return label_map
+    if target_format == "packed":
+        return torch.from_numpy(np.packbits(masks, axis=-1))
+    if target_format == "rle":
+        _, height, width = masks.shape
+        # (num_categories, height, width) in C order is (width, height, num_categories)
+        # in Fortran order, which pycocotools encodes without a copy
+        transposed = np.ascontiguousarray(masks).view(np.uint8).transpose(2, 1, 0)
+        rles = mask_utils.encode(transposed) if len(masks) else []
+        return {"size": [height, width], "counts": [rle["counts"] for rle in rles]}
+    raise ValueError(
+        f"unknown target_format {target_format!r}, expected one of {TARGET_FORMATS}"
+    )
+
+
+def decode_rle_masks(masks: list[dict]) -> torch.Tensor:
+    """
+    decode a batch of masks of the rle format at once.
+
+    Parameters
+    ----------
+    masks: list[dict]
+        masks of the samples in the rle format, all of the same size
+
+    Returns
+    -------
+    masks: torch.Tensor
+        uint8 tensor of shape (batch_size, num_categories, height, width)
+    """
+    if not masks:
+        raise ValueError("no masks to decode")
+    height, width = masks[0]["size"]
+    num_categories = len(masks[0]["counts"])
+    if any(sample["size"] != [height, width] for sample in masks):
+        raise ValueError("the masks of a batch must have the same size")
+    rles = [
+        {"size": [width, height], "counts": counts}
+        for sample in masks
+        for counts in sample["counts"]
+    ]
+    if not rles:
+        return torch.zeros(
+            (len(masks), num_categories, height, width), dtype=torch.uint8
+        )
+    # decode returns (width, height, n) in Fortran order, (n, height, width) in C order
+    decoded = mask_utils.decode(rles).transpose(2, 1, 0)
+    return torch.from_numpy(decoded).view(len(masks), num_categories, height, width)
+
+
+def masks_to_dense(
+    masks: torch.Tensor | list[dict],
+    target_format: str,
+    num_categories: int,
+    width: int = None,
+    device: torch.device | str = None,
+) -> torch.Tensor:
+    """
+    expand masks of a target format to dense float32 masks.
+    The leading batch dimensions are kept.
+    With device, the masks are moved in the target format and expanded on the device,
+    so only the compact masks are copied.
+
+    Parameters
+    ----------
+    masks: torch.Tensor | list[dict]
+        masks in the target format. a list of the masks of the samples for the rle
+        format.
+    target_format: str
+        one of TARGET_FORMATS
+    num_categories: int
+        number of categories
+    width: int
+        width of the masks. required for the packed format.
+    device: torch.device | str
+        device to expand the masks on. None keeps the device of the masks.
+
+    Returns
+    -------
+    masks: torch.Tensor
+        float32 tensor of shape (..., num_categories, height, width)
+    """
+    if target_format == "rle":
+        masks = decode_rle_masks(masks)
+    elif target_format not in TARGET_FORMATS:
+        raise ValueError(
+            f"unknown target_format {target_format!r}, expected one of {TARGET_FORMATS}"
+        )
+    if target_format == "packed" and width is None:
+        raise ValueError("width is required to unpack packed masks")
+    if device is not None:
+        masks = masks.to(device, non_blocking=True)
+    if target_format in ("dense", "bool", "uint8", "rle"):
+        return masks.to(torch.float32)
+    if target_format == "label_map":
+        labels = torch.arange(1, num_categories + 1, device=masks.device)
+        labels = labels.view(num_categories, 1, 1)
+        return (masks.unsqueeze(-3).to(torch.int64) == labels).to(torch.float32)
+    # packed
+    shifts = torch.arange(7, -1, -1, device=masks.device, dtype=torch.uint8)
+    bits = (masks.unsqueeze(-1) >> shifts) & 1
+    bits = bits.flatten(-2)[..., :width]
+    return bits.to(torch.float32)
+
+
+def expand_batch_masks(
+    target: dict,
+    target_format: str,
+    num_categories: int = None,
+    width: int = None,
+    device: torch.device | str = None,
+) -> dict:
+    """
+    expand the masks of a batched target to dense float32 masks.
+    Use it in the main process on the batches of a DataLoader whose workers collate
+    with `dense=False`, so that only the compact masks are sent between processes.
+
+    Parameters
+    ----------
+    target: dict
+        batched target of FlexCocoDatasetBaseSS
+    target_format: str
+        target format of the masks
+    num_categories: int
+        number of categories. required for the label_map format.
+    width: int
+        width of the masks. None is the width of the crop, or the original width of
+        the images.
+    device: torch.device | str
+        device to expand the masks on. None keeps the device of the masks.
+
+    Returns
+    -------
+    target: dict
+        the target with the expanded masks
+    """
+    if width is None and target_format == "packed":
+        if "crop" in target:
+            # default_collate turns (top, left, height, width) into 4 tensors
+            width = int(target["crop"][3][0])
+        else:
+            # packed masks are never transformed, so they have the original width
+            width = int(target["origin_width"][0])
+    target["masks"] = masks_to_dense(
+        target["masks"], target_format, num_categories, width=width, device=device
+    )
+    return target
+
+
+def collate_semantic_segmentation(
+    batch: list[tuple[torch.Tensor, dict]],
+    target_format: str = "dense",
+    num_categories: int = None,
+    dense: bool = True,
+    width: int = None,
+    device: torch.device | str = None,
+) -> tuple:
+    """
+    collate samples of FlexCocoDatasetBaseSS and expand the masks of the whole batch at
+    once. The masks of the samples must have the same size.
+    Masks of the rle format stay a list of the masks of the samples when they are not
+    expanded.
+
+    Parameters
+    ----------
+    batch: list[tuple[torch.Tensor, dict]]
+        samples of FlexCocoDatasetBaseSS
+    target_format: str
+        target format of the samples
+    num_categories: int
+        number of categories. required for the label_map format.
+    dense: bool
+        expand the masks to dense float32 masks
+    width: int
+        width of the masks. None is the width of the crop, or the original width of
+        the images.
+    device: torch.device | str
+        device to expand the masks on. None keeps the masks on the CPU.
+
+    Returns
+    -------
+    img: torch.Tensor
+        batched images
+    target: dict
+        batched targets
+    """
+    if target_format == "rle":
+        masks = [target["masks"] for _, target in batch]
+        batch = [
+            (img, {key: value for key, value in target.items() if key != "masks"})
+            for img, target in batch
+        ]
+    img, target = default_collate(batch)
+    if target_format == "rle":
+        target["masks"] = masks
+    if dense:
+        expand_batch_masks(target, target_format, num_categories, width, device)
+    return img, target
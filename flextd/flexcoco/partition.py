@@ -0,0 +1,150 @@
+import math
+from typing import Iterator
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+
+def partition_indices(
+    num_images: int, rank: int, world_size: int, seed: int = 0
+) -> np.ndarray:
+    """
+    get the indices of the images that belong to a rank.
+    The images are assigned by a permutation that depends only on the seed, so every
+    rank computes the same assignment and the partitions do not overlap.
+
+    Parameters
+    ----------
+    num_images: int
+        number of images of all ranks
+    rank: int
+        rank of the process
+    world_size: int
+        number of processes
+    seed: int
+        seed of the assignment
+
+    Returns
+    -------
+    indices: np.ndarray
+        ascending indices of the images of the rank
+    """
+    if not 0 <= rank < world_size:
+        raise ValueError(f"rank {rank} is out of range for world_size {world_size}")
+    permutation = np.random.default_rng(seed).permutation(num_images)
+    return np.sort(permutation[rank::world_size])
+
+
+def partition_size(num_images: int, world_size: int) -> int:
+    """get the number of samples per rank and epoch, the same on every rank."""
+    return math.ceil(num_images / world_size)
+
+
+def partition_annotation_dict(
+    annotation_dict: dict, rank: int, world_size: int, seed: int = 0
+) -> dict:
+    """
+    keep only the images of a rank and their annotations.
+    The input dictionary is not modified.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+    rank: int
+        rank of the process
+    world_size: int
+        number of processes
+    seed: int
+        seed of the assignment
+
+    Returns
+    -------
+    annotation_dict: dict
+        COCO annotation dictionary of the partition
+    """
+    images = annotation_dict["images"]
+    indices = partition_indices(len(images), rank, world_size, seed)
+    images = [images[i] for i in indices]
+    image_ids = {image["id"] for image in images}
+    partition = dict(annotation_dict)
+    partition["images"] = images
+    partition["annotations"] = [
+        ann for ann in annotation_dict["annotations"] if ann["image_id"] in image_ids
+    ]
+    return partition
+
+
+class PartitionSampler(Sampler):
+    """
+    Sampler of a dataset that holds only the partition of its rank.
+
+    Every epoch the partition is shuffled with the seed, the epoch and the rank, and
+    padded by repeating samples to the same length on every rank, like
+    DistributedSampler, so that all ranks run the same number of steps.
+
+    Attributes
+    ----------
+    num_samples: int
+        number of samples per epoch
+    epoch: int
+        epoch set by `set_epoch`
+    """
+
+    def __init__(
+        self,
+        dataset,
+        num_samples: int = None,
+        shuffle: bool = True,
+        seed: int = 0,
+    ):
+        """
+        constructor of PartitionSampler.
+
+        Parameters
+        ----------
+        dataset: FlexCocoDatasetBase
+            dataset created with rank and world_size
+        num_samples: int
+            number of samples per epoch. None is `dataset.partition_size`.
+        shuffle: bool
+            shuffle the partition every epoch
+        seed: int
+            seed of the shuffle
+        """
+        self.dataset = dataset
+        if num_samples is None:
+            num_samples = getattr(dataset, "partition_size", len(dataset))
+        self.num_samples = num_samples
+        self.shuffle = shuffle
+        self.seed = seed
+        self.rank = getattr(dataset, "rank", 0) or 0
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """
+        set the epoch, which changes the order of the samples.
+
+        Parameters
+        ----------
+        epoch: int
+            epoch number
+        """
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[int]:
+        size = len(self.dataset)
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed((self.seed + self.epoch) * 1_000_003 + self.rank)
+            indices = torch.randperm(size, generator=generator).tolist()
+        else:
+            indices = list(range(size))
+        if size and len(indices) < self.num_samples:
+            repeats = math.ceil(self.num_samples / len(indices))
+            indices = (indices * repeats)[: self.num_samples]
+        return iter(indices[: self.num_samples])
+
+    def __len__(self) -> int:
+        return self.num_samples if len(self.dataset) else 0
@@ -0,0 +1,215 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable, Iterable
+
+import torch
+from torch.utils.data import get_worker_info
+
+
+def worker_order(indices: Iterable[int], batch_size: int = 1) -> list[int]:
+    """
+    get the part of a sampler order that the current DataLoader worker fetches.
+    DataLoader hands the batches to the workers in turn, so worker k of n fetches the
+    batches k, k + n, k + 2n, ...
+    Outside of a worker the whole order is returned.
+
+    Parameters
+    ----------
+    indices: Iterable[int]
+        indices in the order of the sampler
+    batch_size: int
+        batch size of the DataLoader
+
+    Returns
+    -------
+    indices: list[int]
+        indices that the current worker fetches, in order
+    """
+    indices = list(indices)
+    worker_info = get_worker_info()
+    if worker_info is None or worker_info.num_workers == 1:
+        return indices
+    return [
+        index
+        for position, index in enumerate(indices)
+        if (position // batch_size) % worker_info.num_workers == worker_info.id
+    ]
+
+
+class ImagePrefetcher:
+    """
+    Read-ahead of images on a bounded thread pool.
+
+    Given the order in which the images will be requested, the next `depth` images are
+    read and decoded in the background. Image decoders release the GIL, so the reads
+    overlap with the rest of the sample preparation.
+    The memory held by prefetched images is estimated from the sizes of the images read
+    so far and kept below `max_bytes`.
+
+    Attributes
+    ----------
+    depth: int
+        maximum number of images read ahead
+    max_bytes: int | None
+        maximum number of bytes held by images read ahead
+    hits: int
+        number of requests whose image was already read
+    stalls: int
+        number of requests whose image was being read and had to be waited for
+    misses: int
+        number of requests that were not read ahead
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Hashable], torch.Tensor],
+        depth: int = 8,
+        max_bytes: int = None,
+        num_threads: int = 4,
+    ):
+        """
+        constructor of ImagePrefetcher.
+
+        Parameters
+        ----------
+        load: Callable[[Hashable], torch.Tensor]
+            function reading the image of a key
+        depth: int
+            maximum number of images read ahead
+        max_bytes: int
+            maximum number of bytes held by images read ahead. None is unlimited.
+        num_threads: int
+            number of reading threads
+        """
+        if depth < 1:
+            raise ValueError("depth must be positive")
+        self.load = load
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stalls = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_threads))
+        self._upcoming = deque()
+        # key -> futures of the images read ahead, oldest first
+        self._pending = {}
+        self._num_pending = 0
+        self._lock = threading.Lock()
+        self._loaded_bytes = 0
+        self._num_loaded = 0
+
+    def set_order(self, keys: Iterable[Hashable]):
+        """
+        set the keys that will be requested next, in order.
+        Images read ahead for the previous order are kept until they are requested.
+
+        Parameters
+        ----------
+        keys: Iterable[Hashable]
+            keys in the order of the requests
+        """
+        self._upcoming = deque(keys)
+        self._fill()
+
+    def _on_loaded(self, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            self._loaded_bytes += future.result().nbytes
+            self._num_loaded += 1
+
+    def _estimated_bytes(self) -> float:
+        with self._lock:
+            if self._num_loaded == 0:
+                return 0
+            return self._loaded_bytes / self._num_loaded
+
+    def _fill(self):
+        """read ahead the upcoming images within the depth and the memory cap."""
+        image_bytes = self._estimated_bytes()
+        while self._upcoming and self._num_pending < self.depth:
+            if (
+                self.max_bytes is not None
+                and self._num_pending > 0
+                and (self._num_pending + 1) * image_bytes > self.max_bytes
+            ):
+                break
+            key = self._upcoming.popleft()
+            future = self._executor.submit(self.load, key)
+            future.add_done_callback(self._on_loaded)
+            self._pending.setdefault(key, deque()).append(future)
+            self._num_pending += 1
+
+    def fetch(self, key: Hashable) -> Future:
+        """
+        request the image of a key and read ahead the upcoming images.
+
+        Parameters
+        ----------
+        key: Hashable
+            key of the image
+
+        Returns
+        -------
+        future: Future
+            future of the image
+        """
+        futures = self._pending.get(key)
+        if futures:
+            future = futures.popleft()
+            if not futures:
+                del self._pending[key]
+            self._num_pending -= 1
+            if future.done():
+                self.hits += 1
+            else:
+                self.stalls += 1
+        else:
+            self.misses += 1
+            future = self._executor.submit(self.load, key)
+            future.add_done_callback(self._on_loaded)
+        self._fill()
+        return future
+
+    def get(self, key: Hashable) -> torch.Tensor:
+        """
+        get the image of a key and read ahead the upcoming images.
+
+        Parameters
+        ----------
+        key: Hashable
+            key of the image
+
+        Returns
+        -------
+        image: torch.Tensor
+            image of the key
+        """
+        return self.fetch(key).result()
+
+    def stats(self) -> dict:
+        """
+        get the counters of the prefetcher.
+
+        Returns
+        -------
+        stats: dict
+            hits, stalls, misses and the number of images currently read ahead
+        """
+        return {
+            "hits": self.hits,
+            "stalls": self.stalls,
+            "misses": self.misses,
+            "pending": self._num_pending,
+        }
+
+    def close(self):
+        """cancel the images read ahead and stop the threads."""
+        for futures in self._pending.values():
+            for future in futures:
+                future.cancel()
+        self._pending.clear()
+        self._upcoming.clear()
+        self._num_pending = 0
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,366 @@
+import os
+import threading
+import time
+from typing import Callable, NamedTuple
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+from flextd.flexcoco.tempdirs import make_shared_temp_dir, remove_when_collected
+
+# stages of FlexCocoDatasetBaseSS. "samples" counts the samples and the wall time of
+# __getitem__ and __getitems__, the other stages are parts of it.
+SAMPLE_STAGES = (
+    "samples",
+    "annotations",
+    "read_image",
+    "image_wait",
+    "mask_cache",
+    "rasterize",
+    "format",
+    "data_transforms",
+    "label_transforms",
+)
+
+
+def nbytes_of(value) -> int:
+    """get the number of bytes of a tensor, an array or an RLE mask dictionary."""
+    if torch.is_tensor(value):
+        return value.element_size() * value.numel()
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict) and "counts" in value:
+        return sum(len(counts) for counts in value["counts"])
+    return 0
+
+
+class ProfileSnapshot(NamedTuple):
+    """accumulated calls, seconds and bytes of each stage"""
+
+    stages: tuple[str, ...]
+    calls: np.ndarray
+    seconds: np.ndarray
+    nbytes: np.ndarray
+
+    def merge(self, other: "ProfileSnapshot") -> "ProfileSnapshot":
+        """
+        add the counters of another snapshot with the same stages.
+
+        Parameters
+        ----------
+        other: ProfileSnapshot
+            snapshot of another process or period
+
+        Returns
+        -------
+        snapshot: ProfileSnapshot
+            sum of both snapshots
+        """
+        if other.stages != self.stages:
+            raise ValueError("snapshots with different stages cannot be merged")
+        return ProfileSnapshot(
+            self.stages,
+            self.calls + other.calls,
+            self.seconds + other.seconds,
+            self.nbytes + other.nbytes,
+        )
+
+    def to_dict(self) -> dict:
+        """
+        convert the snapshot to a dictionary that can be serialized as json.
+
+        Returns
+        -------
+        snapshot: dict
+            calls, seconds, bytes and mean milliseconds of each stage
+        """
+        return {
+            stage: {
+                "calls": int(self.calls[i]),
+                "seconds": float(self.seconds[i]),
+                "bytes": int(self.nbytes[i]),
+                "mean_ms": float(self.seconds[i] / max(self.calls[i], 1) * 1000),
+            }
+            for i, stage in enumerate(self.stages)
+        }
+
+    def summary(self) -> str:
+        """
+        format the snapshot as a table. The share of a stage is its time divided by
+        the time of the "samples" stage, if there is one. Stages that run on threads
+        overlap, so the shares can add up to more than 100%.
+
+        Returns
+        -------
+        summary: str
+            one line per stage that was called
+        """
+        total = None
+        if "samples" in self.stages:
+            total = self.seconds[self.stages.index("samples")]
+        lines = [
+            f"{'stage':<17} {'calls':>9} {'total [s]':>10} {'mean [ms]':>10} "
+            f"{'share':>7} {'MB':>10}"
+        ]
+        for i, stage in enumerate(self.stages):
+            if self.calls[i] == 0:
+                continue
+            share = f"{self.seconds[i] / total:>7.1%}" if total else f"{'':>7}"
+            lines.append(
+                f"{stage:<17} {int(self.calls[i]):>9} {self.seconds[i]:>10.3f} "
+                f"{self.seconds[i] / self.calls[i] * 1000:>10.3f} {share} "
+                f"{self.nbytes[i] / 2**20:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+def merge_snapshots(snapshots: list[ProfileSnapshot]) -> ProfileSnapshot:
+    """
+    add the counters of several snapshots with the same stages.
+
+    Parameters
+    ----------
+    snapshots: list[ProfileSnapshot]
+        snapshots, e.g. of each DataLoader worker
+
+    Returns
+    -------
+    snapshot: ProfileSnapshot
+        sum of the snapshots
+    """
+    if not snapshots:
+        raise ValueError("no snapshots to merge")
+    merged = snapshots[0]
+    for snapshot in snapshots[1:]:
+        merged = merged.merge(snapshot)
+    return merged
+
+
+class _Stage:
+    """context manager that times one call of a stage"""
+
+    __slots__ = ("profiler", "index", "start", "nbytes")
+
+    def __init__(self, profiler: "StageProfiler", index: int):
+        self.profiler = profiler
+        self.index = index
+        self.nbytes = 0
+
+    def __enter__(self) -> "_Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record_index(
+            self.index, time.perf_counter() - self.start, self.nbytes
+        )
+
+
+class _NullStage:
+    """stage of a dataset without a profiler, which records nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class StageProfiler:
+    """
+    Per-stage timings and byte counts of a dataset, shared by DataLoader workers.
+
+    The counters live in a small memory mapped file with one row per process: the main
+    process writes row 0 and DataLoader worker k writes row k + 1. Forked workers share
+    the mapping and spawned workers map the file again by its path, so the main process
+    reads the counters of all workers without any message passing, and each process
+    only adds to its own row.
+    When a callback is given, every `callback_interval` samples of a process it is
+    called in that process with the DataLoader worker id (None in the main process) and
+    the snapshot of the process.
+
+    Attributes
+    ----------
+    stages: tuple[str, ...]
+        names of the stages
+    max_workers: int
+        maximum number of DataLoader workers
+    callback: Callable[[int | None, ProfileSnapshot], None] | None
+        function called with the worker id and the snapshot of a process
+    callback_interval: int
+        number of samples between calls of the callback
+    """
+
+    def __init__(
+        self,
+        stages: tuple[str, ...] = SAMPLE_STAGES,
+        max_workers: int = 64,
+        callback: Callable[[int | None, ProfileSnapshot], None] = None,
+        callback_interval: int = 1000,
+        directory: str = None,
+    ):
+        """
+        constructor of StageProfiler.
+
+        Parameters
+        ----------
+        stages: tuple[str, ...]
+            names of the stages. The "samples" stage counts the samples for the callback.
+        max_workers: int
+            maximum number of DataLoader workers
+        callback: Callable[[int | None, ProfileSnapshot], None]
+            function called with the worker id and the snapshot of a process
+        callback_interval: int
+            number of samples between calls of the callback
+        directory: str
+            parent of the temporary directory of the counters. /dev/shm is used when
+            available.
+        """
+        self.stages = tuple(stages)
+        self.max_workers = max_workers
+        self.callback = callback
+        self.callback_interval = callback_interval
+        self._directory = make_shared_temp_dir("flextd-profile-", directory)
+        remove_when_collected(self, self._directory)
+        self._path = os.path.join(self._directory, "counters.bin")
+        np.memmap(self._path, np.float64, "w+", shape=self._shape).flush()
+        self._init_process_state()
+
+    @property
+    def _shape(self) -> tuple[int, int, int]:
+        # (process, stage, (calls, seconds, bytes))
+        return (self.max_workers + 1, len(self.stages), 3)
+
+    def _init_process_state(self):
+        self._counters = np.memmap(self._path, np.float64, "r+", shape=self._shape)
+        self._stage_index = {stage: i for i, stage in enumerate(self.stages)}
+        self._samples_index = self._stage_index.get("samples")
+        self._lock = threading.Lock()
+        self._pid = None
+        self._row = None
+        self._worker_id = None
+
+    def __getstate__(self) -> dict:
+        # spawned workers map the counters again from the path
+        state = self.__dict__.copy()
+        for name in ("_counters", "_lock", "_pid", "_row", "_worker_id"):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def _process_row(self) -> np.ndarray:
+        """get the row of the counters of the current process."""
+        if self._pid != os.getpid():
+            worker_info = get_worker_info()
+            self._worker_id = None if worker_info is None else worker_info.id
+            row = 0 if worker_info is None else worker_info.id + 1
+            if row > self.max_workers:
+                raise ValueError(
+                    f"worker {worker_info.id} exceeds max_workers {self.max_workers}"
+                )
+            self._row = self._counters[row]
+            self._pid = os.getpid()
+        return self._row
+
+    def stage(self, stage: str) -> _Stage:
+        """
+        get a context manager that times one call of a stage.
+        Set `nbytes` of the returned object to count the bytes of the call.
+
+        Parameters
+        ----------
+        stage: str
+            name of the stage
+
+        Returns
+        -------
+        stage: _Stage
+            context manager
+        """
+        return _Stage(self, self._stage_index[stage])
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0, calls: int = 1):
+        """
+        add calls of a stage.
+
+        Parameters
+        ----------
+        stage: str
+            name of the stage
+        seconds: float
+            duration of the calls
+        nbytes: int
+            number of bytes produced by the calls
+        calls: int
+            number of calls, e.g. the samples of a batch
+        """
+        self.record_index(self._stage_index[stage], seconds, nbytes, calls)
+
+    def record_index(self, index: int, seconds: float, nbytes: int = 0, calls: int = 1):
+        """add calls of the stage at an index of the stages."""
+        row = self._process_row()
+        # stages run on the decode threads too
+        with self._lock:
+            counters = row[index]
+            counters[0] += calls
+            counters[1] += seconds
+            counters[2] += nbytes
+        if index == self._samples_index and self.callback is not None:
+            samples = int(counters[0])
+            if (
+                samples // self.callback_interval
+                > (samples - calls) // self.callback_interval
+            ):
+                self.callback(self._worker_id, self._snapshot(row))
+
+    def _snapshot(self, counters: np.ndarray) -> ProfileSnapshot:
+        counters = np.array(counters)
+        return ProfileSnapshot(
+            self.stages,
+            counters[..., 0].astype(np.int64),
+            counters[..., 1],
+            counters[..., 2].astype(np.int64),
+        )
+
+    def snapshots(self) -> list[ProfileSnapshot]:
+        """
+        get the snapshot of each process.
+
+        Returns
+        -------
+        snapshots: list[ProfileSnapshot]
+            snapshot of the main process followed by DataLoader worker 0, 1, ...
+        """
+        return [self._snapshot(counters) for counters in self._counters]
+
+    def snapshot(self) -> ProfileSnapshot:
+        """
+        get the counters of all processes merged.
+
+        Returns
+        -------
+        snapshot: ProfileSnapshot
+            sum of the counters of the main process and the DataLoader workers
+        """
+        return self._snapshot(self._counters.sum(axis=0))
+
+    def summary(self) -> str:
+        """get the merged counters of all processes as a table."""
+        return self.snapshot().summary()
+
+    def reset(self):
+        """set the counters of all processes to zero."""
+        with self._lock:
+            self._counters[:] = 0
@@ -0,0 +1,218 @@
+import math
+from typing import Iterator
+
+import numpy as np
+from torch.utils.data import Sampler
+
+
+def padding_overhead(
+    heights: np.ndarray, widths: np.ndarray, batches: list[list[int]]
+) -> float:
+    """
+    get the fraction of padded pixels when the images of each batch are padded to the
+    largest height and width of the batch.
+
+    Parameters
+    ----------
+    heights: np.ndarray
+        height of each image
+    widths: np.ndarray
+        width of each image
+    batches: list[list[int]]
+        indices of the images of each batch
+
+    Returns
+    -------
+    overhead: float
+        padded pixels divided by image pixels
+    """
+    if not batches:
+        return 0.0
+    lengths = np.array([len(batch) for batch in batches])
+    indices = np.concatenate([np.asarray(batch, dtype=np.int64) for batch in batches])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    heights = np.asarray(heights, dtype=np.float64)[indices]
+    widths = np.asarray(widths, dtype=np.float64)[indices]
+    max_heights = np.maximum.reduceat(heights, starts)
+    max_widths = np.maximum.reduceat(widths, starts)
+    padded = (max_heights * max_widths * lengths).sum()
+    pixels = (heights * widths).sum()
+    return float(padded / pixels - 1)
+
+
+class AspectRatioBatchSampler(Sampler):
+    """
+    Batch sampler that groups images of similar aspect ratio and size.
+
+    The images are put into buckets once, from the heights and widths of the dataset:
+    the log aspect ratio and the log area are each split at their quantiles, so the
+    buckets have similar numbers of images. Every epoch the images of each bucket are
+    shuffled and cut into batches, the incomplete batches of all buckets are batched
+    together, and the order of the batches is shuffled. With rank and world_size the
+    batches are split across ranks, padded by repeating batches so that every rank
+    gets the same number of batches.
+
+    Attributes
+    ----------
+    bucket_ids: np.ndarray
+        bucket of each image
+    epoch: int
+        epoch set by `set_epoch`
+    """
+
+    def __init__(
+        self,
+        dataset,
+        batch_size: int,
+        num_aspect_buckets: int = 8,
+        num_size_buckets: int = 4,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 0,
+        rank: int = None,
+        world_size: int = None,
+    ):
+        """
+        constructor of AspectRatioBatchSampler.
+
+        Parameters
+        ----------
+        dataset: FlexCocoDatasetBase
+            dataset with heights and widths per index
+        batch_size: int
+            number of images per batch
+        num_aspect_buckets: int
+            number of aspect ratio ranges
+        num_size_buckets: int
+            number of area ranges in each aspect ratio range
+        shuffle: bool
+            shuffle the images and batches every epoch
+        drop_last: bool
+            drop the incomplete batches of the buckets instead of mixing them
+        seed: int
+            seed of the shuffle
+        rank: int
+            rank of the process. batches are not split when None.
+        world_size: int
+            number of processes
+        """
+        if (rank is None) != (world_size is None):
+            raise ValueError("rank and world_size must be given together")
+        if rank is not None and not 0 <= rank < world_size:
+            raise ValueError(f"rank {rank} is out of range for world_size {world_size}")
+        self.heights = np.asarray(dataset.heights)
+        self.widths = np.asarray(dataset.widths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+        log_aspect = np.log(self.widths / np.maximum(self.heights, 1))
+        log_area = np.log(np.maximum(self.heights.astype(np.float64) * self.widths, 1))
+        aspect_bins = self._bin(log_aspect, num_aspect_buckets)
+        size_bins = np.zeros(len(aspect_bins), dtype=np.int64)
+        for aspect_bin in np.unique(aspect_bins):
+            members = aspect_bins == aspect_bin
+            size_bins[members] = self._bin(log_area[members], num_size_buckets)
+        self.bucket_ids = aspect_bins * num_size_buckets + size_bins
+        order = np.argsort(self.bucket_ids, kind="stable")
+        _, starts = np.unique(self.bucket_ids[order], return_index=True)
+        self._buckets = np.split(order, starts[1:]) if len(order) else []
+
+    @staticmethod
+    def _bin(values: np.ndarray, num_bins: int) -> np.ndarray:
+        """split values into bins with similar numbers of values."""
+        if len(values) == 0 or num_bins <= 1:
+            return np.zeros(len(values), dtype=np.int64)
+        edges = np.quantile(values, np.linspace(0, 1, num_bins + 1)[1:-1])
+        return np.searchsorted(edges, values, side="right")
+
+    def set_epoch(self, epoch: int):
+        """
+        set the epoch, which changes the order of the batches.
+
+        Parameters
+        ----------
+        epoch: int
+            epoch number
+        """
+        self.epoch = epoch
+
+    def _all_batches(self) -> list[list[int]]:
+        """get the batches of all ranks for the current epoch."""
+        rng = np.random.default_rng((self.seed, self.epoch))
+        batches = []
+        leftovers = []
+        for bucket in self._buckets:
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+            num_full = len(bucket) // self.batch_size * self.batch_size
+            batches += list(bucket[:num_full].reshape(-1, self.batch_size))
+            leftovers.append(bucket[num_full:])
+        if not self.drop_last and leftovers:
+            leftovers = np.concatenate(leftovers)
+            batches += [
+                leftovers[i : i + self.batch_size]
+                for i in range(0, len(leftovers), self.batch_size)
+            ]
+        if self.shuffle and batches:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return [batch.tolist() for batch in batches]
+
+    def batches(self) -> list[list[int]]:
+        """
+        get the batches of this rank for the current epoch.
+
+        Returns
+        -------
+        batches: list[list[int]]
+            indices of the images of each batch
+        """
+        batches = self._all_batches()
+        if self.world_size is None or not batches:
+            return batches
+        total = math.ceil(len(batches) / self.world_size) * self.world_size
+        batches += batches[: total - len(batches)]
+        return batches[self.rank :: self.world_size]
+
+    def padding_report(self) -> dict:
+        """
+        compare the padding of the bucketed batches with random batches of the same
+        batch size for the current epoch.
+
+        Returns
+        -------
+        report: dict
+            "bucketed" and "random" padding overhead (padded pixels / image pixels)
+        """
+        rng = np.random.default_rng((self.seed, self.epoch, 1))
+        order = rng.permutation(len(self.heights))
+        random_batches = [
+            order[i : i + self.batch_size]
+            for i in range(0, len(order), self.batch_size)
+        ]
+        return {
+            "bucketed": padding_overhead(
+                self.heights, self.widths, self._all_batches()
+            ),
+            "random": padding_overhead(self.heights, self.widths, random_batches),
+        }
+
+    def __iter__(self) -> Iterator[list[int]]:
+        return iter(self.batches())
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            num_batches = sum(
+                len(bucket) // self.batch_size for bucket in self._buckets
+            )
+        else:
+            num_full = sum(len(bucket) // self.batch_size for bucket in self._buckets)
+            num_left = len(self.heights) - num_full * self.batch_size
+            num_batches = num_full + math.ceil(num_left / self.batch_size)
+        if self.world_size is None:
+            return num_batches
+        return math.ceil(num_batches / self.world_size)
@@ -0,0 +1,330 @@
+import io
+import os
+import random
+import tarfile
+import warnings
+from typing import Iterator
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+
+from flextd.flexcoco.coco_base import FlexCocoDatasetBase
+from flextd.flexcoco.jsonio import dump_json, dumps, load_json, loads
+from flextd.flexcoco.mask_cache import decode_category_masks, encode_category_masks
+from flextd.flexcoco.masks import TARGET_FORMATS, format_masks, rasterize_category_masks
+
+INDEX_FILE = "index.json"
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _close_shard(tar: tarfile.TarFile, output_dir: str, name: str):
+    tar.close()
+    os.replace(os.path.join(output_dir, f"{name}.tmp"), os.path.join(output_dir, name))
+
+
+def write_shards(
+    dataset: FlexCocoDatasetBase,
+    output_dir: str,
+    max_shard_bytes: int = 1 << 30,
+    max_shard_samples: int = None,
+    masks: bool = False,
+) -> list[str]:
+    """
+    pack the images and annotations of a dataset into tar shards that can be read
+    sequentially by `ShardedCocoDataset`.
+    Each image is stored as `<image id>.<extension>` with its original bytes, followed by
+    `<image id>.json` with the image record, its annotations and optionally its category
+    masks. `index.json` lists the shards and the categories.
+
+    Parameters
+    ----------
+    dataset: FlexCocoDatasetBase
+        dataset whose (filtered) images and annotations are packed
+    output_dir: str
+        path to the directory of the shards
+    max_shard_bytes: int
+        a new shard is started when a shard reaches this size
+    max_shard_samples: int
+        a new shard is started when a shard has this number of images.
+        None is unlimited.
+    masks: bool
+        store the category masks rasterized in advance
+
+    Returns
+    -------
+    shard_files: list[str]
+        paths to the shards
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # (name, number of samples) of each shard
+    shards = []
+    tar = None
+    for index, image_id in enumerate(dataset.ids):
+        file_name, height, width, _ = dataset.get_image_record(index)
+        anns = dataset.get_annotations(index)
+        with open(os.path.join(dataset.image_dir, file_name), "rb") as f:
+            image_bytes = f.read()
+        record = {
+            "id": int(image_id),
+            "file_name": file_name,
+            "height": int(height),
+            "width": int(width),
+            "annotations": anns,
+        }
+        if masks:
+            category_masks = rasterize_category_masks(
+                anns, int(height), int(width), dataset.cat_id2idx
+            )
+            record["masks"] = encode_category_masks(category_masks)
+
+        if tar is None:
+            shards.append((f"shard-{len(shards):06d}.tar", 0))
+            tmp_path = os.path.join(output_dir, f"{shards[-1][0]}.tmp")
+            tar = tarfile.open(tmp_path, "w")
+        extension = os.path.splitext(file_name)[1] or ".img"
+        _add_member(tar, f"{image_id}{extension}", image_bytes)
+        _add_member(tar, f"{image_id}.json", dumps(record))
+        shards[-1] = (shards[-1][0], shards[-1][1] + 1)
+        if tar.fileobj.tell() >= max_shard_bytes or (
+            max_shard_samples is not None and shards[-1][1] >= max_shard_samples
+        ):
+            _close_shard(tar, output_dir, shards[-1][0])
+            tar = None
+    if tar is not None:
+        _close_shard(tar, output_dir, shards[-1][0])
+
+    index = {
+        "shards": [{"name": name, "num_samples": n} for name, n in shards],
+        "category_ids": [int(category_id) for category_id in dataset.category_ids],
+        "categories": dataset.get_categories(),
+        "masks": masks,
+    }
+    tmp_path = os.path.join(output_dir, f"{INDEX_FILE}.tmp")
+    dump_json(index, tmp_path)
+    os.replace(tmp_path, os.path.join(output_dir, INDEX_FILE))
+    return [os.path.join(output_dir, name) for name, _ in shards]
+
+
+def _iter_tar_samples(path: str) -> Iterator[tuple[bytes, dict]]:
+    """read the (image bytes, record) pairs of a shard sequentially."""
+    image_bytes = None
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            data = tar.extractfile(member).read()
+            if member.name.endswith(".json"):
+                yield image_bytes, loads(data)
+                image_bytes = None
+            else:
+                image_bytes = data
+
+
+class ShardedCocoDataset(IterableDataset):
+    """
+    IterableDataset that streams the shards written by `write_shards` sequentially.
+
+    The shards are split across distributed ranks and DataLoader workers, so each
+    shard is read by exactly one worker of one rank, and the samples are shuffled in a
+    buffer. Samples are the same as those of FlexCocoDatasetBaseSS when the shards
+    have masks, and the target also has the annotations of the image when
+    return_annotations is True.
+
+    Whole shards are dealt out, so the ranks read the same number of samples only
+    when the shards split evenly: write shards of equal size with `max_shard_samples`,
+    and at least world_size * num_workers of them (a multiple of it for equal counts).
+    Otherwise some workers read no samples, and DistributedDataParallel, which needs
+    the same number of batches on every rank, hangs at the end of an epoch. A warning
+    is issued in both cases.
+
+    Attributes
+    ----------
+    shard_dir: str
+        path to the directory of the shards
+    shards: list[str]
+        paths to the shards
+    shard_samples: list[int]
+        number of samples in each shard
+    num_samples: int
+        number of samples in all shards
+    category_ids: list[int]
+        category id of each mask channel
+    categories: list[str]
+        category name of each mask channel
+    has_masks: bool
+        whether the shards have the category masks
+    return_annotations: bool
+        whether the target has the annotations of the image
+    rank: int
+        rank of the process
+    world_size: int
+        number of processes
+    epoch: int
+        epoch set by `set_epoch`
+    """
+
+    def __init__(
+        self,
+        shard_dir: str,
+        data_transforms=None,
+        label_transforms=None,
+        shuffle_buffer: int = 0,
+        seed: int = 0,
+        rank: int = None,
+        world_size: int = None,
+        target_format: str = "dense",
+        return_annotations: bool = False,
+    ):
+        """
+        constructor of ShardedCocoDataset.
+
+        Parameters
+        ----------
+        shard_dir: str
+            path to the directory of the shards
+        data_transforms:
+            transform to be applied to the image
+        label_transforms:
+            transform to be applied to the masks
+        shuffle_buffer: int
+            number of samples in the shuffle buffer. 0 keeps the order and does not
+            shuffle the shards.
+        seed: int
+            seed of the shuffle. the order changes with `set_epoch`.
+        rank: int
+            rank of the process. None is the rank of torch.distributed, or 0.
+        world_size: int
+            number of processes. None is the world size of torch.distributed, or 1.
+        target_format: str
+            one of "dense", "bool", "uint8", "label_map", "packed" and "rle"
+        return_annotations: bool
+            add the annotations of the image to the target. Their number differs
+            between images, so batches with them need a custom collate_fn.
+        """
+        if target_format not in TARGET_FORMATS:
+            raise ValueError(
+                f"unknown target_format {target_format!r}, "
+                f"expected one of {TARGET_FORMATS}"
+            )
+        index = load_json(os.path.join(shard_dir, INDEX_FILE))
+        self.shard_dir = shard_dir
+        self.shards = [
+            os.path.join(shard_dir, shard["name"]) for shard in index["shards"]
+        ]
+        self.shard_samples = [shard["num_samples"] for shard in index["shards"]]
+        self.num_samples = sum(self.shard_samples)
+        self.category_ids = index["category_ids"]
+        self.categories = index["categories"]
+        self.has_masks = index["masks"]
+        self.data_transforms = data_transforms
+        self.label_transforms = label_transforms
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        if rank is None or world_size is None:
+            distributed = dist.is_available() and dist.is_initialized()
+            rank = dist.get_rank() if distributed else 0
+            world_size = dist.get_world_size() if distributed else 1
+        self.rank = rank
+        self.world_size = world_size
+        self.target_format = target_format
+        self.return_annotations = return_annotations
+
+    def set_epoch(self, epoch: int):
+        """
+        set the epoch, which changes the order of the shards and of the shuffle buffer.
+        Call it before creating the DataLoader iterator of each epoch.
+
+        Parameters
+        ----------
+        epoch: int
+            epoch number
+        """
+        self.epoch = epoch
+
+    def worker_shards(self) -> list[str]:
+        """
+        get the shards read by the current worker of the current rank.
+        Shard i is read by split i % (world_size * num_workers), where the split of
+        a worker is rank * num_workers + worker id. A warning is issued when some
+        workers get no shard or the ranks get different numbers of samples.
+
+        Returns
+        -------
+        shards: list[str]
+            paths to the shards
+        """
+        shards = list(zip(self.shards, self.shard_samples))
+        if self.shuffle_buffer > 0:
+            # the same order on every rank and worker, so that the split is a partition
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        worker_info = get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        num_workers = 1 if worker_info is None else worker_info.num_workers
+        num_splits = self.world_size * num_workers
+        if len(shards) < num_splits:
+            warnings.warn(
+                f"{len(shards)} shards for {self.world_size} ranks x {num_workers} "
+                "workers, some workers read no samples"
+            )
+        rank_samples = [0] * self.world_size
+        for i, (_, num_samples) in enumerate(shards):
+            rank_samples[i % num_splits // num_workers] += num_samples
+        if len(set(rank_samples)) > 1:
+            warnings.warn(
+                f"the ranks read different numbers of samples {rank_samples}, "
+                "which hangs DistributedDataParallel at the end of an epoch. "
+                "Write shards of equal size, a multiple of world_size * num_workers"
+            )
+        split = self.rank * num_workers + worker_id
+        return [shard for shard, _ in shards[split::num_splits]]
+
+    def _make_sample(self, image_bytes: bytes, record: dict) -> tuple:
+        from torchvision.io import decode_image
+
+        img = decode_image(torch.frombuffer(bytearray(image_bytes), dtype=torch.uint8))
+        target = {
+            "file_name": record["file_name"],
+            "origin_height": record["height"],
+            "origin_width": record["width"],
+        }
+        if self.return_annotations:
+            target["annotations"] = record["annotations"]
+        if self.has_masks:
+            masks = decode_category_masks(
+                record["masks"],
+                len(self.category_ids),
+                record["height"],
+                record["width"],
+            )
+            masks = format_masks(masks, self.target_format)
+            if self.label_transforms is not None:
+                masks = self.label_transforms(masks)
+            target["masks"] = masks
+        if self.data_transforms is not None:
+            img = self.data_transforms(img)
+        return img, target
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, dict]]:
+        worker_info = get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        rng = random.Random(
+            (self.seed + self.epoch) * 1_000_003 + self.rank * 1_009 + worker_id
+        )
+        buffer = []
+        for shard in self.worker_shards():
+            for image_bytes, record in _iter_tar_samples(shard):
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append((image_bytes, record))
+                    continue
+                if self.shuffle_buffer > 0:
+                    i = rng.randrange(self.shuffle_buffer)
+                    buffer[i], (image_bytes, record) = (image_bytes, record), buffer[i]
+                yield self._make_sample(image_bytes, record)
+        rng.shuffle(buffer)
+        for image_bytes, record in buffer:
+            yield self._make_sample(image_bytes, record)
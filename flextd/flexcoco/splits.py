@@ -0,0 +1,335 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from flextd.flexcoco.jsonio import dump_json, load_json
+from flextd.flexcoco.utils import filter_annotation_dict
+
+# fractional part of the golden ratio, the step of a low discrepancy sequence
+_GOLDEN = (5**0.5 - 1) / 2
+_FILTER_NAMES = (
+    "include_files",
+    "exclude_files",
+    "include_categories",
+    "exclude_categories",
+)
+
+
+class SplitSpec(NamedTuple):
+    """assignment of the images of a subset to parts"""
+
+    # fraction of the images of each part
+    fractions: tuple[float, ...]
+    # keep the fraction of the images of each category close to the fractions
+    stratify: bool = False
+    seed: int = 0
+
+
+class SubsetSpec(NamedTuple):
+    """specification of an annotation file created by `create_subset_annotation_files`"""
+
+    output_file: str
+    include_files: list[str] = None
+    exclude_files: list[str] = None
+    include_categories: list[str] = None
+    exclude_categories: list[str] = None
+    # split of the filtered images, None keeps all of them
+    split: SplitSpec = None
+    # parts of the split kept in the subset, None keeps all parts
+    parts: tuple[int, ...] = None
+
+
+def random_split_specs(
+    output_files: list[str],
+    fractions: list[float],
+    stratify: bool = False,
+    seed: int = 0,
+    **filters,
+) -> list[SubsetSpec]:
+    """
+    get the specifications of a split of the images into subsets such as train and val.
+
+    Parameters
+    ----------
+    output_files: list[str]
+        path to the annotation file of each part
+    fractions: list[float]
+        fraction of the images of each part
+    stratify: bool
+        keep the fraction of the images of each category close to the fractions
+    seed: int
+        seed of the split
+    filters:
+        include_files, exclude_files, include_categories and exclude_categories
+        applied before the split
+
+    Returns
+    -------
+    subsets: list[SubsetSpec]
+        specification of each part
+    """
+    if len(output_files) != len(fractions):
+        raise ValueError("output_files and fractions must have the same length")
+    split = SplitSpec(tuple(fractions), stratify, seed)
+    return [
+        SubsetSpec(output_file, split=split, parts=(part,), **filters)
+        for part, output_file in enumerate(output_files)
+    ]
+
+
+def k_fold_specs(
+    num_folds: int,
+    train_file: str,
+    val_file: str,
+    stratify: bool = False,
+    seed: int = 0,
+    **filters,
+) -> list[SubsetSpec]:
+    """
+    get the specifications of the train and val subsets of k-fold cross validation.
+    The val subsets of the folds do not overlap and cover all images.
+
+    Parameters
+    ----------
+    num_folds: int
+        number of folds
+    train_file: str
+        path of the train annotation files, formatted with `fold`,
+        e.g. "train_{fold}.json"
+    val_file: str
+        path of the val annotation files, formatted with `fold`
+    stratify: bool
+        keep the fraction of the images of each category close to 1 / num_folds
+    seed: int
+        seed of the split
+    filters:
+        include_files, exclude_files, include_categories and exclude_categories
+        applied before the split
+
+    Returns
+    -------
+    subsets: list[SubsetSpec]
+        train and val specification of each fold
+    """
+    if num_folds < 2:
+        raise ValueError("num_folds must be at least 2")
+    split = SplitSpec((1 / num_folds,) * num_folds, stratify, seed)
+    subsets = []
+    for fold in range(num_folds):
+        train_parts = tuple(part for part in range(num_folds) if part != fold)
+        subsets.append(
+            SubsetSpec(
+                train_file.format(fold=fold), split=split, parts=train_parts, **filters
+            )
+        )
+        subsets.append(
+            SubsetSpec(
+                val_file.format(fold=fold), split=split, parts=(fold,), **filters
+            )
+        )
+    return subsets
+
+
+def _annotation_image_index(annotation_dict: dict) -> np.ndarray:
+    """get the index of the image of each annotation, -1 for unknown images."""
+    image_index_of = {
+        image["id"]: i for i, image in enumerate(annotation_dict["images"])
+    }
+    return np.fromiter(
+        (
+            image_index_of.get(ann["image_id"], -1)
+            for ann in annotation_dict["annotations"]
+        ),
+        dtype=np.int64,
+        count=len(annotation_dict["annotations"]),
+    )
+
+
+def _rarest_category(annotation_dict: dict, ann_image_index: np.ndarray) -> np.ndarray:
+    """get the category with the fewest images of each image, -1 for no annotation."""
+    num_images = len(annotation_dict["images"])
+    category_ids = np.fromiter(
+        (ann["category_id"] for ann in annotation_dict["annotations"]),
+        dtype=np.int64,
+        count=len(annotation_dict["annotations"]),
+    )
+    known = ann_image_index >= 0
+    _, category_index = np.unique(category_ids[known], return_inverse=True)
+    image_index = ann_image_index[known]
+    num_categories = int(category_index.max()) + 1 if len(category_index) else 0
+    # each (image, category) pair once
+    pairs = np.unique(image_index * max(num_categories, 1) + category_index)
+    pair_images = pairs // max(num_categories, 1)
+    pair_categories = pairs % max(num_categories, 1)
+    image_counts = np.bincount(pair_categories, minlength=num_categories)
+    # sort the pairs by image and then by the number of images of the category
+    order = np.lexsort((pair_categories, image_counts[pair_categories], pair_images))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_images[order][1:] != pair_images[order][:-1]
+    rarest = np.full(num_images, -1, dtype=np.int64)
+    rarest[pair_images[order][first]] = pair_categories[order][first]
+    return rarest
+
+
+def assign_parts(
+    annotation_dict: dict, split: SplitSpec, ann_image_index: np.ndarray = None
+) -> np.ndarray:
+    """
+    assign the images of an annotation dictionary to the parts of a split.
+    Without stratification the images are shuffled and cut at the fractions.
+    With stratification each image is grouped by its category with the fewest images,
+    and the images of each group are spread over the parts by a low discrepancy
+    sequence, so that every category, including rare ones, is split close to the
+    fractions.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+    split: SplitSpec
+        fractions, stratification and seed of the split
+    ann_image_index: np.ndarray
+        index of the image of each annotation, computed when None
+
+    Returns
+    -------
+    parts: np.ndarray
+        part of each image
+    """
+    fractions = np.asarray(split.fractions, dtype=np.float64)
+    if len(fractions) == 0 or np.any(fractions < 0) or fractions.sum() <= 0:
+        raise ValueError("fractions must be non-negative and not all zero")
+    bounds = np.cumsum(fractions / fractions.sum())[:-1]
+    num_images = len(annotation_dict["images"])
+    rng = np.random.default_rng(split.seed)
+    order = rng.permutation(num_images)
+    parts = np.empty(num_images, dtype=np.int64)
+    if not split.stratify:
+        # cut the shuffled images at the rounded boundaries
+        cuts = np.round(bounds * num_images).astype(np.int64)
+        parts[order] = np.searchsorted(cuts, np.arange(num_images), side="right")
+        return parts
+    if ann_image_index is None:
+        ann_image_index = _annotation_image_index(annotation_dict)
+    groups = _rarest_category(annotation_dict, ann_image_index)
+    # shuffled images sorted by group, so that each group is contiguous
+    order = order[np.argsort(groups[order], kind="stable")]
+    positions = (np.arange(num_images) * _GOLDEN + rng.random()) % 1
+    parts[order] = np.searchsorted(bounds, positions, side="right")
+    return parts
+
+
+# annotation dictionaries of the subsets being written, inherited by forked workers
+_sources: dict = {}
+
+
+def _write_subset(
+    source_key: tuple,
+    output_file: str,
+    image_indices: np.ndarray | None,
+    ann_indices: np.ndarray | None,
+) -> str:
+    """write the images and annotations at the given indices of a source dictionary."""
+    source = _sources[source_key]
+    subset = dict(source)
+    if image_indices is not None:
+        images = source["images"]
+        annotations = source["annotations"]
+        subset["images"] = [images[i] for i in image_indices.tolist()]
+        subset["annotations"] = [annotations[i] for i in ann_indices.tolist()]
+    tmp_path = f"{output_file}.{os.getpid()}.tmp"
+    dump_json(subset, tmp_path)
+    os.replace(tmp_path, output_file)
+    return output_file
+
+
+def _filter_key(subset: SubsetSpec) -> tuple:
+    """get the filters of a subset as a hashable key."""
+    values = (getattr(subset, name) for name in _FILTER_NAMES)
+    return tuple(None if value is None else tuple(value) for value in values)
+
+
+def create_subset_annotation_files(
+    annotation_file: str, subsets: list[SubsetSpec], num_workers: int = None
+) -> list[str]:
+    """
+    create several filtered and split annotation files from one parse of an annotation
+    file.
+    The annotation file is read once, each distinct filter is applied once and each
+    distinct split is assigned once. The files are then written concurrently by worker
+    processes that inherit the parsed annotations, where the fork start method is
+    available.
+
+    Parameters
+    ----------
+    annotation_file: str
+        path to the annotation file
+    subsets: list[SubsetSpec]
+        specification of each annotation file to create
+    num_workers: int
+        number of processes writing the files. None is the number of CPUs, 0 writes
+        them in the current process.
+
+    Returns
+    -------
+    output_files: list[str]
+        path to the annotation file of each subset
+    """
+    annotation_dict = load_json(annotation_file)
+
+    sources = {}
+    # (source key, output file, image indices, annotation indices) of each subset
+    tasks = []
+    ann_image_indices = {}
+    split_parts = {}
+    for subset in subsets:
+        key = _filter_key(subset)
+        if key not in sources:
+            sources[key] = filter_annotation_dict(
+                annotation_dict, **dict(zip(_FILTER_NAMES, key))
+            )
+        source = sources[key]
+        if subset.split is None and subset.parts is None:
+            tasks.append((key, subset.output_file, None, None))
+            continue
+        if key not in ann_image_indices:
+            ann_image_indices[key] = _annotation_image_index(source)
+        ann_image_index = ann_image_indices[key]
+        split = subset.split or SplitSpec((1.0,))
+        if (key, split) not in split_parts:
+            split_parts[key, split] = assign_parts(source, split, ann_image_index)
+        parts = split_parts[key, split]
+        selected = (
+            np.ones(len(parts), dtype=bool)
+            if subset.parts is None
+            else np.isin(parts, subset.parts)
+        )
+        # annotations of images that are not in the images list are dropped
+        ann_selected = np.zeros(len(ann_image_index), dtype=bool)
+        known = ann_image_index >= 0
+        ann_selected[known] = selected[ann_image_index[known]]
+        tasks.append(
+            (
+                key,
+                subset.output_file,
+                np.flatnonzero(selected),
+                np.flatnonzero(ann_selected),
+            )
+        )
+
+    _sources.update(sources)
+    try:
+        if num_workers is None:
+            num_workers = min(len(tasks), os.cpu_count() or 1)
+        if num_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            return [_write_subset(*task) for task in tasks]
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(num_workers, mp_context=context) as executor:
+            futures = [executor.submit(_write_subset, *task) for task in tasks]
+            return [future.result() for future in futures]
+    finally:
+        for key in sources:
+            _sources.pop(key, None)
@@ -0,0 +1,296 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from flextd.flexcoco.jsonio import load_annotation_index
+from flextd.flexcoco.store import CocoAnnotationStore, is_annotation_store
+from flextd.flexcoco.stream import DEFAULT_CHUNK_SIZE, JsonStreamReader
+
+# upper edges of the small and medium areas of the COCO evaluation
+AREA_BINS = (32.0**2, 96.0**2)
+
+
+class DatasetStatistics(NamedTuple):
+    """statistics of the categories of a dataset, in the order of the categories"""
+
+    categories: list[str]
+    category_ids: list[int]
+    num_images: int
+    num_annotations: int
+    # number of images with at least one annotation of each category
+    image_counts: np.ndarray
+    # number of annotations of each category
+    instance_counts: np.ndarray
+    # fraction of the annotations of each category that are crowd annotations
+    crowd_fractions: np.ndarray
+    # (num_categories, len(area_bins) + 1) number of annotations per area range
+    area_histograms: np.ndarray
+    area_bins: tuple[float, ...]
+
+    def image_counts_by_name(self) -> dict[str, int]:
+        """get the number of images of each category name."""
+        return dict(zip(self.categories, self.image_counts.tolist()))
+
+    def to_dict(self) -> dict:
+        """
+        convert the statistics to a dictionary that can be serialized as json.
+
+        Returns
+        -------
+        statistics: dict
+            numbers of images and annotations, the area bins and a dictionary of the
+            statistics of each category name
+        """
+        return {
+            "num_images": self.num_images,
+            "num_annotations": self.num_annotations,
+            "area_bins": list(self.area_bins),
+            "categories": {
+                name: {
+                    "id": self.category_ids[i],
+                    "images": int(self.image_counts[i]),
+                    "instances": int(self.instance_counts[i]),
+                    "crowd_fraction": float(self.crowd_fractions[i]),
+                    "area_histogram": self.area_histograms[i].tolist(),
+                }
+                for i, name in enumerate(self.categories)
+            },
+        }
+
+
+def _index_of(ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """get the index of each value in ids, -1 for values that are not in ids."""
+    if len(ids) == 0:
+        return np.full(len(values), -1, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    positions = np.minimum(np.searchsorted(ids[order], values), len(ids) - 1)
+    return np.where(ids[order][positions] == values, order[positions], -1)
+
+
+def compute_statistics(
+    categories: list[dict],
+    num_images: int,
+    ann_image_index: np.ndarray,
+    ann_category_id: np.ndarray,
+    ann_area: np.ndarray,
+    ann_iscrowd: np.ndarray,
+    area_bins: tuple[float, ...] = AREA_BINS,
+) -> DatasetStatistics:
+    """
+    compute the statistics of the categories from annotation columns in one pass.
+    Annotations of categories that are not in categories are ignored.
+
+    Parameters
+    ----------
+    categories: list[dict]
+        COCO categories
+    num_images: int
+        number of images
+    ann_image_index: np.ndarray
+        index of the image of each annotation
+    ann_category_id: np.ndarray
+        category id of each annotation
+    ann_area: np.ndarray
+        area of each annotation
+    ann_iscrowd: np.ndarray
+        crowd flag of each annotation
+    area_bins: tuple[float, ...]
+        ascending upper edges of the area ranges of the histograms
+
+    Returns
+    -------
+    statistics: DatasetStatistics
+        statistics of the categories
+    """
+    category_ids = np.array([category["id"] for category in categories], np.int64)
+    num_categories = len(category_ids)
+    category_index = _index_of(category_ids, np.asarray(ann_category_id, np.int64))
+    # annotations of unknown categories are ignored
+    known = category_index >= 0
+    category_index = category_index[known]
+    ann_image_index = np.asarray(ann_image_index, dtype=np.int64)[known]
+    ann_area = np.asarray(ann_area, dtype=np.float64)[known]
+    ann_iscrowd = np.asarray(ann_iscrowd)[known]
+
+    instance_counts = np.bincount(category_index, minlength=num_categories)
+    # each (image, category) pair is counted once
+    pairs = np.unique(ann_image_index * num_categories + category_index)
+    image_counts = np.bincount(pairs % max(num_categories, 1), minlength=num_categories)
+    crowd_counts = np.bincount(
+        category_index, weights=ann_iscrowd != 0, minlength=num_categories
+    )
+    crowd_fractions = crowd_counts / np.maximum(instance_counts, 1)
+    num_area_bins = len(area_bins) + 1
+    area_bin = np.searchsorted(np.asarray(area_bins, np.float64), ann_area, "right")
+    area_histograms = np.bincount(
+        category_index * num_area_bins + area_bin,
+        minlength=num_categories * num_area_bins,
+    ).reshape(num_categories, num_area_bins)
+    return DatasetStatistics(
+        categories=[category["name"] for category in categories],
+        category_ids=category_ids.tolist(),
+        num_images=int(num_images),
+        num_annotations=int(len(category_index)),
+        image_counts=image_counts,
+        instance_counts=instance_counts,
+        crowd_fractions=crowd_fractions,
+        area_histograms=area_histograms,
+        area_bins=tuple(area_bins),
+    )
+
+
+def _statistics_from_columns(
+    categories: list[dict],
+    image_ids: list[int],
+    columns: dict[str, list],
+    area_bins: tuple[float, ...],
+) -> DatasetStatistics:
+    """compute the statistics from the image ids and the annotation columns."""
+    ann_image_index = _index_of(
+        np.array(image_ids, dtype=np.int64),
+        np.array(columns["image_id"], dtype=np.int64),
+    )
+    # annotations of images that are not in the images list are dropped
+    known = ann_image_index >= 0
+    return compute_statistics(
+        categories,
+        len(image_ids),
+        ann_image_index[known],
+        np.array(columns["category_id"], dtype=np.int64)[known],
+        np.array(columns["area"], dtype=np.float64)[known],
+        np.array(columns["iscrowd"], dtype=np.int64)[known],
+        area_bins,
+    )
+
+
+def get_annotation_dict_statistics(
+    annotation_dict: dict, area_bins: tuple[float, ...] = AREA_BINS
+) -> DatasetStatistics:
+    """
+    compute the statistics of the categories of a COCO annotation dictionary.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+    area_bins: tuple[float, ...]
+        ascending upper edges of the area ranges of the histograms
+
+    Returns
+    -------
+    statistics: DatasetStatistics
+        statistics of the categories
+    """
+    annotations = annotation_dict["annotations"]
+    # one list per field, in the order of the file, is faster than one pass that
+    # builds records
+    columns = {
+        "image_id": [ann["image_id"] for ann in annotations],
+        "category_id": [ann["category_id"] for ann in annotations],
+        "area": [ann.get("area", 0.0) for ann in annotations],
+        "iscrowd": [ann.get("iscrowd", 0) for ann in annotations],
+    }
+    return _statistics_from_columns(
+        annotation_dict.get("categories", []),
+        [image["id"] for image in annotation_dict["images"]],
+        columns,
+        area_bins,
+    )
+
+
+def get_store_statistics(
+    store: CocoAnnotationStore, area_bins: tuple[float, ...] = AREA_BINS
+) -> DatasetStatistics:
+    """
+    compute the statistics of the categories of an annotation store from its columns.
+
+    Parameters
+    ----------
+    store: CocoAnnotationStore
+        annotation store
+    area_bins: tuple[float, ...]
+        ascending upper edges of the area ranges of the histograms
+
+    Returns
+    -------
+    statistics: DatasetStatistics
+        statistics of the categories
+    """
+    return compute_statistics(
+        store.dataset["categories"],
+        store.num_images,
+        store.columns["ann_image_index"],
+        store.columns["ann_category_id"],
+        store.columns["ann_area"],
+        store.columns["ann_iscrowd"],
+        area_bins,
+    )
+
+
+def get_annotation_file_statistics(
+    annotation_file: str,
+    area_bins: tuple[float, ...] = AREA_BINS,
+    streaming: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> DatasetStatistics:
+    """
+    compute the statistics of the categories of an annotation file without building a
+    dataset or a COCO index.
+
+    Parameters
+    ----------
+    annotation_file: str
+        path to the annotation json file or the annotation store directory
+    area_bins: tuple[float, ...]
+        ascending upper edges of the area ranges of the histograms
+    streaming: bool
+        read the json file incrementally, keeping only the fields used by the
+        statistics in memory
+    chunk_size: int
+        number of characters read at once when streaming
+
+    Returns
+    -------
+    statistics: DatasetStatistics
+        statistics of the categories
+    """
+    if is_annotation_store(annotation_file):
+        return get_store_statistics(
+            CocoAnnotationStore.load(annotation_file), area_bins
+        )
+    if not streaming:
+        # typed records without the segmentation, which is skipped while parsing when
+        # msgspec is installed
+        index = load_annotation_index(annotation_file)
+        annotations = index.annotations
+        columns = {
+            "image_id": [ann.image_id for ann in annotations],
+            "category_id": [ann.category_id for ann in annotations],
+            "area": [ann.area for ann in annotations],
+            "iscrowd": [ann.iscrowd for ann in annotations],
+        }
+        return _statistics_from_columns(
+            [category._asdict() for category in index.categories],
+            [image.id for image in index.images],
+            columns,
+            area_bins,
+        )
+
+    categories, image_ids = [], []
+    columns = {"image_id": [], "category_id": [], "area": [], "iscrowd": []}
+    with open(annotation_file) as f:
+        reader = JsonStreamReader(f, chunk_size)
+        for key, value in reader.iter_items():
+            if key == "images":
+                image_ids = [image["id"] for image in value.iter_array()]
+            elif key == "annotations":
+                for ann in value.iter_array():
+                    columns["image_id"].append(ann["image_id"])
+                    columns["category_id"].append(ann["category_id"])
+                    columns["area"].append(ann.get("area", 0.0))
+                    columns["iscrowd"].append(ann.get("iscrowd", 0))
+            elif key == "categories":
+                categories = list(value.iter_array())
+            else:
+                value.skip_value()
+    return _statistics_from_columns(categories, image_ids, columns, area_bins)
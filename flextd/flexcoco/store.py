@@ -0,0 +1,586 @@
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+from flextd.flexcoco import jsonio
+from flextd.flexcoco.tempdirs import make_shared_temp_dir, remove_when_collected
+from flextd.flexcoco.utils import filter_dicts_by_exclusion, filter_dicts_by_inclusion
+
+STORE_FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# columns of a store. images are stored in the order of the annotation file, and
+# annotations are grouped by image so that the annotations of image i are the rows
+# ann_offsets[i]:ann_offsets[i + 1]
+COLUMNS = (
+    "image_id",
+    "image_height",
+    "image_width",
+    "image_id_order",
+    "file_name_offsets",
+    "file_name_data",
+    "ann_offsets",
+    "ann_id",
+    "ann_image_index",
+    "ann_category_id",
+    "ann_bbox",
+    "ann_area",
+    "ann_iscrowd",
+    "ann_id_order",
+    "segmentation_offsets",
+    "segmentation_data",
+)
+
+
+def _is_array_like(obj) -> bool:
+    return hasattr(obj, "__iter__") and hasattr(obj, "__len__")
+
+
+def _as_list(ids) -> list:
+    if ids is None:
+        return []
+    return list(ids) if _is_array_like(ids) else [ids]
+
+
+def _encode_blobs(blobs: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    """concatenate byte strings into a data array and an offset array."""
+    lengths = np.fromiter(
+        (len(blob) for blob in blobs), dtype=np.int64, count=len(blobs)
+    )
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+    return offsets, data
+
+
+def _gather_blobs(
+    offsets: np.ndarray, data: np.ndarray, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """select the blobs of the given rows from a data array and an offset array."""
+    starts = offsets[:-1][rows]
+    lengths = offsets[1:][rows] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(
+        new_offsets[-1], dtype=np.int64
+    )
+    return new_offsets, np.ascontiguousarray(data[positions])
+
+
+def build_annotation_columns(annotation_dict: dict) -> dict[str, np.ndarray]:
+    """
+    convert a COCO annotation dictionary into the columns of an annotation store.
+    Annotations whose image is not in the images list are dropped.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+
+    Returns
+    -------
+    columns: dict[str, np.ndarray]
+        dictionary of column name and array
+    """
+    images = annotation_dict["images"]
+    image_index_of = {image["id"]: i for i, image in enumerate(images)}
+    annotations = [
+        annotation
+        for annotation in annotation_dict["annotations"]
+        if annotation["image_id"] in image_index_of
+    ]
+    ann_image_index = np.array(
+        [image_index_of[annotation["image_id"]] for annotation in annotations],
+        dtype=np.int64,
+    )
+    # group annotations by image, keeping the file order within an image
+    order = np.argsort(ann_image_index, kind="stable")
+    annotations = [annotations[i] for i in order]
+    ann_image_index = ann_image_index[order]
+
+    columns = {
+        "image_id": np.array([image["id"] for image in images], dtype=np.int64),
+        "image_height": np.array([image["height"] for image in images], np.int32),
+        "image_width": np.array([image["width"] for image in images], np.int32),
+        "ann_id": np.array([ann["id"] for ann in annotations], dtype=np.int64),
+        "ann_image_index": ann_image_index,
+        "ann_category_id": np.array(
+            [ann["category_id"] for ann in annotations], dtype=np.int64
+        ),
+        "ann_bbox": np.array(
+            [ann.get("bbox", [0.0, 0.0, 0.0, 0.0]) for ann in annotations],
+            dtype=np.float64,
+        ).reshape(-1, 4),
+        "ann_area": np.array(
+            [ann.get("area", 0.0) for ann in annotations], dtype=np.float64
+        ),
+        "ann_iscrowd": np.array(
+            [ann.get("iscrowd", 0) for ann in annotations], dtype=np.uint8
+        ),
+    }
+    columns["file_name_offsets"], columns["file_name_data"] = _encode_blobs(
+        [image["file_name"].encode() for image in images]
+    )
+    columns["segmentation_offsets"], columns["segmentation_data"] = _encode_blobs(
+        [jsonio.dumps(ann.get("segmentation", [])) for ann in annotations]
+    )
+    _add_derived_columns(columns)
+    return columns
+
+
+def _add_derived_columns(columns: dict[str, np.ndarray]):
+    """add the annotation offsets per image and the sort orders of the ids."""
+    num_images = len(columns["image_id"])
+    counts = np.bincount(columns["ann_image_index"], minlength=num_images)
+    ann_offsets = np.zeros(num_images + 1, dtype=np.int64)
+    np.cumsum(counts, out=ann_offsets[1:])
+    columns["ann_offsets"] = ann_offsets
+    columns["image_id_order"] = np.argsort(columns["image_id"], kind="stable")
+    columns["ann_id_order"] = np.argsort(columns["ann_id"], kind="stable")
+
+
+class _ImageMapping(Mapping):
+    """read-only mapping of image id to image dictionary, like COCO.imgs"""
+
+    def __init__(self, store: "CocoAnnotationStore"):
+        self._store = store
+
+    def __getitem__(self, image_id: int) -> dict:
+        index = self._store.image_index(image_id)
+        if index < 0:
+            raise KeyError(image_id)
+        return self._store.image(index)
+
+    def __iter__(self):
+        return iter(self._store.columns["image_id"].tolist())
+
+    def __len__(self) -> int:
+        return self._store.num_images
+
+
+class CocoAnnotationStore:
+    """
+    Columnar annotation store with the COCO API used by flextd.
+
+    Images and annotations are held in numpy arrays, and segmentations and file names
+    in offset-indexed byte arrays. A store saved with `save` is loaded with memory
+    mapped arrays, so loading takes the same time regardless of the dataset size and the
+    arrays are shared between processes through the page cache.
+    Image and annotation dictionaries are built on access and only contain the fields
+    of the store (id, file_name, height, width and id, image_id, category_id, bbox,
+    area, iscrowd, segmentation).
+
+    Attributes
+    ----------
+    columns: dict[str, np.ndarray]
+        dictionary of column name and array
+    dataset: dict
+        annotation dictionary without images and annotations (info, licenses, categories)
+    cats: dict[int, dict]
+        dictionary of category id and category
+    store_dir: str | None
+        path to the store directory when the store is memory mapped
+    """
+
+    def __init__(
+        self, columns: dict[str, np.ndarray], dataset: dict, store_dir: str = None
+    ):
+        self.columns = columns
+        self.dataset = dataset
+        self.cats = {category["id"]: category for category in dataset["categories"]}
+        self.store_dir = store_dir
+
+    @classmethod
+    def from_dict(cls, annotation_dict: dict) -> "CocoAnnotationStore":
+        """create a store from a COCO annotation dictionary."""
+        dataset = {
+            key: value
+            for key, value in annotation_dict.items()
+            if key not in ("images", "annotations")
+        }
+        dataset.setdefault("categories", [])
+        return cls(build_annotation_columns(annotation_dict), dataset)
+
+    @classmethod
+    def load(cls, store_dir: str, mmap: bool = True) -> "CocoAnnotationStore":
+        """
+        load a store saved with `save`.
+
+        Parameters
+        ----------
+        store_dir: str
+            path to the store directory
+        mmap: bool
+            memory map the arrays instead of reading them
+
+        Returns
+        -------
+        store: CocoAnnotationStore
+        """
+        store_dir = str(store_dir)
+        meta = jsonio.load_json(os.path.join(store_dir, META_FILE))
+        if meta["version"] != STORE_FORMAT_VERSION:
+            raise ValueError(
+                f"unsupported annotation store version {meta['version']} "
+                f"(expected {STORE_FORMAT_VERSION})"
+            )
+        columns = {
+            name: np.load(
+                os.path.join(store_dir, f"{name}.npy"),
+                mmap_mode="r" if mmap else None,
+            )
+            for name in COLUMNS
+        }
+        return cls(columns, meta["dataset"], store_dir if mmap else None)
+
+    def save(self, store_dir: str) -> str:
+        """
+        save the store to a directory.
+
+        Parameters
+        ----------
+        store_dir: str
+            path to the store directory
+
+        Returns
+        -------
+        store_dir: str
+            path to the store directory
+        """
+        store_dir = str(store_dir)
+        os.makedirs(store_dir, exist_ok=True)
+        for name in COLUMNS:
+            np.save(os.path.join(store_dir, f"{name}.npy"), self.columns[name])
+        # meta.json is written last, so a store without it is incomplete
+        jsonio.dump_json(
+            {"version": STORE_FORMAT_VERSION, "dataset": self.dataset},
+            os.path.join(store_dir, META_FILE),
+        )
+        return store_dir
+
+    def share(self, directory: str = None) -> "CocoAnnotationStore":
+        """
+        save the store to a temporary directory and memory map it.
+
+        The arrays of the returned store live in the page cache instead of the Python
+        heap, so forked DataLoader workers read them without copying pages, and spawned
+        workers receive only the path. The temporary directory is removed when the
+        returned store is garbage collected in the process that created it.
+
+        Parameters
+        ----------
+        directory: str
+            parent of the temporary directory. /dev/shm is used when available.
+
+        Returns
+        -------
+        store: CocoAnnotationStore
+            memory mapped store
+        """
+        store_dir = make_shared_temp_dir("flextd-store-", directory)
+        try:
+            self.save(store_dir)
+        except BaseException:
+            shutil.rmtree(store_dir, ignore_errors=True)
+            raise
+        store = CocoAnnotationStore.load(store_dir)
+        remove_when_collected(store, store_dir)
+        return store
+
+    def __getstate__(self) -> dict:
+        # memory mapped stores are pickled by path, e.g. for spawned DataLoader workers
+        if self.store_dir is not None:
+            return {"store_dir": self.store_dir}
+        return self.__dict__.copy()
+
+    def __setstate__(self, state: dict):
+        if "store_dir" in state and "columns" not in state:
+            state = CocoAnnotationStore.load(state["store_dir"]).__dict__
+        self.__dict__.update(state)
+
+    @property
+    def num_images(self) -> int:
+        return len(self.columns["image_id"])
+
+    @property
+    def num_annotations(self) -> int:
+        return len(self.columns["ann_id"])
+
+    @property
+    def imgs(self) -> Mapping:
+        """mapping of image id to image dictionary"""
+        return _ImageMapping(self)
+
+    def _find(self, ids: np.ndarray, values, order_column: str) -> np.ndarray:
+        """find the rows of the given ids. rows of unknown ids are -1."""
+        values = np.asarray(values, dtype=np.int64).reshape(-1)
+        order = self.columns[order_column]
+        if len(order) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        sorted_ids = ids[order]
+        positions = np.searchsorted(sorted_ids, values).clip(0, len(order) - 1)
+        rows = np.asarray(order[positions], dtype=np.int64)
+        rows[sorted_ids[positions] != values] = -1
+        return rows
+
+    def image_index(self, image_id: int) -> int:
+        """get the index of an image id. -1 if the image is not in the store."""
+        return int(self._find(self.columns["image_id"], image_id, "image_id_order")[0])
+
+    def file_name(self, index: int) -> str:
+        """get the file name of the image at the index."""
+        offsets = self.columns["file_name_offsets"]
+        data = self.columns["file_name_data"][offsets[index] : offsets[index + 1]]
+        return data.tobytes().decode()
+
+    def image(self, index: int) -> dict:
+        """get the image dictionary of the image at the index."""
+        return {
+            "id": int(self.columns["image_id"][index]),
+            "file_name": self.file_name(index),
+            "height": int(self.columns["image_height"][index]),
+            "width": int(self.columns["image_width"][index]),
+        }
+
+    def annotation(self, row: int) -> dict:
+        """get the annotation dictionary of the annotation at the row."""
+        offsets = self.columns["segmentation_offsets"]
+        segmentation = self.columns["segmentation_data"][
+            offsets[row] : offsets[row + 1]
+        ]
+        image_index = self.columns["ann_image_index"][row]
+        return {
+            "id": int(self.columns["ann_id"][row]),
+            "image_id": int(self.columns["image_id"][image_index]),
+            "category_id": int(self.columns["ann_category_id"][row]),
+            "bbox": self.columns["ann_bbox"][row].tolist(),
+            "area": float(self.columns["ann_area"][row]),
+            "iscrowd": int(self.columns["ann_iscrowd"][row]),
+            "segmentation": jsonio.loads(segmentation.tobytes()),
+        }
+
+    def image_annotations(self, index: int) -> list[dict]:
+        """get the annotation dictionaries of the image at the index."""
+        offsets = self.columns["ann_offsets"]
+        return [
+            self.annotation(row) for row in range(offsets[index], offsets[index + 1])
+        ]
+
+    def filter(
+        self,
+        include_files: list[str] = None,
+        exclude_files: list[str] = None,
+        include_categories: list[str] = None,
+        exclude_categories: list[str] = None,
+    ) -> "CocoAnnotationStore":
+        """
+        filter the store by file names and category names like `filter_annotation_dict`.
+
+        Returns
+        -------
+        store: CocoAnnotationStore
+            new in-memory store
+        """
+        image_mask = np.ones(self.num_images, dtype=bool)
+        if include_files is not None or exclude_files is not None:
+            file_names = [self.file_name(i) for i in range(self.num_images)]
+            if include_files is not None:
+                values = set(include_files)
+                image_mask &= np.fromiter(
+                    (name in values for name in file_names), bool, self.num_images
+                )
+            if exclude_files is not None:
+                values = set(exclude_files)
+                image_mask &= np.fromiter(
+                    (name not in values for name in file_names), bool, self.num_images
+                )
+        ann_mask = image_mask[self.columns["ann_image_index"]]
+
+        categories = self.dataset["categories"]
+        if include_categories is not None or exclude_categories is not None:
+            if include_categories is not None:
+                categories = filter_dicts_by_inclusion(
+                    categories, key="name", value_list=include_categories
+                )
+            if exclude_categories is not None:
+                categories = filter_dicts_by_exclusion(
+                    categories, key="name", value_list=exclude_categories
+                )
+            category_ids = [category["id"] for category in categories]
+            ann_mask &= np.isin(self.columns["ann_category_id"], category_ids)
+            image_mask &= (
+                np.bincount(
+                    self.columns["ann_image_index"][ann_mask],
+                    minlength=self.num_images,
+                )
+                > 0
+            )
+        return self.select(np.flatnonzero(image_mask), ann_mask, categories)
+
+    def select(
+        self,
+        image_indices: np.ndarray,
+        ann_mask: np.ndarray = None,
+        categories: list[dict] = None,
+    ) -> "CocoAnnotationStore":
+        """
+        select images, and optionally annotations and categories, into a new store.
+
+        Parameters
+        ----------
+        image_indices: np.ndarray
+            ascending indices of the images to keep
+        ann_mask: np.ndarray
+            boolean mask of the annotations to keep. annotations of images that are not
+            kept are always dropped.
+        categories: list[dict]
+            categories of the new store. all categories are kept by default.
+
+        Returns
+        -------
+        store: CocoAnnotationStore
+            new in-memory store
+        """
+        image_indices = np.asarray(image_indices, dtype=np.int64)
+        image_mask = np.zeros(self.num_images, dtype=bool)
+        image_mask[image_indices] = True
+        ann_image_index = self.columns["ann_image_index"]
+        row_mask = image_mask[ann_image_index]
+        if ann_mask is not None:
+            row_mask &= ann_mask
+        rows = np.flatnonzero(row_mask)
+        new_image_index = np.cumsum(image_mask) - 1
+
+        columns = {
+            "image_id": self.columns["image_id"][image_indices],
+            "image_height": self.columns["image_height"][image_indices],
+            "image_width": self.columns["image_width"][image_indices],
+            "ann_id": self.columns["ann_id"][rows],
+            "ann_image_index": new_image_index[ann_image_index[rows]],
+            "ann_category_id": self.columns["ann_category_id"][rows],
+            "ann_bbox": self.columns["ann_bbox"][rows],
+            "ann_area": self.columns["ann_area"][rows],
+            "ann_iscrowd": self.columns["ann_iscrowd"][rows],
+        }
+        columns["file_name_offsets"], columns["file_name_data"] = _gather_blobs(
+            self.columns["file_name_offsets"],
+            self.columns["file_name_data"],
+            image_indices,
+        )
+        columns["segmentation_offsets"], columns["segmentation_data"] = _gather_blobs(
+            self.columns["segmentation_offsets"],
+            self.columns["segmentation_data"],
+            rows,
+        )
+        _add_derived_columns(columns)
+        dataset = dict(self.dataset)
+        if categories is not None:
+            dataset["categories"] = categories
+        return CocoAnnotationStore(columns, dataset)
+
+    # COCO API
+
+    def getImgIds(self, imgIds=[], catIds=[]) -> list[int]:
+        img_ids = _as_list(imgIds)
+        cat_ids = _as_list(catIds)
+        if len(img_ids) == 0 and len(cat_ids) == 0:
+            return self.columns["image_id"].tolist()
+        ids = set(img_ids)
+        for i, cat_id in enumerate(cat_ids):
+            rows = self.columns["ann_category_id"] == cat_id
+            image_indices = np.unique(self.columns["ann_image_index"][rows])
+            cat_img_ids = set(self.columns["image_id"][image_indices].tolist())
+            if i == 0 and len(ids) == 0:
+                ids = cat_img_ids
+            else:
+                ids &= cat_img_ids
+        return list(ids)
+
+    def getCatIds(self, catNms=[], supNms=[], catIds=[]) -> list[int]:
+        cat_nms = _as_list(catNms)
+        sup_nms = _as_list(supNms)
+        cat_ids = _as_list(catIds)
+        categories = self.dataset["categories"]
+        if len(cat_nms) > 0:
+            categories = [c for c in categories if c["name"] in cat_nms]
+        if len(sup_nms) > 0:
+            categories = [c for c in categories if c["supercategory"] in sup_nms]
+        if len(cat_ids) > 0:
+            categories = [c for c in categories if c["id"] in cat_ids]
+        return [category["id"] for category in categories]
+
+    def getAnnIds(self, imgIds=[], catIds=[], areaRng=[], iscrowd=None) -> list[int]:
+        img_ids = _as_list(imgIds)
+        cat_ids = _as_list(catIds)
+        if len(img_ids) > 0:
+            offsets = self.columns["ann_offsets"]
+            indices = self._find(self.columns["image_id"], img_ids, "image_id_order")
+            indices = indices[indices >= 0]
+            rows = np.concatenate(
+                [np.arange(offsets[i], offsets[i + 1]) for i in indices]
+                + [np.zeros(0, dtype=np.int64)]
+            )
+        else:
+            rows = np.arange(self.num_annotations)
+        if len(cat_ids) > 0:
+            rows = rows[np.isin(self.columns["ann_category_id"][rows], cat_ids)]
+        if len(areaRng) > 0:
+            area = self.columns["ann_area"][rows]
+            rows = rows[(area > areaRng[0]) & (area < areaRng[1])]
+        if iscrowd is not None:
+            rows = rows[self.columns["ann_iscrowd"][rows] == iscrowd]
+        return self.columns["ann_id"][rows].tolist()
+
+    def loadImgs(self, ids=[]) -> list[dict]:
+        indices = self._find(self.columns["image_id"], _as_list(ids), "image_id_order")
+        if np.any(indices < 0):
+            raise KeyError(ids)
+        return [self.image(i) for i in indices]
+
+    def loadAnns(self, ids=[]) -> list[dict]:
+        rows = self._find(self.columns["ann_id"], _as_list(ids), "ann_id_order")
+        if np.any(rows < 0):
+            raise KeyError(ids)
+        return [self.annotation(row) for row in rows]
+
+    def loadCats(self, ids=[]) -> list[dict]:
+        return [self.cats[cat_id] for cat_id in _as_list(ids)]
+
+    def annToRLE(self, ann: dict) -> dict:
+        image = self.loadImgs(ann["image_id"])[0]
+        # masks imports torch and pycocotools, which the store does not need otherwise
+        from flextd.flexcoco.masks import ann_to_rle
+
+        return ann_to_rle(ann, image["height"], image["width"])
+
+    def annToMask(self, ann: dict) -> np.ndarray:
+        from pycocotools import mask as mask_utils
+
+        return mask_utils.decode(self.annToRLE(ann))
+
+
+def is_annotation_store(path: str) -> bool:
+    """check whether the path is a directory saved by `CocoAnnotationStore.save`."""
+    return os.path.isfile(os.path.join(str(path), META_FILE))
+
+
+def convert_to_annotation_store(annotation_file: str, store_dir: str) -> str:
+    """
+    convert a COCO annotation file into an annotation store directory.
+
+    Parameters
+    ----------
+    annotation_file: str
+        path to the annotation file
+    store_dir: str
+        path to the store directory
+
+    Returns
+    -------
+    store_dir: str
+        path to the store directory
+    """
+    annotation_dict = jsonio.load_json(annotation_file)
+    return CocoAnnotationStore.from_dict(annotation_dict).save(store_dir)
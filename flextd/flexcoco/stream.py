@@ -0,0 +1,320 @@
+import json
+import os
+from typing import Any, Iterator, NamedTuple
+
+from flextd.flexcoco.jsonio import dumps
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\n\r"
+
+
+class FilterCounts(NamedTuple):
+    """numbers of images and annotations before and after filtering"""
+
+    input_images: int
+    input_annotations: int
+    images: int
+    annotations: int
+
+
+class JsonStreamReader:
+    """
+    Incremental reader of a JSON document whose top level is an object.
+
+    Only a window of the file is kept in memory. The values of the top level keys are
+    either decoded as a whole with `read_value` or, for arrays, element by element with
+    `iter_array`.
+
+    Attributes
+    ----------
+    file:
+        text file object opened for reading
+    chunk_size: int
+        number of characters read from the file at once
+    """
+
+    def __init__(self, file, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int = None) -> bool:
+        """read the next chunk into the buffer. return False at the end of the file."""
+        if self._eof:
+            return False
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """return the next non-whitespace character without consuming it."""
+        while True:
+            while self._pos < len(self._buffer):
+                if self._buffer[self._pos] not in _WHITESPACE:
+                    return self._buffer[self._pos]
+                self._pos += 1
+            if not self._fill():
+                raise ValueError("unexpected end of JSON document")
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if character not in characters:
+            raise ValueError(
+                f"expected one of {characters!r} but got {character!r} "
+                f"in JSON document"
+            )
+        self._pos += 1
+        return character
+
+    def read_value(self) -> Any:
+        """decode the next JSON value."""
+        self._peek()
+        while True:
+            # values larger than a chunk grow the read size geometrically
+            size = max(self.chunk_size, len(self._buffer) - self._pos)
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill(size):
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """decode the elements of the next JSON array one by one."""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._expect(",]") == "]":
+                return
+
+    def skip_value(self):
+        """consume the next JSON value. arrays are skipped element by element."""
+        if self._peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.read_value()
+
+    def iter_items(self) -> Iterator[tuple[str, "JsonStreamReader"]]:
+        """
+        iterate over the keys of the top level object.
+
+        The value of each key has to be consumed with `read_value` or `iter_array`
+        before the iteration continues.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key, self
+            if self._expect(",}") == "}":
+                return
+
+
+def _collect_ids(
+    annotation_file: str,
+    include_files: list[str] = None,
+    exclude_files: list[str] = None,
+    include_categories: list[str] = None,
+    exclude_categories: list[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> tuple[set, set | None]:
+    """
+    first pass of the streaming filter.
+    return the ids of the images and categories that are kept. The category ids are None
+    when no category filter is given.
+    When the categories come after the annotations in the file, the annotations are read
+    once more to find the images that still have annotations.
+    """
+    include_files = None if include_files is None else set(include_files)
+    exclude_files = None if exclude_files is None else set(exclude_files)
+    include_categories = None if include_categories is None else set(include_categories)
+    exclude_categories = None if exclude_categories is None else set(exclude_categories)
+    filter_categories = include_categories is not None or exclude_categories is not None
+
+    image_ids = set()
+    category_ids = None
+    # ids of the images that have an annotation of a kept category
+    annotated_image_ids = None
+
+    def collect_annotated_image_ids(annotations: Iterator[dict]) -> set:
+        return {
+            annotation["image_id"]
+            for annotation in annotations
+            if annotation["category_id"] in category_ids
+        }
+
+    with open(annotation_file) as f:
+        reader = JsonStreamReader(f, chunk_size)
+        for key, value in reader.iter_items():
+            if key == "images":
+                for image in value.iter_array():
+                    if include_files is not None and (
+                        image["file_name"] not in include_files
+                    ):
+                        continue
+                    if (
+                        exclude_files is not None
+                        and image["file_name"] in exclude_files
+                    ):
+                        continue
+                    image_ids.add(image["id"])
+            elif key == "annotations" and category_ids is not None:
+                annotated_image_ids = collect_annotated_image_ids(value.iter_array())
+            elif key == "categories" and filter_categories:
+                categories = list(value.iter_array())
+                if include_categories is not None:
+                    categories = [
+                        c for c in categories if c["name"] in include_categories
+                    ]
+                if exclude_categories is not None:
+                    categories = [
+                        c for c in categories if c["name"] not in exclude_categories
+                    ]
+                category_ids = {category["id"] for category in categories}
+            else:
+                value.skip_value()
+
+    if not filter_categories:
+        return image_ids, None
+
+    category_ids = category_ids or set()
+    if annotated_image_ids is None:
+        annotated_image_ids = set()
+        with open(annotation_file) as f:
+            reader = JsonStreamReader(f, chunk_size)
+            for key, value in reader.iter_items():
+                if key == "annotations":
+                    annotated_image_ids = collect_annotated_image_ids(
+                        value.iter_array()
+                    )
+                else:
+                    value.skip_value()
+    image_ids &= annotated_image_ids
+    return image_ids, category_ids
+
+
+def _write_array(f, items: Iterator[Any]):
+    f.write("[")
+    for i, item in enumerate(items):
+        if i:
+            f.write(", ")
+        f.write(dumps(item).decode())
+    f.write("]")
+
+
+def stream_filter_annotation_file(
+    annotation_file: str,
+    new_annotation_file: str,
+    include_files: list[str] = None,
+    exclude_files: list[str] = None,
+    include_categories: list[str] = None,
+    exclude_categories: list[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    return_counts: bool = False,
+) -> str | tuple[str, FilterCounts]:
+    """
+    filter an annotation file by file names and category names without loading it.
+
+    The annotation file is read twice. The first pass keeps only the ids of the images
+    and categories that survive the filters, and the second pass writes the kept
+    images, annotations and categories straight to the new file. Peak memory depends
+    on the number of ids and the chunk size, not on the size of the file.
+    The result is the same as `filter_dataset`.
+
+    Parameters
+    ----------
+    annotation_file: str
+        path to the annotation file
+    new_annotation_file: str
+        path to the new annotation file
+    include_files: list[str]
+        list of file names to include
+    exclude_files: list[str]
+        list of file names to exclude
+    include_categories: list[str]
+        list of category names to include
+    exclude_categories: list[str]
+        list of category names to exclude
+    chunk_size: int
+        number of characters read from the annotation file at once
+    return_counts: bool
+        also return the numbers of images and annotations before and after filtering
+
+    Returns
+    -------
+    new_annotation_file: str
+        path to the new annotation file
+    counts: FilterCounts
+        numbers of images and annotations, only when return_counts is True
+    """
+    image_ids, category_ids = _collect_ids(
+        annotation_file,
+        include_files=include_files,
+        exclude_files=exclude_files,
+        include_categories=include_categories,
+        exclude_categories=exclude_categories,
+        chunk_size=chunk_size,
+    )
+
+    def keep_annotation(annotation: dict) -> bool:
+        if annotation["image_id"] not in image_ids:
+            return False
+        return category_ids is None or annotation["category_id"] in category_ids
+
+    counts = dict.fromkeys(FilterCounts._fields, 0)
+
+    def counted(items: Iterator[dict], field: str) -> Iterator[dict]:
+        for item in items:
+            counts[field] += 1
+            yield item
+
+    tmp_file = f"{new_annotation_file}.{os.getpid()}.tmp"
+    try:
+        with open(annotation_file) as src, open(tmp_file, "w") as dst:
+            reader = JsonStreamReader(src, chunk_size)
+            dst.write("{")
+            for i, (key, value) in enumerate(reader.iter_items()):
+                if i:
+                    dst.write(", ")
+                dst.write(f"{json.dumps(key)}: ")
+                if key == "images":
+                    items = counted(value.iter_array(), "input_images")
+                    items = (x for x in items if x["id"] in image_ids)
+                    _write_array(dst, counted(items, "images"))
+                elif key == "annotations":
+                    items = counted(value.iter_array(), "input_annotations")
+                    _write_array(
+                        dst, counted(filter(keep_annotation, items), "annotations")
+                    )
+                elif key == "categories" and category_ids is not None:
+                    items = value.iter_array()
+                    _write_array(dst, (x for x in items if x["id"] in category_ids))
+                else:
+                    dst.write(dumps(value.read_value()).decode())
+            dst.write("}")
+        os.replace(tmp_file, new_annotation_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    if return_counts:
+        return new_annotation_file, FilterCounts(**counts)
+    return new_annotation_file
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+
+def make_shared_temp_dir(prefix: str, directory: str = None) -> str:
+    """
+    create a temporary directory for files that are memory mapped by several
+    processes.
+
+    Parameters
+    ----------
+    prefix: str
+        prefix of the directory name
+    directory: str
+        parent of the temporary directory. /dev/shm is used when available, so the
+        files live in memory instead of on disk.
+
+    Returns
+    -------
+    path: str
+        path to the new directory
+    """
+    if directory is None and os.access("/dev/shm", os.W_OK):
+        directory = "/dev/shm"
+    return tempfile.mkdtemp(prefix=prefix, dir=directory)
+
+
+def _remove_temp_dir(path: str, owner_pid: int):
+    # forked workers inherit the finalizer but must not remove the parent's files
+    if os.getpid() == owner_pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_when_collected(owner: object, path: str):
+    """
+    remove a temporary directory when the owner is garbage collected in the current
+    process. Processes forked later do not remove it.
+
+    Parameters
+    ----------
+    owner: object
+        object that uses the directory
+    path: str
+        path to the directory
+    """
+    weakref.finalize(owner, _remove_temp_dir, path, os.getpid())
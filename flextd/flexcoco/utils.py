@@ -1,4 +1,5 @@
-import json
+from flextd.flexcoco.jsonio import dump_json, load_json
+from flextd.flexcoco.stream import stream_filter_annotation_file
 
 
 def filter_dicts_by_inclusion(
@@ -29,11 +30,8 @@ def filter_dicts_by_inclusion(
     >>> filter_dicts_by_inclusion(origins, key, value_list)
     [{'name': 'Alice', 'age': 30}, {'name': 'Charlie', 'age': 35}]
     """
-    new_list = []
-    for origin in origins:
-        if origin[key] in value_list:
-            new_list.append(origin)
-    return new_list
+    values = set(value_list)
+    return [origin for origin in origins if origin[key] in values]
 
 
 def filter_dicts_by_exclusion(
@@ -64,27 +62,51 @@ def filter_dicts_by_exclusion(
     >>> filter_dicts_by_exclusion(origins, key, value_list)
     [{'name': 'Bob', 'age': 25}]
     """
-    new_list = []
-    for origin in origins:
-        if origin[key] not in value_list:
-            new_list.append(origin)
-    return new_list
+    values = set(value_list)
+    return [origin for origin in origins if origin[key] not in values]
 
 
-def filter_dataset(
-    annotation_file: str,
+def has_filter(
     include_files: list[str] = None,
     exclude_files: list[str] = None,
     include_categories: list[str] = None,
     exclude_categories: list[str] = None,
-) -> dict | None:
+) -> bool:
     """
-    filter dataset by file names and category names.
+    check whether any of the include/exclude filters is given.
+
+    Returns
+    -------
+    bool
+        True if at least one filter is not None
+    """
+    return not (
+        (include_files is None)
+        and (exclude_files is None)
+        and (include_categories is None)
+        and (exclude_categories is None)
+    )
+
+
+def filter_annotation_dict(
+    annotation_dict: dict,
+    include_files: list[str] = None,
+    exclude_files: list[str] = None,
+    include_categories: list[str] = None,
+    exclude_categories: list[str] = None,
+) -> dict:
+    """
+    filter an already loaded annotation dictionary by file names and category names.
+
+    The filter values are turned into hash sets once, and each of the images, annotations
+    and categories lists is scanned a single time, so the cost is linear in the size of
+    the annotation dictionary. The order of the source lists is preserved.
+    The given dictionary is not modified; a shallow copy with new lists is returned.
 
     Parameters
     ----------
-    annotation_file: str
-        path to the annotation file
+    annotation_dict: dict
+        COCO annotation dictionary
     include_files: list[str]
         list of file names to include
     exclude_files: list[str]
@@ -96,79 +118,130 @@ def filter_dataset(
 
     Returns
     -------
-    annotation_dict: dict | None
-        filtered annotation dictionary or None if no filter is applied
+    annotation_dict: dict
+        filtered annotation dictionary
     """
-
-    if (
-        (include_files is None)
-        and (exclude_files is None)
-        and (include_categories is None)
-        and (exclude_categories is None)
-    ):
-        return None
-
-    with open(annotation_file) as f:
-        annotation_dict = json.load(f)
+    annotation_dict = dict(annotation_dict)
+    images = annotation_dict["images"]
+    annotations = annotation_dict["annotations"]
 
     # filter by file names
     if include_files is not None or exclude_files is not None:
         # fix image list
-        new_images = annotation_dict["images"]
         if include_files is not None:
-            new_images = filter_dicts_by_inclusion(
-                new_images, key="file_name", value_list=include_files
+            images = filter_dicts_by_inclusion(
+                images, key="file_name", value_list=include_files
             )
         if exclude_files is not None:
-            new_images = filter_dicts_by_exclusion(
-                new_images, key="file_name", value_list=exclude_files
+            images = filter_dicts_by_exclusion(
+                images, key="file_name", value_list=exclude_files
             )
         # fix annotation list
-        new_image_ids = [image["id"] for image in new_images]
-        new_annotations = filter_dicts_by_inclusion(
-            annotation_dict["annotations"], key="image_id", value_list=new_image_ids
-        )
-
-        # fix annotation dictionary
-        annotation_dict["images"] = new_images
-        annotation_dict["annotations"] = new_annotations
+        image_ids = {image["id"] for image in images}
+        annotations = [
+            annotation
+            for annotation in annotations
+            if annotation["image_id"] in image_ids
+        ]
 
     # filter by category names
     if include_categories is not None or exclude_categories is not None:
-
         # fix category list
-        new_categories = annotation_dict["categories"]
+        categories = annotation_dict["categories"]
         if include_categories is not None:
-            new_categories = filter_dicts_by_inclusion(
-                new_categories, key="name", value_list=include_categories
+            categories = filter_dicts_by_inclusion(
+                categories, key="name", value_list=include_categories
             )
         if exclude_categories is not None:
-            new_categories = filter_dicts_by_exclusion(
-                new_categories, key="name", value_list=exclude_categories
+            categories = filter_dicts_by_exclusion(
+                categories, key="name", value_list=exclude_categories
             )
 
         # fix annotation list
-        new_category_ids = [category["id"] for category in new_categories]
-        new_annotations = filter_dicts_by_inclusion(
-            annotation_dict["annotations"],
-            key="category_id",
-            value_list=new_category_ids,
-        )
+        category_ids = {category["id"] for category in categories}
+        annotations = [
+            annotation
+            for annotation in annotations
+            if annotation["category_id"] in category_ids
+        ]
 
         # fix image list
-        new_image_ids = [annotation["image_id"] for annotation in new_annotations]
-        new_images = filter_dicts_by_inclusion(
-            annotation_dict["images"], key="id", value_list=new_image_ids
-        )
+        image_ids = {annotation["image_id"] for annotation in annotations}
+        images = [image for image in images if image["id"] in image_ids]
 
-        # fix annotation dictionary
-        annotation_dict["images"] = new_images
-        annotation_dict["annotations"] = new_annotations
-        annotation_dict["categories"] = new_categories
+        annotation_dict["categories"] = categories
 
+    # fix annotation dictionary
+    annotation_dict["images"] = images
+    annotation_dict["annotations"] = annotations
     return annotation_dict
 
 
+def filter_dataset(
+    annotation_file: str,
+    include_files: list[str] = None,
+    exclude_files: list[str] = None,
+    include_categories: list[str] = None,
+    exclude_categories: list[str] = None,
+) -> dict | None:
+    """
+    filter dataset by file names and category names.
+
+    Parameters
+    ----------
+    annotation_file: str
+        path to the annotation file
+    include_files: list[str]
+        list of file names to include
+    exclude_files: list[str]
+        list of file names to exclude
+    include_categories: list[str]
+        list of category names to include
+    exclude_categories: list[str]
+        list of category names to exclude
+
+    Returns
+    -------
+    annotation_dict: dict | None
+        filtered annotation dictionary or None if no filter is applied
+    """
+
+    if not has_filter(
+        include_files, exclude_files, include_categories, exclude_categories
+    ):
+        return None
+
+    annotation_dict = load_json(annotation_file)
+
+    return filter_annotation_dict(
+        annotation_dict,
+        include_files=include_files,
+        exclude_files=exclude_files,
+        include_categories=include_categories,
+        exclude_categories=exclude_categories,
+    )
+
+
+def write_annotation_file(annotation_dict: dict, new_annotation_file: str) -> str:
+    """
+    write an annotation dictionary to a json file.
+
+    Parameters
+    ----------
+    annotation_dict: dict
+        COCO annotation dictionary
+    new_annotation_file: str
+        path to the new annotation file
+
+    Returns
+    -------
+    new_annotation_file: str
+        path to the new annotation file
+    """
+    dump_json(annotation_dict, new_annotation_file)
+    return new_annotation_file
+
+
 def create_filtered_annotation_file(
     annotation_file: str,
     new_annotation_file: str = None,
@@ -176,9 +249,12 @@ def create_filtered_annotation_file(
     exclude_files: list[str] = None,
     include_categories: list[str] = None,
     exclude_categories: list[str] = None,
+    streaming: bool = False,
 ) -> str:
     """
     create a filtered annotation file by file names and category names.
+    When streaming is True, the annotation file is filtered incrementally without
+    loading it as a whole, which keeps memory usage flat for very large files.
 
     Parameters
     ----------
@@ -194,6 +270,8 @@ def create_filtered_annotation_file(
         list of category names to include
     exclude_categories: list[str]
         list of category names to exclude
+    streaming: bool
+        filter the file with `stream_filter_annotation_file`
 
     Returns
     -------
@@ -201,6 +279,22 @@ def create_filtered_annotation_file(
         path to the annotation file
     """
 
+    if streaming:
+        if not has_filter(
+            include_files, exclude_files, include_categories, exclude_categories
+        ):
+            return annotation_file
+        if new_annotation_file is None:
+            new_annotation_file = annotation_file.replace(".json", "_filtered.json")
+        return stream_filter_annotation_file(
+            annotation_file,
+            new_annotation_file,
+            include_files=include_files,
+            exclude_files=exclude_files,
+            include_categories=include_categories,
+            exclude_categories=exclude_categories,
+        )
+
     annotation_dict = filter_dataset(
         annotation_file=annotation_file,
         include_files=include_files,
@@ -212,8 +306,6 @@ def create_filtered_annotation_file(
     if annotation_dict is not None:
         if new_annotation_file is None:
             new_annotation_file = annotation_file.replace(".json", "_filtered.json")
-        with open(new_annotation_file, "w") as f:
-            json.dump(annotation_dict, f)
-        return new_annotation_file
+        return write_annotation_file(annotation_dict, new_annotation_file)
     else:
         return annotation_file
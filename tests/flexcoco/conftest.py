@@ -0,0 +1,23 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    """directory with a random image for each image of sample_coco.json"""
+    with open(os.path.join(DATA_DIR, "sample_coco.json"), "r") as f:
+        images = json.load(f)["images"]
+    rng = np.random.default_rng(0)
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for image in images:
+        pixels = rng.integers(0, 256, (image["height"], image["width"], 3), np.uint8)
+        # png content keeps the pixels exact, read_image detects the format itself
+        Image.fromarray(pixels).save(image_dir / image["file_name"], format="PNG")
+    return str(image_dir)
@@ -0,0 +1,11 @@
+from flextd.flexcoco.coco_base import FlexCocoDatasetBase
+
+
+class SampleDataset(FlexCocoDatasetBase):
+    """minimal dataset to test the annotation handling of FlexCocoDatasetBase"""
+
+    def __getitem__(self, index):
+        return None, None
+
+    def __len__(self):
+        return len(self.ids)
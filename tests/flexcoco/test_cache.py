@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from flextd.flexcoco.cache import FilteredAnnotationCache
+from flextd.flexcoco.utils import filter_dataset
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+
+
+@pytest.fixture
+def annotation_file(tmp_path):
+    path = str(tmp_path / "sample_coco.json")
+    shutil.copy(os.path.join(DATA_DIR, "sample_coco.json"), path)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FilteredAnnotationCache(str(tmp_path / "cache"))
+
+
+def test_get_or_create__hit_and_miss(cache, annotation_file):
+    first = cache.get_or_create(annotation_file, include_categories=["label1"])
+    second = cache.get_or_create(annotation_file, include_categories=["label1"])
+
+    assert first == second
+    assert os.path.dirname(first) == cache.cache_dir
+    assert (cache.hits, cache.misses) == (1, 1)
+    with open(first) as f:
+        assert json.load(f) == filter_dataset(
+            annotation_file, include_categories=["label1"]
+        )
+
+
+def test_get_or_create__without_filter(cache, annotation_file):
+    assert cache.get_or_create(annotation_file) == annotation_file
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_key__normalized_arguments(cache, annotation_file):
+    key = cache.key(annotation_file, include_files=["b.jpg", "a.jpg", "a.jpg"])
+    assert key == cache.key(annotation_file, include_files=["a.jpg", "b.jpg"])
+    assert key != cache.key(annotation_file, exclude_files=["a.jpg", "b.jpg"])
+    assert cache.key(annotation_file, include_files=[]) != cache.key(annotation_file)
+
+
+def test_key__source_changed(cache, annotation_file):
+    key = cache.key(annotation_file, include_categories=["label1"])
+    with open(annotation_file, "a") as f:
+        f.write("\n")
+    assert key != cache.key(annotation_file, include_categories=["label1"])
+
+
+def test_key__content_digest(tmp_path, annotation_file):
+    cache = FilteredAnnotationCache(str(tmp_path / "cache"), content_digest=True)
+    copied_file = str(tmp_path / "copied.json")
+    shutil.copy(annotation_file, copied_file)
+
+    assert cache.key(annotation_file, exclude_files=["a.jpg"]) == cache.key(
+        copied_file, exclude_files=["a.jpg"]
+    )
+
+
+def test_evict__max_size(tmp_path, annotation_file):
+    cache = FilteredAnnotationCache(str(tmp_path / "cache"), max_size=1)
+    first = cache.get_or_create(annotation_file, include_categories=["label1"])
+    second = cache.get_or_create(annotation_file, include_categories=["label2"])
+
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    assert cache.stats()["files"] == 1
+
+
+def test_evict__max_age(tmp_path, annotation_file):
+    cache = FilteredAnnotationCache(str(tmp_path / "cache"), max_age=60)
+    first = cache.get_or_create(annotation_file, include_categories=["label1"])
+    os.utime(first, (0, 0))
+
+    assert cache.evict() == [first]
+    assert cache.stats() == {"hits": 0, "misses": 1, "files": 0, "size": 0}
+
+
+def test_clear__only_cache_entries(tmp_path, annotation_file):
+    cache = FilteredAnnotationCache(str(tmp_path))
+    other_file = tmp_path / "annotations.json"
+    shutil.copy(annotation_file, other_file)
+    cached_file = cache.get_or_create(annotation_file, include_categories=["label1"])
+
+    assert cached_file.endswith(".flextd-cache.json")
+    assert cache.stats()["files"] == 1
+    cache.max_age = 0
+    assert cache.evict() == [cached_file]
+    cache.get_or_create(annotation_file, include_categories=["label2"])
+    cache.clear()
+    assert sorted(os.listdir(tmp_path)) == ["annotations.json", "sample_coco.json"]
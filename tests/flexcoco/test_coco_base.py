@@ -1,21 +1,17 @@
+import json
 import os
+import shutil
 import pytest
+from torch.utils.data import DataLoader, get_worker_info
 
+from flextd.flexcoco.cache import FilteredAnnotationCache
 from flextd.flexcoco.coco_base import FlexCocoDatasetBase
+from flextd.flexcoco.store import CocoAnnotationStore, convert_to_annotation_store
+from tests.flexcoco.helpers import SampleDataset
 
 
 @pytest.fixture
 def sample_dataset():
-    class SampleDataset(FlexCocoDatasetBase):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-
-        def __getitem__(self, index):
-            return None, None
-
-        def __len__(self):
-            return len(self.ids)
-
     file_path = os.path.dirname(__file__)
     return SampleDataset(
         image_dir="",
@@ -48,3 +44,202 @@ def test_get_statistics(sample_dataset):
         "label4": 2,
     }
     assert sample_dataset.get_statistics() == expected_statistics
+
+
+def test_annotation_cache(tmp_path):
+    file_path = os.path.dirname(__file__)
+    annotation_cache = FilteredAnnotationCache(str(tmp_path))
+    for _ in range(2):
+        dataset = SampleDataset(
+            image_dir="",
+            annotation_file=os.path.join(file_path, "../data/sample_coco.json"),
+            include_categories=["label4"],
+            annotation_cache=annotation_cache,
+        )
+        assert len(dataset) == 2
+    assert (annotation_cache.hits, annotation_cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_new_annotation_file__without_filter(tmp_path, use_cache):
+    file_path = os.path.dirname(__file__)
+    new_annotation_file = str(tmp_path / "new.json")
+
+    dataset = SampleDataset(
+        image_dir="",
+        annotation_file=os.path.join(file_path, "../data/sample_coco.json"),
+        new_annotation_file=new_annotation_file,
+        annotation_cache=str(tmp_path / "cache") if use_cache else None,
+    )
+    assert len(dataset) == 3
+    assert not os.path.exists(new_annotation_file)
+
+
+def test_filtered_annotations_in_memory(tmp_path):
+    file_path = os.path.dirname(__file__)
+    annotation_file = str(tmp_path / "sample_coco.json")
+    shutil.copy(os.path.join(file_path, "../data/sample_coco.json"), annotation_file)
+
+    dataset = SampleDataset(
+        image_dir="", annotation_file=annotation_file, exclude_categories=["label4"]
+    )
+    assert len(dataset) == 2
+    assert dataset.get_categories() == ["label1", "label2", "label3"]
+    assert os.listdir(tmp_path) == ["sample_coco.json"]
+
+    new_annotation_file = str(tmp_path / "new.json")
+    SampleDataset(
+        image_dir="",
+        annotation_file=annotation_file,
+        exclude_categories=["label4"],
+        new_annotation_file=new_annotation_file,
+    )
+    with open(new_annotation_file) as f:
+        assert json.load(f) == dataset.coco.dataset
+
+
+def test_lookup_tables(sample_dataset):
+    assert sample_dataset.category_ids == (1, 2, 3, 4)
+    assert dict(sample_dataset.cat_id2idx) == {1: 0, 2: 1, 3: 2, 4: 3}
+    assert dict(sample_dataset.cat_name2idx) == {
+        "label1": 0,
+        "label2": 1,
+        "label3": 2,
+        "label4": 3,
+    }
+    with pytest.raises(TypeError):
+        sample_dataset.cat_id2idx[5] = 4
+    with pytest.raises(ValueError):
+        sample_dataset.heights[0] = 0
+
+
+def test_large_category_ids(tmp_path):
+    with open(os.path.join(os.path.dirname(__file__), "../data/sample_coco.json")) as f:
+        annotation_dict = json.load(f)
+    new_ids = {1: 10**10, 2: -3}
+    for category in annotation_dict["categories"]:
+        category["id"] = new_ids.get(category["id"], category["id"])
+    for annotation in annotation_dict["annotations"]:
+        annotation["category_id"] = new_ids.get(
+            annotation["category_id"], annotation["category_id"]
+        )
+    annotation_file = tmp_path / "large_ids.json"
+    annotation_file.write_text(json.dumps(annotation_dict))
+
+    dataset = SampleDataset(image_dir="", annotation_file=str(annotation_file))
+    assert dataset.category_ids == (10**10, -3, 3, 4)
+    assert dataset.get_category_name(10**10) == "label1"
+    assert dataset.cat_id2idx[-3] == 1
+
+
+@pytest.mark.parametrize("use_store", [False, True])
+def test_get_image_record(tmp_path, use_store):
+    file_path = os.path.dirname(__file__)
+    annotation_file = os.path.join(file_path, "../data/sample_coco.json")
+    if use_store:
+        annotation_file = convert_to_annotation_store(annotation_file, str(tmp_path))
+    dataset = SampleDataset(
+        image_dir="", annotation_file=annotation_file, exclude_categories=["label2"]
+    )
+
+    for index, img_id in enumerate(dataset.ids):
+        image = dataset.coco.loadImgs(img_id)[0]
+        ann_ids = dataset.coco.getAnnIds(imgIds=img_id)
+        record = dataset.get_image_record(index)
+        assert record.file_name == image["file_name"]
+        assert (record.height, record.width) == (image["height"], image["width"])
+        assert record.ann_slice.stop - record.ann_slice.start == len(ann_ids)
+        assert dataset.get_annotations(index) == dataset.coco.loadAnns(ann_ids)
+
+
+def private_anonymous_kb() -> int:
+    """private dirty memory of the anonymous mappings of this process, e.g. heap pages
+    copied on write after fork. file and shared memory mappings are not counted."""
+    total = 0
+    anonymous = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and not line[0].isupper():
+                anonymous = len(fields) < 6 or fields[5].startswith("[")
+            elif fields[0] == "Private_Dirty:" and anonymous:
+                total += int(fields[1])
+    return total
+
+
+class AnnotationCountDataset(FlexCocoDatasetBase):
+    def __getitem__(self, index):
+        record = self.get_image_record(index)
+        return len(self.get_annotations(index)) + record.height
+
+    def __len__(self):
+        return len(self.ids)
+
+
+_worker_baseline_kb = None
+
+
+def _record_worker_baseline(worker_id):
+    global _worker_baseline_kb
+    _worker_baseline_kb = private_anonymous_kb()
+
+
+def _collate_worker_growth(batch):
+    return get_worker_info().id, private_anonymous_kb() - _worker_baseline_kb
+
+
+def worker_memory_growth(dataset) -> dict[int, int]:
+    """iterate the dataset in two forked workers and return their memory growth"""
+    loader = DataLoader(
+        dataset,
+        batch_size=1000,
+        num_workers=2,
+        multiprocessing_context="fork",
+        worker_init_fn=_record_worker_baseline,
+        collate_fn=_collate_worker_growth,
+    )
+    return {worker_id: growth for worker_id, growth in loader}
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps"), reason="requires /proc/self/smaps"
+)
+def test_shared_index__worker_memory_growth(tmp_path):
+    num_images, anns_per_image = 10000, 10
+    annotation_dict = {
+        "images": [
+            {"id": i, "file_name": f"{i}.jpg", "height": 100, "width": 100}
+            for i in range(num_images)
+        ],
+        "annotations": [
+            {
+                "id": i * anns_per_image + j,
+                "image_id": i,
+                "category_id": j % 5 + 1,
+                "bbox": [0, 0, 10, 10],
+                "area": 100.0,
+                "iscrowd": 0,
+                "segmentation": [[0, 0, 10, 0, 10, 10, 0, 10]],
+            }
+            for i in range(num_images)
+            for j in range(anns_per_image)
+        ],
+        "categories": [
+            {"id": k, "name": f"c{k}", "supercategory": ""} for k in range(1, 6)
+        ],
+    }
+    annotation_file = str(tmp_path / "annotations.json")
+    with open(annotation_file, "w") as f:
+        json.dump(annotation_dict, f)
+    del annotation_dict
+
+    coco_dataset = AnnotationCountDataset("", annotation_file)
+    coco_growth = worker_memory_growth(coco_dataset)
+    del coco_dataset
+    shared_dataset = AnnotationCountDataset("", annotation_file, shared_index=True)
+    shared_growth = worker_memory_growth(shared_dataset)
+
+    assert isinstance(shared_dataset.coco, CocoAnnotationStore)
+    # every worker copies the pages of the python objects of the COCO index
+    for worker_id in (0, 1):
+        assert shared_growth[worker_id] * 4 < coco_growth[worker_id]
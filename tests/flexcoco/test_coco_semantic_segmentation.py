@@ -1 +1,340 @@
-# TODO implement test_coco_semantic_segmentation.py
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+from flextd.flexcoco.mask_cache import SemanticMaskCache
+from flextd.flexcoco.masks import rasterize_category_masks
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+
+def expected_masks(dataset: FlexCocoDatasetBaseSS, index: int) -> np.ndarray:
+    """rasterize the masks of an image with the COCO API."""
+    img_id = dataset.ids[index]
+    image = dataset.coco.loadImgs(img_id)[0]
+    cat_ids = dataset.coco.getCatIds()
+    masks = np.zeros((len(cat_ids), image["height"], image["width"]), dtype=bool)
+    for ann in dataset.coco.loadAnns(dataset.coco.getAnnIds(imgIds=img_id)):
+        channel = cat_ids.index(ann["category_id"])
+        masks[channel] |= dataset.coco.annToMask(ann).astype(bool)
+    return masks
+
+
+def test_getitem(image_dir):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+
+    assert len(dataset) == 3
+    for index in range(len(dataset)):
+        img, target = dataset[index]
+        image = sample_coco["images"][index]
+        assert img.shape == (3, image["height"], image["width"])
+        assert img.dtype == torch.uint8
+        assert target["masks"].dtype == torch.float32
+        np.testing.assert_array_equal(
+            target["masks"].numpy(), expected_masks(dataset, index)
+        )
+        assert target["file_name"] == image["file_name"]
+        assert target["origin_height"] == image["height"]
+        assert target["origin_width"] == image["width"]
+
+
+def test_getitem__filtered_categories(image_dir):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, include_categories=["label2", "label4"]
+    )
+
+    assert len(dataset) == 3
+    _, target = dataset[0]
+    assert target["masks"].shape == (2, 480, 640)
+    np.testing.assert_array_equal(target["masks"].numpy(), expected_masks(dataset, 0))
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_mask_cache(image_dir, tmp_path, num_workers):
+    mask_cache_dir = str(tmp_path / "masks")
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, mask_cache_dir=mask_cache_dir
+    )
+
+    dataset.build_mask_cache(num_workers=num_workers)
+
+    assert len(os.listdir(dataset.mask_cache.cache_dir)) == 3
+    for index in range(len(dataset)):
+        img_id = dataset.ids[index]
+        ann_ids = dataset.coco.getAnnIds(imgIds=img_id)
+        cached = dataset.mask_cache.load(img_id, ann_ids)
+        np.testing.assert_array_equal(cached, expected_masks(dataset, index))
+        _, target = dataset[index]
+        np.testing.assert_array_equal(target["masks"].numpy(), cached)
+    # entries built from other annotations are not used
+    assert dataset.mask_cache.load(dataset.ids[0], [100]) is None
+
+
+def test_mask_cache__category_set(image_dir, tmp_path):
+    mask_cache_dir = str(tmp_path / "masks")
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, mask_cache_dir=mask_cache_dir
+    )
+    filtered = FlexCocoDatasetBaseSS(
+        image_dir,
+        annotation_file,
+        exclude_categories=["label1"],
+        mask_cache_dir=mask_cache_dir,
+    )
+    assert dataset.mask_cache.cache_dir != filtered.mask_cache.cache_dir
+
+    _, target = filtered[0]
+    np.testing.assert_array_equal(target["masks"].numpy(), expected_masks(filtered, 0))
+    assert os.listdir(filtered.mask_cache.cache_dir) == [f"{filtered.ids[0]}.json"]
+
+
+@pytest.mark.parametrize(
+    "target_format, dtype, shape",
+    [
+        ("bool", torch.bool, (4, 480, 640)),
+        ("uint8", torch.uint8, (4, 480, 640)),
+        ("label_map", torch.uint8, (480, 640)),
+        ("packed", torch.uint8, (4, 480, 80)),
+    ],
+)
+def test_target_format(image_dir, target_format, dtype, shape):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, target_format=target_format
+    )
+    collate_fn = dataset.get_collate_fn()
+
+    _, target = dataset[0]
+    assert target["masks"].dtype == dtype
+    assert target["masks"].shape == shape
+
+    _, batch = collate_fn([dataset[0], dataset[0]])
+    expected = expected_masks(dataset, 0)
+    if target_format == "label_map":
+        # the larger class index wins where classes overlap
+        for channel in range(len(expected) - 1, 0, -1):
+            expected[:channel] &= ~expected[channel]
+    assert batch["masks"].dtype == torch.float32
+    for masks in batch["masks"]:
+        np.testing.assert_array_equal(masks.numpy(), expected)
+
+
+def test_target_format__invalid(image_dir):
+    with pytest.raises(ValueError):
+        FlexCocoDatasetBaseSS(image_dir, annotation_file, target_format="sparse")
+    with pytest.raises(ValueError):
+        FlexCocoDatasetBaseSS(
+            image_dir,
+            annotation_file,
+            target_format="packed",
+            label_transforms=lambda masks: masks,
+        )
+    with pytest.raises(ValueError):
+        FlexCocoDatasetBaseSS(
+            image_dir,
+            annotation_file,
+            target_format="rle",
+            label_transforms=lambda masks: masks,
+        )
+
+
+@pytest.mark.parametrize("target_format", ["packed", "rle"])
+def test_expand_masks(image_dir, target_format):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, target_format=target_format, target_size=(96, 100)
+    )
+    dense = FlexCocoDatasetBaseSS(image_dir, annotation_file, target_size=(96, 100))
+    loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=3,
+        num_workers=1,
+        collate_fn=dataset.get_collate_fn(dense=False),
+    )
+
+    img, target = next(iter(loader))
+    target = dataset.expand_masks(target, device="cpu")
+
+    expected_img, expected = dense.get_collate_fn()(dense.__getitems__([0, 1, 2]))
+    assert torch.equal(img, expected_img)
+    assert target["masks"].dtype == torch.float32
+    assert torch.equal(target["masks"], expected["masks"])
+
+
+def assert_samples_equal(samples, expected):
+    assert len(samples) == len(expected)
+    for (img, target), (expected_img, expected_target) in zip(samples, expected):
+        assert torch.equal(img, expected_img)
+        assert target.keys() == expected_target.keys()
+        assert torch.equal(target["masks"], expected_target["masks"])
+        for key in ("file_name", "origin_height", "origin_width"):
+            assert target[key] == expected_target[key]
+
+
+@pytest.mark.parametrize("num_decode_threads", [0, 2])
+@pytest.mark.parametrize("target_format", ["dense", "packed"])
+def test_getitems(image_dir, num_decode_threads, target_format):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir,
+        annotation_file,
+        target_format=target_format,
+        num_decode_threads=num_decode_threads,
+    )
+    indices = [2, 0, 1, 2]
+
+    samples = dataset.__getitems__(indices)
+
+    assert_samples_equal(samples, [dataset[index] for index in indices])
+
+
+def test_getitems__mask_cache(image_dir, tmp_path):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, mask_cache_dir=str(tmp_path / "masks")
+    )
+    dataset[1]
+
+    samples = dataset.__getitems__([0, 1, 2])
+
+    assert len(os.listdir(dataset.mask_cache.cache_dir)) == 3
+    assert_samples_equal(samples, [dataset[index] for index in range(3)])
+
+
+def test_getitems__data_loader(image_dir):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+    # the images have different sizes, so the samples are not stacked
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=2, num_workers=1, collate_fn=list
+    )
+
+    samples = [sample for batch in loader for sample in batch]
+
+    assert_samples_equal(samples, [dataset[index] for index in range(3)])
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_prefetch(image_dir, batch_size):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file, prefetch_depth=2)
+    expected = [dataset[index] for index in [2, 0, 1]]
+    order = [2, 0, 1]
+
+    dataset.set_prefetch_order(order, batch_size=batch_size)
+    loader = torch.utils.data.DataLoader(
+        dataset, sampler=order, batch_size=batch_size, collate_fn=list
+    )
+    samples = [sample for batch in loader for sample in batch]
+
+    assert_samples_equal(samples, expected)
+    stats = dataset.get_prefetcher().stats()
+    assert stats["misses"] == 0
+    assert stats["hits"] + stats["stalls"] == 3
+
+
+def test_prefetch__workers(image_dir):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file, prefetch_depth=2)
+    order = [1, 2, 0]
+    dataset.set_prefetch_order(order, batch_size=1)
+    loader = torch.utils.data.DataLoader(
+        dataset, sampler=order, batch_size=1, num_workers=2, collate_fn=list
+    )
+
+    samples = [sample for batch in loader for sample in batch]
+
+    assert_samples_equal(samples, [dataset[index] for index in order])
+
+
+def test_prefetch__disabled(image_dir):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+    assert dataset.get_prefetcher() is None
+    with pytest.raises(ValueError):
+        dataset.set_prefetch_order([0, 1, 2])
+
+
+@pytest.mark.parametrize("target_format", ["dense", "packed"])
+def test_target_size(image_dir, tmp_path, target_format):
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir,
+        annotation_file,
+        target_size=(96, 100),
+        target_format=target_format,
+        mask_cache_dir=str(tmp_path / "masks"),
+    )
+    full_size = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+    assert (
+        dataset.mask_cache.cache_dir
+        != SemanticMaskCache(str(tmp_path / "masks"), dataset.category_ids).cache_dir
+    )
+
+    samples = dataset.__getitems__([0, 1, 2])
+
+    img, batch = dataset.get_collate_fn()(samples)
+    assert img.shape == (3, 3, 96, 100)
+    assert batch["masks"].shape == (3, 4, 96, 100)
+    for index, (img, target) in enumerate(samples):
+        image = sample_coco["images"][index]
+        assert target["origin_height"] == image["height"]
+        assert target["origin_width"] == image["width"]
+        expected = rasterize_category_masks(
+            full_size.get_annotations(index),
+            image["height"],
+            image["width"],
+            dataset._cat_id2idx,
+            output_size=(96, 100),
+        )
+        np.testing.assert_array_equal(batch["masks"][index].numpy(), expected)
+        # the scaled masks cover the same regions as the full-size masks
+        full = expected_masks(full_size, index)
+        np.testing.assert_allclose(
+            expected.mean(axis=(1, 2)), full.mean(axis=(1, 2)), atol=0.02
+        )
+    # cached masks have the target size
+    _, target = dataset[0]
+    assert torch.equal(target["masks"], samples[0][1]["masks"])
+
+
+@pytest.mark.parametrize("crop_size", [(100, 200), (1000, 300)])
+def test_crop_size(image_dir, tmp_path, crop_size):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file, crop_size=crop_size)
+    full_size = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+
+    torch.manual_seed(0)
+    samples = [dataset[index] for index in range(3)]
+    torch.manual_seed(0)
+    batched = dataset.__getitems__([0, 1, 2])
+
+    assert_samples_equal(batched, samples)
+    for index, (img, target) in enumerate(samples):
+        top, left, height, width = target["crop"]
+        image = sample_coco["images"][index]
+        assert (height, width) == (
+            min(crop_size[0], image["height"]),
+            min(crop_size[1], image["width"]),
+        )
+        full_img, full_target = full_size[index]
+        window = (slice(top, top + height), slice(left, left + width))
+        assert torch.equal(img, full_img[:, window[0], window[1]])
+        assert torch.equal(
+            target["masks"], full_target["masks"][:, window[0], window[1]]
+        )
+
+    # cached full-size masks are cropped
+    cached = FlexCocoDatasetBaseSS(
+        image_dir,
+        annotation_file,
+        crop_size=crop_size,
+        mask_cache_dir=str(tmp_path / "masks"),
+    )
+    cached.build_mask_cache(num_workers=0)
+    torch.manual_seed(0)
+    assert_samples_equal([cached[index] for index in range(3)], samples)
+
+
+def test_crop_size__with_target_size(image_dir):
+    with pytest.raises(ValueError):
+        FlexCocoDatasetBaseSS(
+            image_dir, annotation_file, target_size=(10, 10), crop_size=(10, 10)
+        )
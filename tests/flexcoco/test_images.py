@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision.io import read_image
+from torchvision.transforms.functional import resize
+
+from flextd.flexcoco.images import read_image_resized
+
+
+def make_image(path, mode, size=(256, 384), image_format="JPEG"):
+    height, width = size
+    # smooth gradients keep the reduced-size decoding close to a full decode
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) % 256], axis=-1)
+    image = Image.fromarray(pixels.astype(np.uint8)).convert(mode)
+    image.save(path, format=image_format)
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "mode, image_format, channels",
+    [("RGB", "JPEG", 3), ("L", "JPEG", 1), ("RGBA", "PNG", 4), ("P", "PNG", 3)],
+)
+def test_read_image_resized(tmp_path, mode, image_format, channels):
+    path = make_image(tmp_path / "image", mode, image_format=image_format)
+
+    img = read_image_resized(path, (60, 90))
+
+    assert img.shape == (channels, 60, 90)
+    assert img.dtype == torch.uint8
+    if mode != "P":
+        expected = resize(read_image(path), [60, 90], antialias=True)
+        difference = (img.float() - expected.float()).abs().mean()
+        assert difference < 4
+
+
+def test_read_image_resized__original_size(tmp_path):
+    path = make_image(tmp_path / "image.png", "RGB", image_format="PNG")
+
+    assert torch.equal(read_image_resized(path, (256, 384)), read_image(path))
@@ -0,0 +1,85 @@
+"""
+Guard against import-time regressions of the annotation utilities.
+
+Each check runs in a fresh isolated interpreter (`python -I`: no PYTHONPATH, user site
+or modules imported by other tests), so a module that pulls in torch, torchvision or
+pycocotools cannot be hidden by an earlier import. The guard only checks which heavy
+modules are imported, not how long the imports take.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import flextd.flexcoco
+
+HEAVY_MODULES = ("torch", "torchvision", "pycocotools")
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+
+
+def imported_modules(code: str) -> list[str]:
+    """run code in a fresh isolated interpreter and get the heavy modules it imported."""
+    script = (
+        f"import json, sys\nsys.path.insert(0, {REPO_DIR!r})\n{code}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-I", "-c", script],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO_DIR,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_clean_interpreter():
+    assert imported_modules("pass") == []
+    assert imported_modules("import torch") == ["torch"]
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["utils", "stream", "statistics", "splits", "store", "cache", "jsonio", "tempdirs"],
+)
+def test_annotation_modules__without_heavy_imports(module):
+    assert imported_modules(f"import flextd.flexcoco.{module}") == []
+
+
+def test_annotation_apis__without_heavy_imports(tmp_path):
+    code = f"""
+from flextd.flexcoco import (
+    convert_to_annotation_store,
+    create_filtered_annotation_file,
+    get_annotation_file_statistics,
+)
+create_filtered_annotation_file(
+    {annotation_file!r}, {str(tmp_path / "filtered.json")!r}, exclude_files=["x.jpg"]
+)
+convert_to_annotation_store({annotation_file!r}, {str(tmp_path / "store")!r})
+get_annotation_file_statistics({str(tmp_path / "store")!r})
+get_annotation_file_statistics({annotation_file!r}, streaming=True)
+"""
+    assert imported_modules(code) == []
+
+
+def test_dataset__without_torchvision():
+    assert "torchvision" not in imported_modules(
+        "from flextd.flexcoco import FlexCocoDatasetBaseSS"
+    )
+
+
+def test_lazy_exports():
+    from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+
+    assert flextd.flexcoco.FlexCocoDatasetBaseSS is FlexCocoDatasetBaseSS
+    assert set(flextd.flexcoco.__all__) <= set(dir(flextd.flexcoco))
+    for name in flextd.flexcoco.__all__:
+        assert getattr(flextd.flexcoco, name) is not None
+    with pytest.raises(AttributeError):
+        flextd.flexcoco.does_not_exist
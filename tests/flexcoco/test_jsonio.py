@@ -0,0 +1,126 @@
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pytest
+
+from flextd.flexcoco import jsonio
+from flextd.flexcoco.jsonio import (
+    AnnotationEntry,
+    CategoryEntry,
+    ImageEntry,
+    dump_json,
+    load_annotation_index,
+    load_json,
+    set_json_backend,
+)
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+
+INSTALLED_BACKENDS = [
+    name
+    for name in jsonio.BACKEND_NAMES
+    if name == "json" or importlib.util.find_spec(name) is not None
+]
+
+
+@pytest.fixture
+def backend(request):
+    previous = jsonio.get_json_backend().name
+    yield set_json_backend(request.param)
+    set_json_backend(previous)
+
+
+@pytest.mark.parametrize("backend", INSTALLED_BACKENDS, indirect=True)
+def test_load_and_dump(backend, tmp_path):
+    with open(annotation_file) as f:
+        expected = json.load(f)
+
+    assert load_json(annotation_file) == expected
+    dump_json(expected, str(tmp_path / "out.json"))
+    with open(tmp_path / "out.json") as f:
+        assert json.load(f) == expected
+    assert json.loads(jsonio.dumps({"a": [1, 2.5, "é"]})) == {"a": [1, 2.5, "é"]}
+    assert jsonio.loads(b'{"a": null}') == {"a": None}
+
+
+@pytest.mark.parametrize(
+    "backend", [name for name in INSTALLED_BACKENDS if name == "orjson"], indirect=True
+)
+def test_dumps__like_stdlib(backend):
+    # integer keys and numpy values are serialized like json.dumps with default=int
+    assert json.loads(jsonio.dumps({1: np.int64(2)})) == {"1": 2}
+
+
+def test_set_json_backend__unknown():
+    with pytest.raises(ValueError):
+        set_json_backend("yaml")
+
+
+def expected_index() -> jsonio.AnnotationIndex:
+    with open(annotation_file) as f:
+        annotation_dict = json.load(f)
+    return jsonio.AnnotationIndex(
+        [
+            ImageEntry(image["id"], image["file_name"], image["height"], image["width"])
+            for image in annotation_dict["images"]
+        ],
+        [
+            AnnotationEntry(
+                ann["id"],
+                ann["image_id"],
+                ann["category_id"],
+                ann["area"],
+                ann["iscrowd"],
+                ann["bbox"],
+            )
+            for ann in annotation_dict["annotations"]
+        ],
+        [
+            CategoryEntry(category["id"], category["name"], category["supercategory"])
+            for category in annotation_dict["categories"]
+        ],
+    )
+
+
+def test_load_annotation_index():
+    pytest.importorskip("msgspec")
+
+    assert load_annotation_index(annotation_file) == expected_index()
+
+
+def no_msgspec():
+    raise ImportError("msgspec is not installed")
+
+
+def test_load_annotation_index__without_msgspec(monkeypatch):
+    monkeypatch.setattr(jsonio, "_get_index_decoder", no_msgspec)
+
+    assert load_annotation_index(annotation_file) == expected_index()
+
+
+@pytest.mark.parametrize("use_msgspec", [True, False])
+def test_load_annotation_index__missing_fields(tmp_path, monkeypatch, use_msgspec):
+    if use_msgspec:
+        pytest.importorskip("msgspec")
+    else:
+        monkeypatch.setattr(jsonio, "_get_index_decoder", no_msgspec)
+    path = tmp_path / "annotations.json"
+    path.write_text(
+        json.dumps(
+            {
+                "images": [{"id": 1, "file_name": "a.jpg", "height": 2, "width": 3}],
+                "annotations": [
+                    {"id": 5, "image_id": 1, "category_id": 7, "segmentation": [[0]]}
+                ],
+                "categories": [{"id": 7, "name": "cat"}],
+            }
+        )
+    )
+
+    index = load_annotation_index(str(path))
+
+    assert index.annotations == [AnnotationEntry(5, 1, 7)]
+    assert index.categories == [CategoryEntry(7, "cat")]
@@ -0,0 +1,280 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+import torch
+from pycocotools import mask as mask_utils
+
+from flextd.flexcoco import masks as masks_module
+from flextd.flexcoco.masks import (
+    TARGET_FORMATS,
+    ann_to_rle,
+    collate_semantic_segmentation,
+    decode_rle_masks,
+    expand_batch_masks,
+    format_masks,
+    masks_to_dense,
+    rasterize_category_masks,
+    rasterize_category_masks_batch,
+    rasterize_window,
+    resize_rle,
+    scale_polygon,
+)
+
+
+@pytest.fixture
+def masks():
+    rng = np.random.default_rng(0)
+    masks = rng.random((3, 5, 13)) > 0.5
+    # label maps cannot represent overlapping categories
+    masks[0] &= ~(masks[1] | masks[2])
+    masks[1] &= ~masks[2]
+    return masks
+
+
+@pytest.mark.parametrize("target_format", TARGET_FORMATS)
+def test_format_masks__round_trip(masks, target_format):
+    formatted = format_masks(masks, target_format)
+    # rle masks are batched as a list
+    batched = [formatted] if target_format == "rle" else formatted[None]
+    dense = masks_to_dense(batched, target_format, num_categories=3, width=13)
+    assert dense.shape == (1, 3, 5, 13)
+    np.testing.assert_array_equal(dense[0].numpy(), masks)
+
+
+def test_format_masks__unknown_format(masks):
+    with pytest.raises(ValueError):
+        format_masks(masks, "sparse")
+    with pytest.raises(ValueError):
+        masks_to_dense(format_masks(masks, "packed"), "packed", num_categories=3)
+
+
+def test_format_masks__rle(masks):
+    formatted = format_masks(masks, "rle")
+    assert formatted["size"] == [5, 13]
+    assert len(formatted["counts"]) == 3
+    assert all(isinstance(counts, bytes) for counts in formatted["counts"])
+
+    other = np.zeros_like(masks)
+    other[1, 2:4, 3:9] = True
+    batch = [formatted, format_masks(other, "rle"), format_masks(masks, "rle")]
+    decoded = decode_rle_masks(batch)
+    assert decoded.dtype == torch.uint8
+    np.testing.assert_array_equal(decoded.numpy(), np.stack([masks, other, masks]))
+
+    with pytest.raises(ValueError):
+        decode_rle_masks([formatted, format_masks(masks[:, :4], "rle")])
+
+
+@pytest.mark.parametrize("target_format", ["packed", "rle", "label_map"])
+def test_collate_semantic_segmentation(masks, target_format):
+    batch = [
+        (torch.zeros(3, 5, 13), {"masks": format_masks(masks, target_format)}),
+        (torch.ones(3, 5, 13), {"masks": format_masks(masks, target_format)}),
+    ]
+    for target in (batch[0][1], batch[1][1]):
+        target["origin_width"] = 13
+
+    img, target = collate_semantic_segmentation(
+        batch, target_format, num_categories=3, dense=False
+    )
+    assert img.shape == (2, 3, 5, 13)
+    if target_format == "rle":
+        assert isinstance(target["masks"], list)
+    dense = expand_batch_masks(target, target_format, num_categories=3, device="cpu")
+    assert dense["masks"].device.type == "cpu"
+    if target_format != "label_map":
+        np.testing.assert_array_equal(dense["masks"].numpy(), np.stack([masks, masks]))
+    _, expanded = collate_semantic_segmentation(batch, target_format, num_categories=3)
+    assert torch.equal(expanded["masks"], dense["masks"])
+
+
+def make_anns(rng, height, width, num_anns, num_categories):
+    anns = []
+    for ann_id in range(num_anns):
+        category_id = int(rng.integers(1, num_categories + 1))
+        if ann_id % 5 == 4:
+            # crowd annotation with an uncompressed or compressed RLE
+            mask = np.asfortranarray(rng.random((height, width)) > 0.7, np.uint8)
+            rle = mask_utils.encode(mask)
+            if ann_id % 2:
+                rle = {"size": [height, width], "counts": rle["counts"].decode()}
+            else:
+                flat = mask.flatten(order="F")
+                changes = np.flatnonzero(np.diff(flat)) + 1
+                runs = np.diff(np.concatenate([[0], changes, [flat.size]]))
+                counts = runs.tolist() if flat[0] == 0 else [0] + runs.tolist()
+                rle = {"size": [height, width], "counts": counts}
+            segmentation = rle
+        else:
+            segmentation = [
+                (rng.random((int(rng.integers(3, 8)), 2)) * [width, height] * 1.2)
+                .round(2)
+                .ravel()
+                .tolist()
+                for _ in range(int(rng.integers(1, 3)))
+            ]
+        anns.append(
+            {"id": ann_id, "category_id": category_id, "segmentation": segmentation}
+        )
+    return anns
+
+
+def test_rasterize_category_masks():
+    rng = np.random.default_rng(0)
+    height, width, num_categories = 37, 53, 4
+    anns = make_anns(rng, height, width, 30, num_categories)
+    cat_id2idx = {category_id: category_id - 1 for category_id in range(1, 6)}
+
+    masks = rasterize_category_masks(anns, height, width, cat_id2idx)
+
+    expected = np.zeros((5, height, width), dtype=bool)
+    for ann in anns:
+        rle = ann_to_rle(ann, height, width)
+        expected[cat_id2idx[ann["category_id"]]] |= mask_utils.decode(rle).astype(bool)
+    assert expected.any(axis=(1, 2))[:num_categories].all()
+    np.testing.assert_array_equal(masks, expected)
+
+
+def test_rasterize_category_masks_batch():
+    rng = np.random.default_rng(1)
+    sizes = [(37, 53), (20, 20), (37, 53)]
+    anns_list = [make_anns(rng, height, width, 8, 3) for height, width in sizes]
+    anns_list.append([])
+    sizes.append((5, 7))
+    cat_id2idx = {1: 0, 2: 1, 3: 2}
+
+    masks_list = rasterize_category_masks_batch(
+        anns_list, [h for h, _ in sizes], [w for _, w in sizes], cat_id2idx
+    )
+
+    assert len(masks_list) == 4
+    for masks, anns, (height, width) in zip(masks_list, anns_list, sizes):
+        expected = rasterize_category_masks(anns, height, width, cat_id2idx)
+        assert masks.shape == (3, height, width)
+        np.testing.assert_array_equal(masks, expected)
+
+
+def test_rasterize_category_masks__output_size():
+    rng = np.random.default_rng(2)
+    height, width = 40, 60
+    anns = make_anns(rng, height, width, 10, 3)
+    cat_id2idx = {1: 0, 2: 1, 3: 2}
+
+    masks = rasterize_category_masks(
+        anns, height, width, cat_id2idx, output_size=(20, 15)
+    )
+
+    expected = np.zeros((3, 20, 15), dtype=bool)
+    for ann in anns:
+        if isinstance(ann["segmentation"], list):
+            polygons = [
+                scale_polygon(polygon, 15 / width, 20 / height).tolist()
+                for polygon in ann["segmentation"]
+            ]
+            rle = ann_to_rle({"segmentation": polygons}, 20, 15)
+        else:
+            full = mask_utils.decode(ann_to_rle(ann, height, width))
+            full = torch.from_numpy(full)[None, None].float()
+            resized = torch.nn.functional.interpolate(full, size=(20, 15))
+            rle = mask_utils.encode(np.asfortranarray(resized[0, 0].numpy(), np.uint8))
+        expected[cat_id2idx[ann["category_id"]]] |= mask_utils.decode(rle).astype(bool)
+    np.testing.assert_array_equal(masks, expected)
+
+    same_size = rasterize_category_masks(
+        anns, height, width, cat_id2idx, output_size=(height, width)
+    )
+    np.testing.assert_array_equal(
+        same_size, rasterize_category_masks(anns, height, width, cat_id2idx)
+    )
+
+
+def test_resize_rle():
+    mask = np.zeros((4, 6), dtype=np.uint8)
+    mask[1:3, 2:6] = 1
+    rle = mask_utils.encode(np.asfortranarray(mask))
+
+    resized = mask_utils.decode(resize_rle(rle, 2, 3))
+
+    np.testing.assert_array_equal(resized, [[0, 0, 0], [0, 1, 1]])
+    assert resize_rle(rle, 4, 6) is rle
+
+
+def test_rasterize_window():
+    rng = np.random.default_rng(3)
+    height, width = 61, 83
+    cat_id2idx = {1: 0, 2: 1, 3: 2}
+    for _ in range(50):
+        anns = make_anns(rng, height, width, 6, 3)
+        # polygons partly outside of the image
+        anns.append(
+            {
+                "id": 100,
+                "category_id": 1,
+                "segmentation": [
+                    (rng.random(12) * 160 - 40).round(int(rng.integers(4))).tolist()
+                ],
+            }
+        )
+        top, left = int(rng.integers(height)), int(rng.integers(width))
+        window = (
+            top,
+            left,
+            int(rng.integers(1, height - top + 1)),
+            int(rng.integers(1, width - left + 1)),
+        )
+
+        masks = rasterize_window(anns, height, width, cat_id2idx, window)
+
+        full = rasterize_category_masks(anns, height, width, cat_id2idx)
+        expected = full[:, top : top + window[2], left : left + window[3]]
+        np.testing.assert_array_equal(masks, expected)
+
+
+def test_rasterize_window__skip_by_bbox():
+    ann = {
+        "id": 1,
+        "category_id": 1,
+        "segmentation": [[2, 2, 8, 2, 8, 8, 2, 8]],
+        "bbox": [2, 2, 6, 6],
+    }
+    outside = dict(ann, segmentation=[[30, 30, 38, 30, 38, 38]], bbox=[30, 30, 8, 8])
+
+    with mock.patch(
+        "flextd.flexcoco.masks._window_polygon", wraps=masks_module._window_polygon
+    ) as window_polygon:
+        masks = rasterize_window([ann, outside], 40, 40, {1: 0}, (0, 0, 10, 10))
+
+    assert window_polygon.call_count == 1
+    assert masks[0, 2:8, 2:8].all()
+    assert masks.sum() == 36
+
+
+def test_rasterize_category_masks_batch__windows():
+    rng = np.random.default_rng(4)
+    anns_list = [make_anns(rng, 30, 40, 5, 3), make_anns(rng, 20, 20, 5, 3)]
+    cat_id2idx = {1: 0, 2: 1, 3: 2}
+    windows = [(5, 10, 20, 25), (0, 0, 20, 20)]
+
+    masks_list = rasterize_category_masks_batch(
+        anns_list, [30, 20], [40, 20], cat_id2idx, windows=windows
+    )
+
+    for masks, anns, (height, width), window in zip(
+        masks_list, anns_list, [(30, 40), (20, 20)], windows
+    ):
+        top, left, window_height, window_width = window
+        full = rasterize_category_masks(anns, height, width, cat_id2idx)
+        np.testing.assert_array_equal(
+            masks,
+            full[:, top : top + window_height, left : left + window_width],
+        )
+    with pytest.raises(ValueError):
+        rasterize_category_masks_batch(
+            anns_list,
+            [30, 20],
+            [40, 20],
+            cat_id2idx,
+            output_sizes=[(10, 10)] * 2,
+            windows=windows,
+        )
@@ -0,0 +1,152 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from flextd.flexcoco.partition import (
+    PartitionSampler,
+    partition_annotation_dict,
+    partition_indices,
+)
+from flextd.flexcoco.store import convert_to_annotation_store
+from flextd.flexcoco.utils import filter_annotation_dict
+from tests.flexcoco.helpers import SampleDataset
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+
+@pytest.mark.parametrize("num_images, world_size", [(10, 3), (2, 4), (7, 1)])
+def test_partition_indices(num_images, world_size):
+    partitions = [
+        partition_indices(num_images, rank, world_size, seed=5)
+        for rank in range(world_size)
+    ]
+
+    merged = np.concatenate(partitions)
+    assert sorted(merged.tolist()) == list(range(num_images))
+    assert max(map(len, partitions)) - min(map(len, partitions)) <= 1
+    for partition in partitions:
+        assert (np.diff(partition) > 0).all()
+    np.testing.assert_array_equal(
+        partitions[0], partition_indices(num_images, 0, world_size, seed=5)
+    )
+    with pytest.raises(ValueError):
+        partition_indices(num_images, world_size, world_size)
+
+
+def test_partition_annotation_dict():
+    partition = partition_annotation_dict(sample_coco, rank=1, world_size=2)
+
+    image_ids = {image["id"] for image in partition["images"]}
+    assert len(image_ids) == 1
+    assert partition["annotations"] == [
+        ann for ann in sample_coco["annotations"] if ann["image_id"] in image_ids
+    ]
+    assert partition["categories"] == sample_coco["categories"]
+    assert len(sample_coco["images"]) == 3
+
+
+@pytest.fixture(params=["json", "store"])
+def source(request, tmp_path):
+    if request.param == "json":
+        return annotation_file
+    return convert_to_annotation_store(annotation_file, str(tmp_path / "store"))
+
+
+@pytest.mark.parametrize("shared_index", [False, True])
+def test_dataset_partition(source, shared_index):
+    full = SampleDataset(image_dir="", annotation_file=source, exclude_files=["x.jpg"])
+
+    datasets = [
+        SampleDataset(
+            image_dir="",
+            annotation_file=source,
+            exclude_files=["x.jpg"],
+            rank=rank,
+            world_size=2,
+            shared_index=shared_index,
+        )
+        for rank in range(2)
+    ]
+
+    assert sorted(datasets[0].ids + datasets[1].ids) == sorted(full.ids)
+    assert [dataset.partition_size for dataset in datasets] == [2, 2]
+    for dataset in datasets:
+        assert dataset.category_ids == full.category_ids
+        for index, img_id in enumerate(dataset.ids):
+            full_index = full.ids.index(img_id)
+            assert dataset.get_image_record(index)[:3] == (
+                full.get_image_record(full_index)[:3]
+            )
+            assert dataset.get_annotations(index) == full.get_annotations(full_index)
+
+
+def test_dataset_partition__filtered():
+    datasets = [
+        SampleDataset(
+            image_dir="",
+            annotation_file=annotation_file,
+            include_categories=["label2"],
+            rank=rank,
+            world_size=2,
+        )
+        for rank in range(2)
+    ]
+
+    full = SampleDataset(
+        image_dir="", annotation_file=annotation_file, include_categories=["label2"]
+    )
+    assert sorted(datasets[0].ids + datasets[1].ids) == sorted(full.ids)
+    with pytest.raises(ValueError):
+        SampleDataset(image_dir="", annotation_file=annotation_file, world_size=2)
+
+
+def test_dataset_partition__new_annotation_file(source, tmp_path):
+    filters = dict(exclude_categories=["label2"])
+    outputs = [str(tmp_path / f"filtered_{rank}") for rank in range(2)]
+    for rank in range(2):
+        SampleDataset(
+            image_dir="",
+            annotation_file=source,
+            new_annotation_file=outputs[rank],
+            rank=rank,
+            world_size=2,
+            **filters,
+        )
+
+    assert not os.path.exists(outputs[1])
+    saved = SampleDataset(image_dir="", annotation_file=outputs[0])
+    full = SampleDataset(image_dir="", annotation_file=annotation_file, **filters)
+    assert saved.ids == full.ids
+    for index in range(len(full)):
+        assert saved.get_annotations(index) == full.get_annotations(index)
+    if source == annotation_file:
+        with open(outputs[0]) as f:
+            assert json.load(f) == filter_annotation_dict(sample_coco, **filters)
+
+
+def test_partition_sampler():
+    dataset = SampleDataset(
+        image_dir="", annotation_file=annotation_file, rank=1, world_size=2
+    )
+    assert len(dataset) == 1
+    sampler = PartitionSampler(dataset, seed=3)
+
+    assert len(sampler) == 2
+    assert list(sampler) == [0, 0]
+
+    dataset = SampleDataset(image_dir="", annotation_file=annotation_file)
+    sampler = PartitionSampler(dataset, seed=3)
+    orders = []
+    for epoch in range(5):
+        sampler.set_epoch(epoch)
+        orders.append(list(sampler))
+    assert all(sorted(order) == [0, 1, 2] for order in orders)
+    assert len(set(map(tuple, orders))) > 1
+    sampler.set_epoch(2)
+    assert list(sampler) == orders[2]
+    assert list(PartitionSampler(dataset, shuffle=False)) == [0, 1, 2]
@@ -0,0 +1,92 @@
+import threading
+from unittest import mock
+
+import pytest
+import torch
+
+from flextd.flexcoco.prefetch import ImagePrefetcher, worker_order
+
+
+class SlowLoader:
+    """load function that records the keys and blocks until released."""
+
+    def __init__(self, nbytes=100):
+        self.nbytes = nbytes
+        self.keys = []
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def __call__(self, key):
+        with self.lock:
+            self.keys.append(key)
+        self.release.wait(timeout=10)
+        return torch.full((self.nbytes,), key, dtype=torch.uint8)
+
+
+def test_fetch__hits_and_misses():
+    load = SlowLoader()
+    load.release.set()
+    prefetcher = ImagePrefetcher(load, depth=2, num_threads=2)
+    prefetcher.set_order([0, 1, 2, 3])
+
+    for key in [0, 1, 2, 3, 7]:
+        # let the read ahead finish
+        for futures in list(prefetcher._pending.values()):
+            futures[0].result()
+        assert prefetcher.get(key)[0] == key
+
+    assert prefetcher.stats() == {"hits": 4, "stalls": 0, "misses": 1, "pending": 0}
+    assert sorted(load.keys) == [0, 1, 2, 3, 7]
+    prefetcher.close()
+
+
+def test_fetch__stall():
+    load = SlowLoader()
+    prefetcher = ImagePrefetcher(load, depth=1, num_threads=1)
+    prefetcher.set_order([5, 6])
+
+    future = prefetcher.fetch(5)
+    assert prefetcher.stalls == 1
+    load.release.set()
+    assert future.result()[0] == 5
+    assert prefetcher.get(6)[0] == 6
+    prefetcher.close()
+
+
+def test_depth_and_memory_cap():
+    load = SlowLoader(nbytes=100)
+    load.release.set()
+    prefetcher = ImagePrefetcher(load, depth=4, max_bytes=250, num_threads=1)
+    # the first image is read before its size is known
+    prefetcher.get(0)
+    prefetcher.set_order(range(1, 10))
+
+    # 2 images of 100 bytes fit in 250 bytes
+    assert prefetcher.stats()["pending"] == 2
+    prefetcher.close()
+
+    unlimited = ImagePrefetcher(load, depth=4, num_threads=1)
+    unlimited.set_order(range(10))
+    assert unlimited.stats()["pending"] == 4
+    unlimited.close()
+
+    with pytest.raises(ValueError):
+        ImagePrefetcher(load, depth=0)
+
+
+@pytest.mark.parametrize(
+    "worker_id, num_workers, expected",
+    [
+        (None, None, list(range(10))),
+        (0, 2, [0, 1, 2, 6, 7, 8]),
+        (1, 2, [3, 4, 5, 9]),
+    ],
+)
+def test_worker_order(worker_id, num_workers, expected):
+    worker_info = None
+    if worker_id is not None:
+        worker_info = mock.Mock(id=worker_id, num_workers=num_workers)
+    with mock.patch(
+        "flextd.flexcoco.prefetch.get_worker_info", return_value=worker_info
+    ):
+        assert worker_order(range(10), batch_size=3) == expected
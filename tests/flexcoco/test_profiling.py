@@ -0,0 +1,135 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+from flextd.flexcoco.profiling import (
+    ProfileSnapshot,
+    StageProfiler,
+    merge_snapshots,
+    nbytes_of,
+)
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+
+def calls_of(snapshot: ProfileSnapshot) -> dict:
+    return dict(zip(snapshot.stages, snapshot.calls.tolist()))
+
+
+def test_nbytes_of():
+    assert nbytes_of(torch.zeros((2, 3), dtype=torch.float32)) == 24
+    assert nbytes_of(np.zeros((2, 3), dtype=bool)) == 6
+    assert nbytes_of({"size": [4, 4], "counts": [b"abc", b"de"]}) == 5
+    assert nbytes_of("not a mask") == 0
+
+
+def test_record_and_snapshot():
+    profiler = StageProfiler(stages=("samples", "read"))
+    profiler.record("read", 0.5, nbytes=100)
+    profiler.record("read", 0.25, nbytes=50)
+    with profiler.stage("samples") as stage:
+        stage.nbytes = 7
+
+    snapshot = profiler.snapshot()
+    assert calls_of(snapshot) == {"samples": 1, "read": 2}
+    assert snapshot.seconds[1] == pytest.approx(0.75)
+    assert snapshot.nbytes.tolist() == [7, 150]
+    assert snapshot.to_dict()["read"]["mean_ms"] == pytest.approx(375.0)
+    assert "read" in profiler.summary()
+
+    profiler.reset()
+    assert profiler.snapshot().calls.sum() == 0
+
+
+def test_merge_snapshots():
+    first = ProfileSnapshot(("a", "b"), np.array([1, 2]), np.ones(2), np.array([3, 4]))
+    second = ProfileSnapshot(("a", "b"), np.array([5, 0]), np.ones(2), np.array([0, 1]))
+
+    merged = merge_snapshots([first, second])
+
+    assert merged.calls.tolist() == [6, 2]
+    assert merged.seconds.tolist() == [2.0, 2.0]
+    assert merged.nbytes.tolist() == [3, 5]
+    with pytest.raises(ValueError):
+        first.merge(ProfileSnapshot(("a",), np.ones(1), np.ones(1), np.ones(1)))
+
+
+def test_callback():
+    reports = []
+    profiler = StageProfiler(
+        callback=lambda worker_id, snapshot: reports.append((worker_id, snapshot)),
+        callback_interval=2,
+    )
+    for _ in range(3):
+        profiler.record("samples", 0.1)
+    profiler.record("samples", 0.1, calls=4)
+
+    assert [calls_of(snapshot)["samples"] for _, snapshot in reports] == [2, 7]
+    assert all(worker_id is None for worker_id, _ in reports)
+
+
+def test_pickle__shares_counters():
+    profiler = StageProfiler()
+    copy = pickle.loads(pickle.dumps(profiler))
+    copy.record("read_image", 0.1, nbytes=10)
+
+    assert calls_of(profiler.snapshot())["read_image"] == 1
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_dataset(image_dir, batch_size):
+    profiler = StageProfiler()
+    dataset = FlexCocoDatasetBaseSS(
+        image_dir,
+        annotation_file,
+        profiler=profiler,
+        data_transforms=lambda img: img,
+    )
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, collate_fn=list
+    )
+
+    samples = [sample for batch in loader for sample in batch]
+
+    calls = calls_of(profiler.snapshot())
+    assert calls["samples"] == 3
+    assert calls["read_image"] == 3
+    assert calls["format"] == 3
+    assert calls["data_transforms"] == 3
+    assert calls["label_transforms"] == 0
+    assert calls["rasterize"] > 0
+    format_bytes = profiler.snapshot().to_dict()["format"]["bytes"]
+    assert format_bytes == sum(nbytes_of(target["masks"]) for _, target in samples)
+
+
+def test_dataset__workers(image_dir):
+    profiler = StageProfiler()
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file, profiler=profiler)
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=1, num_workers=2, collate_fn=list
+    )
+
+    list(loader)
+
+    snapshots = profiler.snapshots()
+    # nothing is fetched in the main process
+    assert calls_of(snapshots[0])["samples"] == 0
+    assert [calls_of(snapshot)["samples"] for snapshot in snapshots[1:3]] == [2, 1]
+    assert calls_of(profiler.snapshot())["samples"] == 3
+
+
+def test_dataset__disabled(image_dir):
+    dataset = FlexCocoDatasetBaseSS(image_dir, annotation_file)
+
+    dataset[0]
+    dataset.__getitems__([0, 1])
+
+    assert dataset.profiler is None
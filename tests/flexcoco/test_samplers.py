@@ -0,0 +1,108 @@
+import json
+
+import numpy as np
+import pytest
+from torch.utils.data import DataLoader
+
+from flextd.flexcoco.samplers import AspectRatioBatchSampler, padding_overhead
+from tests.flexcoco.helpers import SampleDataset
+
+
+class IndexDataset(SampleDataset):
+    def __getitem__(self, index):
+        return index
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    sizes = [(240, 320), (480, 640), (3000, 4000), (640, 480), (1024, 1024)]
+    images = []
+    for i in range(103):
+        height, width = sizes[int(rng.integers(len(sizes)))]
+        scale = rng.uniform(0.9, 1.1)
+        images.append(
+            {
+                "id": i + 1,
+                "file_name": f"{i + 1:012d}.jpg",
+                "height": int(height * scale),
+                "width": int(width * scale),
+            }
+        )
+    annotation_file = tmp_path / "annotations.json"
+    annotation_file.write_text(
+        json.dumps({"images": images, "annotations": [], "categories": []})
+    )
+    return IndexDataset(image_dir="", annotation_file=str(annotation_file))
+
+
+def test_padding_overhead():
+    heights = np.array([10, 20, 10])
+    widths = np.array([10, 10, 30])
+
+    assert padding_overhead(heights, widths, [[0], [1], [2]]) == 0
+    # (20 * 10 * 2) / (100 + 200) - 1
+    assert padding_overhead(heights, widths, [[0, 1], [2]]) == pytest.approx(
+        (400 + 300) / 600 - 1
+    )
+    assert padding_overhead(heights, widths, []) == 0
+
+
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_batches(dataset, drop_last):
+    sampler = AspectRatioBatchSampler(dataset, batch_size=8, drop_last=drop_last)
+
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler)
+    indices = [index for batch in batches for index in batch]
+    assert len(indices) == len(set(indices))
+    if drop_last:
+        assert all(len(batch) == 8 for batch in batches)
+    else:
+        assert sorted(indices) == list(range(len(dataset)))
+    if drop_last:
+        assert all(len(set(sampler.bucket_ids[batch])) == 1 for batch in batches)
+    report = sampler.padding_report()
+    assert report["bucketed"] < report["random"] / 2
+
+
+def test_epochs(dataset):
+    sampler = AspectRatioBatchSampler(dataset, batch_size=8, seed=1)
+
+    orders = []
+    for epoch in range(3):
+        sampler.set_epoch(epoch)
+        orders.append(list(sampler))
+
+    assert orders[0] != orders[1]
+    sampler.set_epoch(0)
+    assert list(sampler) == orders[0]
+    unshuffled = AspectRatioBatchSampler(dataset, batch_size=8, shuffle=False)
+    assert list(unshuffled) == list(unshuffled)
+
+
+def test_distributed(dataset):
+    samplers = [
+        AspectRatioBatchSampler(dataset, batch_size=8, rank=rank, world_size=3)
+        for rank in range(3)
+    ]
+
+    batches = [list(sampler) for sampler in samplers]
+
+    assert len({len(rank_batches) for rank_batches in batches}) == 1
+    assert len(batches[0]) == len(samplers[0])
+    indices = {index for rank_batches in batches for b in rank_batches for index in b}
+    assert indices == set(range(len(dataset)))
+    with pytest.raises(ValueError):
+        AspectRatioBatchSampler(dataset, batch_size=8, rank=3, world_size=3)
+    with pytest.raises(ValueError):
+        AspectRatioBatchSampler(dataset, batch_size=8, rank=0)
+
+
+def test_data_loader(dataset):
+    sampler = AspectRatioBatchSampler(dataset, batch_size=8)
+
+    loaded = [batch.tolist() for batch in DataLoader(dataset, batch_sampler=sampler)]
+
+    assert loaded == list(sampler)
@@ -0,0 +1,135 @@
+import json
+import os
+import warnings
+
+import pytest
+import torch
+
+from flextd.flexcoco.coco_semantic_segmentation import FlexCocoDatasetBaseSS
+from flextd.flexcoco.shards import ShardedCocoDataset, write_shards
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+
+@pytest.fixture
+def dataset(image_dir):
+    return FlexCocoDatasetBaseSS(
+        image_dir, annotation_file, exclude_categories=["label3"]
+    )
+
+
+def test_write_shards(dataset, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+
+    shards = write_shards(dataset, shard_dir, max_shard_samples=2, masks=True)
+
+    assert [os.path.basename(shard) for shard in shards] == [
+        "shard-000000.tar",
+        "shard-000001.tar",
+    ]
+    assert sorted(os.listdir(shard_dir)) == [
+        "index.json",
+        "shard-000000.tar",
+        "shard-000001.tar",
+    ]
+    sharded = ShardedCocoDataset(shard_dir, return_annotations=True)
+    assert sharded.num_samples == 3
+    assert sharded.categories == ["label1", "label2", "label4"]
+
+    samples = list(sharded)
+
+    assert len(samples) == 3
+    for index, (img, target) in enumerate(samples):
+        expected_img, expected_target = dataset[index]
+        assert torch.equal(img, expected_img)
+        assert torch.equal(target["masks"], expected_target["masks"])
+        for key in ("file_name", "origin_height", "origin_width"):
+            assert target[key] == expected_target[key]
+        assert target["annotations"] == dataset.get_annotations(index)
+
+
+def test_write_shards__max_bytes(dataset, tmp_path):
+    shards = write_shards(dataset, str(tmp_path / "shards"), max_shard_bytes=1)
+
+    assert len(shards) == 3
+    _, target = next(iter(ShardedCocoDataset(str(tmp_path / "shards"))))
+    assert "masks" not in target
+    assert "annotations" not in target
+
+
+@pytest.fixture
+def shard_dir(dataset, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    write_shards(dataset, shard_dir, max_shard_samples=1)
+    return shard_dir
+
+
+def file_names(samples):
+    return [target["file_name"] for _, target in samples]
+
+
+@pytest.mark.filterwarnings("ignore:the ranks read different numbers of samples")
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_split_across_ranks_and_workers(shard_dir, num_workers):
+    names = []
+    for rank in range(2):
+        sharded = ShardedCocoDataset(shard_dir, rank=rank, world_size=2)
+        loader = torch.utils.data.DataLoader(
+            sharded, batch_size=None, num_workers=num_workers
+        )
+        names += file_names(loader)
+
+    assert sorted(names) == sorted(
+        image["file_name"] for image in sample_coco["images"]
+    )
+
+
+def test_shuffle(shard_dir):
+    sharded = ShardedCocoDataset(shard_dir, shuffle_buffer=2, seed=1)
+
+    orders = []
+    for epoch in range(6):
+        sharded.set_epoch(epoch)
+        orders.append(file_names(sharded))
+
+    expected = sorted(image["file_name"] for image in sample_coco["images"])
+    assert all(sorted(order) == expected for order in orders)
+    assert len(set(map(tuple, orders))) > 1
+    sharded.set_epoch(3)
+    assert file_names(sharded) == orders[3]
+    assert file_names(ShardedCocoDataset(shard_dir)) == expected
+
+
+def test_data_loader__batches(dataset, tmp_path):
+    shard_dir = str(tmp_path / "shards")
+    write_shards(dataset, shard_dir, masks=True)
+
+    def crop(x):
+        return x[:, :400, :600]
+
+    sharded = ShardedCocoDataset(shard_dir, data_transforms=crop, label_transforms=crop)
+    batches = list(torch.utils.data.DataLoader(sharded, batch_size=2))
+
+    assert [img.shape for img, _ in batches] == [(2, 3, 400, 600), (1, 3, 400, 600)]
+    _, target = batches[0]
+    assert target["masks"].shape == (2, 3, 400, 600)
+    assert target["file_name"] == [
+        image["file_name"] for image in sample_coco["images"][:2]
+    ]
+
+
+def test_worker_shards__uneven_split(shard_dir):
+    with pytest.warns(UserWarning, match="different numbers of samples"):
+        ShardedCocoDataset(shard_dir, rank=0, world_size=2).worker_shards()
+    with pytest.warns(UserWarning, match="some workers read no samples"):
+        shards = ShardedCocoDataset(shard_dir, rank=3, world_size=4).worker_shards()
+    assert shards == []
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert (
+            len(ShardedCocoDataset(shard_dir, rank=2, world_size=3).worker_shards())
+            == 1
+        )
@@ -0,0 +1,195 @@
+import json
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from flextd.flexcoco import splits
+from flextd.flexcoco.jsonio import load_json
+from flextd.flexcoco.splits import (
+    SplitSpec,
+    SubsetSpec,
+    assign_parts,
+    create_subset_annotation_files,
+    k_fold_specs,
+    random_split_specs,
+)
+from flextd.flexcoco.utils import filter_annotation_dict
+
+
+def make_annotation_dict(num_images: int = 200, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    images = [
+        {"id": i + 10, "file_name": f"{i}.jpg", "height": 10, "width": 10}
+        for i in range(num_images)
+    ]
+    categories = [{"id": i + 1, "name": f"label{i}"} for i in range(5)]
+    annotations = []
+    for image in images:
+        # label4 is rare
+        probabilities = [0.3, 0.3, 0.2, 0.15, 0.05]
+        for _ in range(int(rng.integers(0, 4))):
+            category = int(rng.choice(5, p=probabilities))
+            annotations.append(
+                {
+                    "id": len(annotations),
+                    "image_id": image["id"],
+                    "category_id": category + 1,
+                    "bbox": [0, 0, 1, 1],
+                    "area": 1.0,
+                    "iscrowd": 0,
+                }
+            )
+    return {
+        "info": {"description": "test"},
+        "images": images,
+        "annotations": annotations,
+        "categories": categories,
+    }
+
+
+@pytest.fixture
+def annotation_file(tmp_path):
+    path = tmp_path / "annotations.json"
+    path.write_text(json.dumps(make_annotation_dict()))
+    return str(path)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def assert_consistent(subset: dict, source: dict):
+    """the subset has all annotations of its images and nothing else."""
+    image_ids = {image["id"] for image in subset["images"]}
+    expected = [ann for ann in source["annotations"] if ann["image_id"] in image_ids]
+    assert subset["annotations"] == expected
+    assert subset["categories"] == source["categories"]
+    assert subset["info"] == source["info"]
+
+
+@pytest.mark.parametrize("stratify", [False, True])
+def test_random_split(tmp_path, annotation_file, stratify):
+    subsets = random_split_specs(
+        [str(tmp_path / "train.json"), str(tmp_path / "val.json")],
+        [0.8, 0.2],
+        stratify=stratify,
+        seed=1,
+    )
+
+    train_file, val_file = create_subset_annotation_files(
+        annotation_file, subsets, num_workers=0
+    )
+
+    source = load(annotation_file)
+    train, val = load(train_file), load(val_file)
+    train_ids = [image["id"] for image in train["images"]]
+    val_ids = [image["id"] for image in val["images"]]
+    assert not set(train_ids) & set(val_ids)
+    assert sorted(train_ids + val_ids) == [image["id"] for image in source["images"]]
+    # the order of the source is kept
+    assert train_ids == sorted(train_ids)
+    assert abs(len(val_ids) - 40) <= 2
+    assert_consistent(train, source)
+    assert_consistent(val, source)
+
+
+def test_assign_parts__stratify():
+    annotation_dict = make_annotation_dict(2000)
+    split = SplitSpec((0.8, 0.2), stratify=True)
+
+    parts = assign_parts(annotation_dict, split)
+
+    image_index = {image["id"]: i for i, image in enumerate(annotation_dict["images"])}
+    for category in annotation_dict["categories"]:
+        images = {
+            image_index[ann["image_id"]]
+            for ann in annotation_dict["annotations"]
+            if ann["category_id"] == category["id"]
+        }
+        val = sum(parts[i] == 1 for i in images)
+        assert abs(val / len(images) - 0.2) < 0.03, category["name"]
+    assert np.array_equal(parts, assign_parts(annotation_dict, split))
+    assert not np.array_equal(
+        parts, assign_parts(annotation_dict, split._replace(seed=1))
+    )
+
+
+def test_k_fold(tmp_path, annotation_file):
+    subsets = k_fold_specs(
+        4,
+        str(tmp_path / "train_{fold}.json"),
+        str(tmp_path / "val_{fold}.json"),
+        stratify=True,
+    )
+
+    output_files = create_subset_annotation_files(
+        annotation_file, subsets, num_workers=0
+    )
+
+    assert output_files == [
+        str(tmp_path / f"{name}_{fold}.json")
+        for fold in range(4)
+        for name in ("train", "val")
+    ]
+    source = load(annotation_file)
+    all_ids = {image["id"] for image in source["images"]}
+    val_ids = []
+    for fold in range(4):
+        train = load(str(tmp_path / f"train_{fold}.json"))
+        val = load(str(tmp_path / f"val_{fold}.json"))
+        fold_val_ids = {image["id"] for image in val["images"]}
+        assert {image["id"] for image in train["images"]} == all_ids - fold_val_ids
+        assert abs(len(fold_val_ids) - 50) <= 2
+        val_ids += fold_val_ids
+        assert_consistent(val, source)
+    assert sorted(val_ids) == sorted(all_ids)
+
+
+def test_create_subset_annotation_files(tmp_path, annotation_file):
+    subsets = [
+        SubsetSpec(str(tmp_path / "all.json")),
+        SubsetSpec(str(tmp_path / "rare.json"), include_categories=["label4"]),
+        SubsetSpec(
+            str(tmp_path / "files.json"),
+            include_files=[f"{i}.jpg" for i in range(50)],
+            exclude_categories=["label0"],
+        ),
+        *random_split_specs(
+            [str(tmp_path / "rare_train.json"), str(tmp_path / "rare_val.json")],
+            [0.5, 0.5],
+            include_categories=["label4"],
+        ),
+    ]
+
+    with mock.patch.object(splits, "load_json", wraps=load_json) as json_load:
+        create_subset_annotation_files(annotation_file, subsets, num_workers=2)
+
+    assert json_load.call_count == 1
+    source = load(annotation_file)
+    assert load(str(tmp_path / "all.json")) == source
+    assert load(str(tmp_path / "rare.json")) == filter_annotation_dict(
+        source, include_categories=["label4"]
+    )
+    assert load(str(tmp_path / "files.json")) == filter_annotation_dict(
+        source,
+        include_files=[f"{i}.jpg" for i in range(50)],
+        exclude_categories=["label0"],
+    )
+    rare = load(str(tmp_path / "rare.json"))
+    train = load(str(tmp_path / "rare_train.json"))
+    val = load(str(tmp_path / "rare_val.json"))
+    assert len(train["images"]) + len(val["images"]) == len(rare["images"])
+    assert_consistent(train, rare)
+    assert_consistent(val, rare)
+    assert not splits._sources
+
+
+def test_invalid_specs(tmp_path):
+    with pytest.raises(ValueError):
+        random_split_specs(["train.json"], [0.8, 0.2])
+    with pytest.raises(ValueError):
+        k_fold_specs(1, "train_{fold}.json", "val_{fold}.json")
+    with pytest.raises(ValueError):
+        assign_parts(make_annotation_dict(10), SplitSpec((0.0, 0.0)))
@@ -0,0 +1,122 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from flextd.flexcoco.statistics import (
+    AREA_BINS,
+    get_annotation_dict_statistics,
+    get_annotation_file_statistics,
+)
+from flextd.flexcoco.store import convert_to_annotation_store
+from tests.flexcoco.helpers import SampleDataset
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+
+
+def make_annotation_dict(seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    images = [
+        {"id": i * 3, "file_name": f"{i}.jpg", "height": 100, "width": 100}
+        for i in range(50)
+    ]
+    categories = [{"id": i * 7 + 1, "name": f"label{i}"} for i in range(6)]
+    annotations = []
+    for ann_id in range(400):
+        annotations.append(
+            {
+                "id": ann_id,
+                "image_id": int(rng.integers(50)) * 3,
+                # the last category is unknown
+                "category_id": int(rng.integers(7)) * 7 + 1,
+                "area": float(rng.choice([100, 1024, 5000, 9216, 20000])),
+                "iscrowd": int(rng.random() < 0.2),
+                "bbox": [0, 0, 10, 10],
+                "segmentation": [[0, 0, 10, 0, 10, 10]],
+            }
+        )
+    # an annotation of an image that is not in the images list
+    annotations.append(dict(annotations[0], id=400, image_id=1))
+    return {"images": images, "annotations": annotations, "categories": categories}
+
+
+def reference_statistics(annotation_dict: dict) -> dict:
+    image_ids = {image["id"] for image in annotation_dict["images"]}
+    statistics = {}
+    for category in annotation_dict["categories"]:
+        anns = [
+            ann
+            for ann in annotation_dict["annotations"]
+            if ann["category_id"] == category["id"] and ann["image_id"] in image_ids
+        ]
+        histogram = [0] * (len(AREA_BINS) + 1)
+        for ann in anns:
+            histogram[sum(ann["area"] >= edge for edge in AREA_BINS)] += 1
+        statistics[category["name"]] = {
+            "id": category["id"],
+            "images": len({ann["image_id"] for ann in anns}),
+            "instances": len(anns),
+            "crowd_fraction": sum(ann["iscrowd"] for ann in anns) / max(len(anns), 1),
+            "area_histogram": histogram,
+        }
+    return statistics
+
+
+def test_get_annotation_dict_statistics():
+    annotation_dict = make_annotation_dict()
+
+    statistics = get_annotation_dict_statistics(annotation_dict).to_dict()
+
+    expected = reference_statistics(annotation_dict)
+    assert statistics["categories"].keys() == expected.keys()
+    for name, category in statistics["categories"].items():
+        crowd_fraction = category.pop("crowd_fraction")
+        assert crowd_fraction == pytest.approx(expected[name].pop("crowd_fraction"))
+        assert category == expected[name]
+    assert statistics["num_images"] == 50
+    assert statistics["num_annotations"] == sum(
+        category["instances"] for category in statistics["categories"].values()
+    )
+    assert statistics["area_bins"] == list(AREA_BINS)
+    json.dumps(statistics)
+
+
+@pytest.mark.parametrize("source", ["json", "streaming", "store"])
+def test_get_annotation_file_statistics(tmp_path, source):
+    annotation_dict = make_annotation_dict(1)
+    path = tmp_path / "annotations.json"
+    path.write_text(json.dumps(annotation_dict))
+    if source == "store":
+        path = convert_to_annotation_store(str(path), str(tmp_path / "store"))
+
+    statistics = get_annotation_file_statistics(
+        str(path), streaming=source == "streaming", chunk_size=256
+    )
+
+    expected = get_annotation_dict_statistics(annotation_dict)
+    assert statistics.to_dict() == expected.to_dict()
+
+
+def test_get_annotation_file_statistics__area_bins():
+    statistics = get_annotation_file_statistics(annotation_file, area_bins=())
+    assert statistics.area_histograms.shape == (4, 1)
+    assert np.array_equal(statistics.area_histograms[:, 0], statistics.instance_counts)
+
+
+@pytest.mark.parametrize("shared_index", [False, True])
+def test_dataset_statistics(tmp_path, shared_index):
+    annotation_dict = make_annotation_dict(2)
+    del annotation_dict["annotations"][-1]
+    path = tmp_path / "annotations.json"
+    path.write_text(json.dumps(annotation_dict))
+    dataset = SampleDataset(
+        image_dir="", annotation_file=str(path), shared_index=shared_index
+    )
+
+    statistics = dataset.get_dataset_statistics()
+
+    expected = get_annotation_dict_statistics(annotation_dict)
+    assert statistics.to_dict() == expected.to_dict()
+    assert dataset.get_statistics() == expected.image_counts_by_name()
@@ -0,0 +1,132 @@
+import gc
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+from pycocotools.coco import COCO
+
+from flextd.flexcoco.store import (
+    CocoAnnotationStore,
+    convert_to_annotation_store,
+    is_annotation_store,
+)
+from flextd.flexcoco.utils import filter_annotation_dict
+from tests.flexcoco.helpers import SampleDataset
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+STORE_FIELDS = ("id", "image_id", "category_id", "bbox", "area", "iscrowd")
+
+
+@pytest.fixture
+def coco():
+    return COCO(annotation_file)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return convert_to_annotation_store(annotation_file, str(tmp_path / "store"))
+
+
+@pytest.fixture
+def store(store_dir):
+    return CocoAnnotationStore.load(store_dir)
+
+
+def test_load__memory_mapped(store_dir, store):
+    assert is_annotation_store(store_dir)
+    assert not is_annotation_store(annotation_file)
+    assert isinstance(store.columns["ann_bbox"], np.memmap)
+    assert store.num_images == 3
+    assert store.num_annotations == 5
+
+
+def test_coco_api(coco, store):
+    assert store.getImgIds() == coco.getImgIds()
+    assert sorted(store.getImgIds(catIds=[4])) == sorted(coco.getImgIds(catIds=[4]))
+    assert store.getCatIds() == coco.getCatIds()
+    assert store.getCatIds(catNms=["label2"]) == coco.getCatIds(catNms=["label2"])
+    assert store.getAnnIds() == coco.getAnnIds()
+    assert store.getAnnIds(imgIds=[2, 3]) == coco.getAnnIds(imgIds=[2, 3])
+    assert store.getAnnIds(imgIds=2) == coco.getAnnIds(imgIds=2)
+    assert store.getAnnIds(catIds=[4], areaRng=[0, 10000]) == coco.getAnnIds(
+        catIds=[4], areaRng=[0, 10000]
+    )
+    assert store.loadCats(store.getCatIds()) == coco.loadCats(coco.getCatIds())
+    for image in store.loadImgs([3, 1]):
+        expected = coco.imgs[image["id"]]
+        assert image == {key: expected[key] for key in image}
+    assert dict(store.imgs)[2] == store.loadImgs(2)[0]
+
+    for ann in store.loadAnns(store.getAnnIds()):
+        expected = coco.anns[ann["id"]]
+        for key in STORE_FIELDS + ("segmentation",):
+            assert ann[key] == expected[key]
+        np.testing.assert_array_equal(store.annToMask(ann), coco.annToMask(expected))
+
+
+def test_load_unknown_id(store):
+    with pytest.raises(KeyError):
+        store.loadImgs(100)
+    with pytest.raises(KeyError):
+        store.loadAnns([1, 100])
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        dict(include_files=["000000000001.jpg", "000000000002.jpg"]),
+        dict(exclude_files=["000000000002.jpg"]),
+        dict(include_categories=["label1", "label4"], exclude_categories=["label1"]),
+        dict(exclude_files=["000000000003.jpg"], exclude_categories=["label3"]),
+    ],
+)
+def test_filter(store, filters):
+    expected = filter_annotation_dict(sample_coco, **filters)
+
+    filtered = store.filter(**filters)
+
+    assert filtered.getImgIds() == [image["id"] for image in expected["images"]]
+    assert filtered.loadCats(filtered.getCatIds()) == expected["categories"]
+    anns = filtered.loadAnns(filtered.getAnnIds())
+    assert [ann["id"] for ann in anns] == [ann["id"] for ann in expected["annotations"]]
+    assert filtered.loadImgs(filtered.getImgIds()) == [
+        store.loadImgs(image["id"])[0] for image in expected["images"]
+    ]
+
+
+def test_pickle(store, store_dir):
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored.store_dir == store_dir
+    assert restored.loadAnns([9]) == store.loadAnns([9])
+
+    in_memory = CocoAnnotationStore.from_dict(sample_coco)
+    restored = pickle.loads(pickle.dumps(in_memory))
+    assert restored.getAnnIds() == in_memory.getAnnIds()
+
+
+def test_dataset_from_store(store_dir):
+    dataset = SampleDataset(
+        image_dir="", annotation_file=store_dir, exclude_categories=["label2"]
+    )
+    assert isinstance(dataset.coco, CocoAnnotationStore)
+    assert len(dataset) == 3
+    assert dataset.get_categories() == ["label1", "label3", "label4"]
+    assert dataset.get_statistics() == {"label1": 1, "label3": 1, "label4": 2}
+
+
+def test_share(tmp_path):
+    shared = CocoAnnotationStore.from_dict(sample_coco).share(str(tmp_path))
+    store_dir = shared.store_dir
+
+    assert is_annotation_store(store_dir)
+    assert os.path.dirname(store_dir) == str(tmp_path)
+    assert pickle.loads(pickle.dumps(shared)).getAnnIds() == shared.getAnnIds()
+    del shared
+    gc.collect()
+    assert not os.path.exists(store_dir)
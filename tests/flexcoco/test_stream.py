@@ -0,0 +1,116 @@
+import io
+import json
+import os
+
+import pytest
+
+from flextd.flexcoco.stream import (
+    FilterCounts,
+    JsonStreamReader,
+    stream_filter_annotation_file,
+)
+from flextd.flexcoco.utils import create_filtered_annotation_file, filter_dataset
+
+DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+
+FILTERS = [
+    dict(include_files=["000000000001.jpg", "000000000002.jpg"]),
+    dict(exclude_files=["000000000003.jpg"]),
+    dict(include_categories=["label1", "label2", "label3"]),
+    dict(exclude_categories=["label3"]),
+    dict(
+        include_files=["000000000002.jpg", "000000000003.jpg"],
+        exclude_files=["000000000003.jpg"],
+        include_categories=["label1", "label4"],
+        exclude_categories=["label1"],
+    ),
+]
+
+
+def test_json_stream_reader():
+    document = '{"a": 1234567, "b": [ {"x": [1, 2]}, 3.5, "s" ], "c": [], "d": {}}'
+    reader = JsonStreamReader(io.StringIO(document), chunk_size=3)
+    result = {}
+    for key, value in reader.iter_items():
+        if key in ("b", "c"):
+            result[key] = list(value.iter_array())
+        else:
+            result[key] = value.read_value()
+    assert result == json.loads(document)
+
+
+def test_json_stream_reader__truncated_document():
+    reader = JsonStreamReader(io.StringIO('{"a": [1, 2'), chunk_size=4)
+    with pytest.raises(ValueError):
+        for key, value in reader.iter_items():
+            list(value.iter_array())
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("chunk_size", [5, 1 << 20])
+def test_stream_filter_annotation_file(tmp_path, filters, chunk_size):
+    new_annotation_file = str(tmp_path / "filtered.json")
+
+    result = stream_filter_annotation_file(
+        annotation_file, new_annotation_file, chunk_size=chunk_size, **filters
+    )
+
+    assert result == new_annotation_file
+    with open(new_annotation_file) as f:
+        assert json.load(f) == filter_dataset(annotation_file, **filters)
+
+
+def test_stream_filter_annotation_file__counts(tmp_path):
+    new_annotation_file = str(tmp_path / "filtered.json")
+    filters = dict(include_categories=["label2"], exclude_files=["000000000003.jpg"])
+
+    result, counts = stream_filter_annotation_file(
+        annotation_file, new_annotation_file, return_counts=True, **filters
+    )
+
+    assert result == new_annotation_file
+    expected = filter_dataset(annotation_file, **filters)
+    with open(annotation_file) as f:
+        source = json.load(f)
+    assert counts == FilterCounts(
+        len(source["images"]),
+        len(source["annotations"]),
+        len(expected["images"]),
+        len(expected["annotations"]),
+    )
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_stream_filter_annotation_file__categories_first(tmp_path, filters):
+    with open(annotation_file) as f:
+        sample_coco = json.load(f)
+    reordered_file = str(tmp_path / "reordered.json")
+    with open(reordered_file, "w") as f:
+        json.dump({"categories": sample_coco.pop("categories"), **sample_coco}, f)
+    new_annotation_file = str(tmp_path / "filtered.json")
+
+    stream_filter_annotation_file(reordered_file, new_annotation_file, **filters)
+
+    with open(new_annotation_file) as f:
+        assert json.load(f) == filter_dataset(reordered_file, **filters)
+
+
+def test_create_filtered_annotation_file__streaming(tmp_path):
+    new_annotation_file = str(tmp_path / "filtered.json")
+
+    result = create_filtered_annotation_file(
+        annotation_file,
+        new_annotation_file,
+        exclude_categories=["label3"],
+        streaming=True,
+    )
+
+    assert result == new_annotation_file
+    with open(new_annotation_file) as f:
+        assert json.load(f) == filter_dataset(
+            annotation_file, exclude_categories=["label3"]
+        )
+    assert create_filtered_annotation_file(annotation_file, streaming=True) == (
+        annotation_file
+    )
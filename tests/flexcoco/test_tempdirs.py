@@ -0,0 +1,34 @@
+import gc
+import os
+
+from flextd.flexcoco.tempdirs import (
+    _remove_temp_dir,
+    make_shared_temp_dir,
+    remove_when_collected,
+)
+
+
+class Owner:
+    pass
+
+
+def test_remove_when_collected(tmp_path):
+    path = make_shared_temp_dir("flextd-test-", str(tmp_path))
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith("flextd-test-")
+    owner = Owner()
+    remove_when_collected(owner, path)
+
+    assert os.path.isdir(path)
+    del owner
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_remove_temp_dir__other_process(tmp_path):
+    path = make_shared_temp_dir("flextd-test-", str(tmp_path))
+
+    _remove_temp_dir(path, os.getpid() + 1)
+    assert os.path.isdir(path)
+    _remove_temp_dir(path, os.getpid())
+    assert not os.path.exists(path)
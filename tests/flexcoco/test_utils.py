@@ -7,6 +7,7 @@ from flextd.flexcoco.utils import (
     filter_dicts_by_inclusion,
     filter_dicts_by_exclusion,
     filter_dataset,
+    filter_annotation_dict,
 )
 
 DATA_DIR = os.path.dirname(__file__).replace("flexcoco", "data")
@@ -357,3 +358,32 @@ def test_filter_dataset__include_exclude_categories():
     filtered_image_ids = [annotation["image_id"] for annotation in filtered_annotations]
     filtered_images = filter_dicts_by_inclusion(origin_images, "id", filtered_image_ids)
     assert filtered_ann["images"] == filtered_images
+
+
+def test_filter_annotation_dict__does_not_modify_source():
+    source = json.loads(json.dumps(sample_coco))
+
+    filtered_ann = filter_annotation_dict(
+        source,
+        exclude_files=["000000000003.jpg"],
+        include_categories=["label1", "label4"],
+    )
+
+    assert source == sample_coco
+    assert [image["id"] for image in filtered_ann["images"]] == [1, 2]
+    assert [annotation["id"] for annotation in filtered_ann["annotations"]] == [1, 10]
+    assert [category["name"] for category in filtered_ann["categories"]] == [
+        "label1",
+        "label4",
+    ]
+
+
+def test_filter_annotation_dict__same_as_filter_dataset():
+    kwargs = dict(
+        include_files=["000000000001.jpg", "000000000002.jpg", "000000000003.jpg"],
+        exclude_files=["000000000001.jpg"],
+        exclude_categories=["label3"],
+    )
+    assert filter_annotation_dict(sample_coco, **kwargs) == filter_dataset(
+        annotation_file, **kwargs
+    )
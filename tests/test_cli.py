@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from flextd.cli import (
+    FilterTask,
+    main,
+    make_filter_tasks,
+    run_filter_task,
+    run_filter_tasks,
+)
+from flextd.flexcoco.utils import filter_annotation_dict
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+annotation_file = str(os.path.join(DATA_DIR, "sample_coco.json"))
+with open(annotation_file, "r") as f:
+    sample_coco = json.load(f)
+
+
+@pytest.fixture
+def annotation_files(tmp_path):
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    paths = []
+    for name in ["a.json", "b.json", "c.json"]:
+        shutil.copy(annotation_file, input_dir / name)
+        paths.append(str(input_dir / name))
+    return paths
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("workers", ["0", "2"])
+def test_main__filter(annotation_files, tmp_path, workers, capsys):
+    output_dir = tmp_path / "outputs"
+    status = main(
+        ["filter", *annotation_files, "--exclude-categories", "label1"]
+        + ["--output-dir", str(output_dir), "--workers", workers]
+    )
+    assert status == 0
+    expected = filter_annotation_dict(sample_coco, exclude_categories=["label1"])
+    for name in ["a", "b", "c"]:
+        assert load(output_dir / f"{name}_filtered.json") == expected
+    assert sorted(os.listdir(output_dir)) == [
+        "a_filtered.json",
+        "b_filtered.json",
+        "c_filtered.json",
+    ]
+    assert "3 files written, 0 failed" in capsys.readouterr().out
+
+
+def test_main__specs_and_report(annotation_files, tmp_path):
+    specs = {
+        "label2": {"include_categories": ["label2"]},
+        "no_first": {"exclude_files": ["000000000001.jpg"]},
+    }
+    spec_files = []
+    for spec_name, spec in specs.items():
+        spec_file = tmp_path / f"{spec_name}.json"
+        spec_file.write_text(json.dumps(spec))
+        spec_files += ["--spec", str(spec_file)]
+    report_file = tmp_path / "report.json"
+    status = main(
+        ["filter", *annotation_files[:2], *spec_files, "--report", str(report_file)]
+    )
+    assert status == 0
+    for path in annotation_files[:2]:
+        stem = os.path.splitext(path)[0]
+        for spec_name, spec in specs.items():
+            assert load(f"{stem}_{spec_name}.json") == filter_annotation_dict(
+                sample_coco, **spec
+            )
+
+    report = load(report_file)
+    assert len(report) == 4
+    for result in report:
+        expected = load(result["output_file"])
+        assert result["error"] is None
+        assert result["seconds"] >= 0
+        assert result["input_images"] == len(sample_coco["images"])
+        assert result["input_annotations"] == len(sample_coco["annotations"])
+        assert result["images"] == len(expected["images"])
+        assert result["annotations"] == len(expected["annotations"])
+
+
+def test_main__streaming(annotation_files, tmp_path, capsys):
+    output_dir = tmp_path / "outputs"
+    report_file = tmp_path / "report.json"
+    status = main(
+        ["filter", annotation_files[0], "--include-files", "000000000002.jpg"]
+        + ["--output-dir", str(output_dir), "--streaming", "--report", str(report_file)]
+    )
+    assert status == 0
+    expected = filter_annotation_dict(sample_coco, include_files=["000000000002.jpg"])
+    assert load(output_dir / "a_filtered.json") == expected
+
+    [result] = load(report_file)
+    assert result["input_images"] == len(sample_coco["images"])
+    assert result["input_annotations"] == len(sample_coco["annotations"])
+    assert result["images"] == len(expected["images"])
+    assert result["annotations"] == len(expected["annotations"])
+    images = f"{len(expected['images'])}/{len(sample_coco['images'])}"
+    assert images in capsys.readouterr().out
+
+
+def test_main__failed_file(annotation_files, tmp_path, capsys):
+    broken_file = tmp_path / "inputs" / "broken.json"
+    broken_file.write_text("{")
+    status = main(
+        ["filter", annotation_files[0], str(broken_file)]
+        + ["--exclude-files", "000000000001.jpg", "--workers", "2"]
+    )
+    assert status == 1
+    assert sorted(os.listdir(tmp_path / "inputs")) == [
+        "a.json",
+        "a_filtered.json",
+        "b.json",
+        "broken.json",
+        "c.json",
+    ]
+    assert "1 files written, 1 failed" in capsys.readouterr().out
+
+
+def test_main__errors(annotation_files, tmp_path, capsys):
+    assert main(["filter", annotation_files[0]]) == 2
+    spec_file = tmp_path / "spec.json"
+    spec_file.write_text(json.dumps({"include_category": ["label1"]}))
+    assert main(["filter", annotation_files[0], "--spec", str(spec_file)]) == 2
+    assert "unknown keys" in capsys.readouterr().err
+    assert not os.path.exists(os.path.splitext(annotation_files[0])[0] + "_spec.json")
+
+
+def test_main__spec_errors(annotation_files, tmp_path, capsys):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    for spec_file in [tmp_path / "a" / "p.json", tmp_path / "b" / "p.json"]:
+        spec_file.write_text(json.dumps({"include_categories": ["label1"]}))
+    invalid_file = tmp_path / "invalid.json"
+    invalid_file.write_text("{")
+    string_file = tmp_path / "string.json"
+    string_file.write_text(json.dumps({"include_categories": "label1"}))
+
+    arguments = [
+        [
+            "--spec",
+            str(tmp_path / "a" / "p.json"),
+            "--spec",
+            str(tmp_path / "b/p.json"),
+        ],
+        ["--spec", str(tmp_path / "a" / "p.json"), "--name", "p"]
+        + ["--exclude-files", "000000000001.jpg"],
+        ["--spec", str(tmp_path / "missing.json")],
+        ["--spec", str(invalid_file)],
+        ["--spec", str(string_file)],
+    ]
+    messages = [
+        "several filter specs",
+        "also the name",
+        "missing.json",
+        "invalid json",
+        "include_categories must be null or a list of names",
+    ]
+    for argument, message in zip(arguments, messages):
+        assert main(["filter", annotation_files[0], *argument]) == 2
+        assert message in capsys.readouterr().err
+    assert sorted(os.listdir(os.path.dirname(annotation_files[0]))) == [
+        "a.json",
+        "b.json",
+        "c.json",
+    ]
+
+
+def test_run_filter_task__error(tmp_path):
+    output_file = str(tmp_path / "output.json")
+    task = FilterTask(str(tmp_path / "missing.json"), output_file, {})
+    result = run_filter_task(task)
+    assert result.error.startswith("FileNotFoundError")
+    assert result.images is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_run_filter_tasks(annotation_files, tmp_path):
+    tasks = make_filter_tasks(
+        annotation_files, {"f": {"exclude_categories": ["label3"]}}, str(tmp_path)
+    )
+    results = list(run_filter_tasks(tasks, num_workers=2))
+    assert sorted(result.output_file for result in results) == sorted(
+        task.output_file for task in tasks
+    )
+    assert all(result.error is None for result in results)
+
+
+def test_make_filter_tasks(tmp_path):
+    specs = {"x": {"include_files": ["a.jpg"]}, "y": {"exclude_files": ["a.jpg"]}}
+    tasks = make_filter_tasks(["d/a.json", "e/b.json"], specs)
+    assert [task.output_file for task in tasks] == [
+        os.path.join("d", "a_x.json"),
+        os.path.join("d", "a_y.json"),
+        os.path.join("e", "b_x.json"),
+        os.path.join("e", "b_y.json"),
+    ]
+    assert tasks[1].filters == {"exclude_files": ["a.jpg"]}
+    with pytest.raises(ValueError):
+        # both are written to out/a_x.json
+        make_filter_tasks(["d/a.json", "e/a.json"], specs, output_dir="out")
+    with pytest.raises(ValueError):
+        make_filter_tasks(["d/a.json", "d/a_x.json"], specs)
+
+
+def test_cli__without_heavy_imports():
+    script = (
+        "import sys, flextd.cli\n"
+        "print([m for m in ('torch', 'torchvision', 'pycocotools') if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"